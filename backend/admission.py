@@ -0,0 +1,305 @@
+"""
+Admission Module
+Request coalescing, rate limiting and cost budgets for model calls
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import REGISTRY
+
+ADMISSIONS = REGISTRY.counter(
+    'altme_draft_admissions_total', 'Draft generation admission decisions', ('result',)
+)
+INFLIGHT = REGISTRY.gauge('altme_draft_inflight', 'Draft generations currently running')
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; carries the Retry-After hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"{reason}; retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution
+
+    The first caller (the leader) runs the function; callers arriving while
+    it is in flight wait for and share its result or exception.
+    """
+
+    class _Call:
+        __slots__ = ('done', 'result', 'error', 'waiters')
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._calls: Dict[str, 'SingleFlight._Call'] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, function: Callable) -> Tuple[object, bool]:
+        """
+        Run `function` once for all concurrent callers with the same key
+
+        Returns:
+            tuple: (result, shared) where shared is True for coalesced callers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def inflight(self) -> int:
+        return len(self._calls)
+
+
+class TokenBucket:
+    """
+    Token bucket that can reserve future tokens
+
+    `reserve` either takes tokens now, or books them against the refill and
+    returns how long the caller must wait, or refuses when that wait would
+    exceed `max_wait`.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0, max_wait: float = 0.0) -> float:
+        """
+        Reserve `amount` tokens
+
+        Returns:
+            float: Seconds the caller must wait before proceeding
+
+        Raises:
+            AdmissionRejected: If the wait would exceed `max_wait`
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            deficit = amount - self._tokens
+            wait = deficit / self.rate if deficit > 0 else 0.0
+            if wait > max_wait:
+                raise AdmissionRejected('rate limited', wait)
+
+            self._tokens -= amount
+            return wait
+
+    def refund(self, amount: float = 1.0):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + amount)
+
+
+class CostBudget:
+    """Fixed-window spend limit (e.g. model tokens per hour)"""
+
+    def __init__(self, limit: float, window_seconds: float):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._window_start = time.monotonic()
+        self._spent = 0.0
+        self._lock = threading.Lock()
+
+    def charge(self, amount: float):
+        """
+        Spend `amount` from the current window
+
+        Raises:
+            AdmissionRejected: If the window's budget would be exceeded
+        """
+        if self.limit <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window_seconds:
+                self._window_start = now
+                self._spent = 0.0
+
+            if self._spent + amount > self.limit:
+                raise AdmissionRejected('cost budget exceeded', self._window_start + self.window_seconds - now)
+            self._spent += amount
+
+    def refund(self, amount: float):
+        with self._lock:
+            self._spent = max(0.0, self._spent - amount)
+
+    def remaining(self) -> float:
+        return max(0.0, self.limit - self._spent) if self.limit > 0 else float('inf')
+
+
+class AdmissionController:
+    """
+    Admission control for draft generation
+
+    A request must pass, in order: the per-user and global token buckets, the
+    per-user and global cost budgets, and a concurrency limit. Waiting is
+    bounded by `max_wait`; anything that cannot start within it is shed with
+    AdmissionRejected so the endpoint can answer 429 with Retry-After.
+    A limit of 0 disables that check.
+    """
+
+    MAX_TRACKED_USERS = 10000
+
+    def __init__(self, rate: float = 0.0, burst: float = 10.0,
+                 user_rate: float = 0.0, user_burst: float = 5.0,
+                 budget: float = 0.0, user_budget: float = 0.0, budget_window: float = 3600.0,
+                 max_concurrency: int = 0, max_wait: float = 2.0):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.user_budget = user_budget
+        self.budget_window = budget_window
+        self.max_wait = max_wait
+
+        self._bucket = TokenBucket(rate, burst)
+        self._budget = CostBudget(budget, budget_window)
+        # Per-user limits, least recently seen first
+        self._users: 'OrderedDict[str, Tuple[TokenBucket, CostBudget]]' = OrderedDict()
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'AdmissionController':
+        return cls(
+            rate=config.DRAFT_RATE_PER_SECOND,
+            burst=config.DRAFT_BURST,
+            user_rate=config.DRAFT_USER_RATE_PER_SECOND,
+            user_burst=config.DRAFT_USER_BURST,
+            budget=config.DRAFT_COST_BUDGET,
+            user_budget=config.DRAFT_USER_COST_BUDGET,
+            budget_window=config.DRAFT_COST_WINDOW_SECONDS,
+            max_concurrency=config.DRAFT_MAX_CONCURRENCY,
+            max_wait=config.DRAFT_MAX_WAIT_SECONDS
+        )
+
+    def _for_user(self, user_id: str) -> Tuple[TokenBucket, CostBudget]:
+        with self._lock:
+            limits = self._users.get(user_id)
+            if limits is not None:
+                self._users.move_to_end(user_id)
+                return limits
+            if len(self._users) >= self.MAX_TRACKED_USERS:
+                # Forget the least recently seen user rather than grow without bound
+                self._users.popitem(last=False)
+            limits = (TokenBucket(self.user_rate, self.user_burst), CostBudget(self.user_budget, self.budget_window))
+            self._users[user_id] = limits
+            return limits
+
+    @contextmanager
+    def admit(self, user_id: str, cost: float = 1.0):
+        """
+        Hold an admission slot for the duration of one generation
+
+        Raises:
+            AdmissionRejected: If the request must be shed
+        """
+        deadline = time.monotonic() + self.max_wait
+        user_bucket, user_budget = self._for_user(user_id)
+        reserved = []
+        charged = []
+
+        try:
+            wait = 0.0
+            for bucket in (user_bucket, self._bucket):
+                wait = max(wait, bucket.reserve(1, self.max_wait))
+                reserved.append(bucket)
+
+            for budget in (user_budget, self._budget):
+                budget.charge(cost)
+                charged.append(budget)
+
+            if wait > 0:
+                time.sleep(wait)
+
+            if self._slots is not None:
+                if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    raise AdmissionRejected('overloaded', self.max_wait)
+        except AdmissionRejected as e:
+            for bucket in reserved:
+                bucket.refund(1)
+            for budget in charged:
+                budget.refund(cost)
+            ADMISSIONS.labels(e.reason.replace(' ', '_')).inc()
+            raise
+
+        ADMISSIONS.labels('admitted').inc()
+        INFLIGHT.inc()
+        try:
+            yield
+        finally:
+            INFLIGHT.dec()
+            if self._slots is not None:
+                self._slots.release()
+
+    def status(self) -> Dict:
+        """Remaining global budget (None when unlimited) and users being tracked"""
+        remaining = self._budget.remaining()
+        return {
+            'global_budget_remaining': remaining if math.isfinite(remaining) else None,
+            'tracked_users': len(self._users)
+        }
+
+
+def draft_key(subject: str, body: str, sender: str, *extra) -> str:
+    """Stable key identifying identical draft requests"""
+    digest = hashlib.sha1()
+    for part in (subject, body, sender) + extra:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def estimate_cost(subject: str, body: str, max_tokens: int) -> int:
+    """
+    Estimated model tokens for one draft: prompt (~4 characters per token)
+    plus the completion limit
+    """
+    return (len(subject) + len(body)) // 4 + max_tokens
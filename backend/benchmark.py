@@ -0,0 +1,424 @@
+"""
+Benchmark Module
+Micro-benchmarks for the backend hot paths over a seeded synthetic mailbox
+
+Usage:
+    python benchmark.py --sizes 1000,10000 --output bench.json
+    python benchmark.py --sizes 1000 --baseline bench.json --threshold 0.10
+    python benchmark.py --compare old.json new.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from classifier import EmailClassifier
+from db import Database
+from email_client import EmailClient
+from mailstore import EmailStore
+from openai_client import OpenAIClient
+from similarity import SimilarityIndex
+
+
+# Category mix of a typical personal/work inbox (weights sum to 1.0)
+CATEGORY_WEIGHTS = {
+    'Promotional': 0.35,
+    'Social': 0.20,
+    'General': 0.20,
+    'Important': 0.15,
+    'Finance': 0.10
+}
+
+# Median body length in words and log-normal sigma for each category
+BODY_LENGTHS = {
+    'Promotional': (90, 0.6),
+    'Social': (35, 0.5),
+    'General': (70, 0.8),
+    'Important': (110, 0.7),
+    'Finance': (60, 0.5)
+}
+
+SENDERS = {
+    'Promotional': ['deals@{d}', 'offers@{d}', 'newsletter@{d}', 'marketing@{d}', 'promo@{d}'],
+    'Social': ['notifications@{d}', 'noreply@{d}', 'friends@{d}'],
+    'General': ['{u}@{d}', 'info@{d}', 'hello@{d}'],
+    'Important': ['manager@{d}', 'hr@{d}', 'client@{d}', 'team@{d}', 'director@{d}'],
+    'Finance': ['billing@{d}', 'support@{d}', 'accounts@{d}', 'statements@{d}']
+}
+
+DOMAINS = {
+    'Promotional': ['amazon.com', 'bestbuy.com', 'target.com', 'shop.example.com', 'techcrunch.com'],
+    'Social': ['linkedin.com', 'facebook.com', 'twitter.com', 'instagram.com'],
+    'General': ['gmail.com', 'outlook.com', 'yahoo.com', 'example.org'],
+    'Important': ['company.com', 'workplace.com', 'partner.com', 'client.io'],
+    'Finance': ['bankofamerica.com', 'paypal.com', 'chase.com', 'stripe.com']
+}
+
+SUBJECTS = {
+    'Promotional': ['{n}% OFF - Limited Time Offer', 'Exclusive deal just for you',
+                    'Clearance sale ends tonight', 'Your weekly newsletter', 'Free shipping on everything'],
+    'Social': ['You have {n} new connection requests', 'Someone tagged you in a photo',
+               'New activity on your post', '{n} people liked your update'],
+    'General': ['Quick question', 'Catching up', 'Notes from today', 'Re: weekend plans', 'Hello'],
+    'Important': ['Urgent: Project deadline on Friday', 'Meeting reschedule - please confirm',
+                  'Proposal review feedback', 'Action required: contract approval', 'Q{n} priorities'],
+    'Finance': ['Your monthly statement is ready', 'Payment receipt #{n}', 'Invoice {n} due',
+                'Account balance update', 'Transfer confirmation']
+}
+
+VOCABULARY = {
+    'Promotional': ['sale', 'discount', 'offer', 'shop now', 'exclusive', 'coupon', 'save',
+                    'products', 'limited', 'members', 'collection', 'unsubscribe'],
+    'Social': ['connection request', 'liked', 'commented', 'shared', 'follow', 'network',
+               'profile', 'activity', 'friends', 'photo'],
+    'General': ['hope', 'week', 'thanks', 'talk', 'later', 'weekend', 'idea', 'lunch',
+                'family', 'plans', 'maybe', 'soon'],
+    'Important': ['please', 'deadline', 'meeting', 'review', 'confirm', 'proposal', 'client',
+                  'need to', 'priority', 'feedback', 'timeline', 'deliverables'],
+    'Finance': ['statement', 'balance', 'transaction', 'payment', 'invoice', 'account',
+                'billing', 'credit', 'transfer', 'receipt']
+}
+
+FILLER = ['the', 'a', 'to', 'and', 'of', 'for', 'in', 'on', 'with', 'is', 'this', 'you',
+          'we', 'it', 'be', 'that', 'at', 'by', 'your', 'our', 'will', 'have']
+
+
+def generate_synthetic_emails(count: int = 1000, seed: int = 42) -> List[Dict]:
+    """
+    Generate `count` reproducible synthetic emails
+
+    Each email carries its generating category as `expected_category` so
+    benchmarks can use it as ground truth.
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORY_WEIGHTS)
+    weights = list(CATEGORY_WEIGHTS.values())
+    now = datetime.now()
+
+    return [
+        _generate_email(rng, index, rng.choices(categories, weights)[0], now)
+        for index in range(count)
+    ]
+
+
+def _generate_email(rng: random.Random, index: int, category: str, now: datetime) -> Dict:
+    """Generate one synthetic email of the given category"""
+    domain = rng.choice(DOMAINS[category])
+    user = f"user{rng.randint(1, 5000)}"
+    sender = rng.choice(SENDERS[category]).format(u=user, d=domain)
+    subject = rng.choice(SUBJECTS[category]).format(n=rng.randint(2, 90))
+
+    median, sigma = BODY_LENGTHS[category]
+    length = max(5, int(rng.lognormvariate(0, sigma) * median))
+    vocabulary = VOCABULARY[category]
+    words = [
+        rng.choice(vocabulary) if rng.random() < 0.2 else rng.choice(FILLER)
+        for _ in range(length)
+    ]
+    sentences = [' '.join(words[i:i + 12]).capitalize() + '.' for i in range(0, length, 12)]
+
+    return {
+        'id': f"email_{index + 1:07d}",
+        'sender': sender,
+        'subject': subject,
+        'body': ' '.join(sentences),
+        'timestamp': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+        'unread': rng.random() < 0.4,
+        'expected_category': category
+    }
+
+
+class SyntheticEmailClient(EmailClient):
+    """
+    EmailClient backed by a seeded synthetic mailbox
+    Scales the mock inbox from a handful of emails to millions with
+    realistic category mix and body length distributions
+    """
+
+    def __init__(self, count: int = 1000, seed: int = 42, compress_bodies: bool = False):
+        self.count = count
+        self.seed = seed
+        super().__init__(compress_bodies=compress_bodies)
+
+    def _generate_mock_emails(self):
+        """Generate `count` reproducible synthetic emails"""
+        return generate_synthetic_emails(self.count, self.seed)
+
+
+def _percentile(sorted_values: List[int], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def measure(name: str, items: List, operation: Callable, memory_sample: int = 1000) -> Dict:
+    """
+    Time `operation` over every item and sample its memory cost
+
+    Args:
+        name (str): Benchmark name
+        items (list): Inputs passed one at a time to `operation`
+        operation (callable): Function under test
+        memory_sample (int): Number of items used for the tracemalloc pass
+
+    Returns:
+        dict: ops/sec, latency percentiles (microseconds) and bytes per item
+    """
+    latencies = []
+    clock = time.perf_counter_ns
+
+    started = clock()
+    for item in items:
+        t0 = clock()
+        operation(item)
+        latencies.append(clock() - t0)
+    elapsed = (clock() - started) / 1e9
+
+    # Memory is measured in a separate pass: tracemalloc distorts timings
+    sample = items[:memory_sample]
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    peak_total = 0
+    for item in sample:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        operation(item)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - before
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    count = len(items)
+    return {
+        'name': name,
+        'count': count,
+        'seconds': round(elapsed, 6),
+        'ops_per_sec': round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        'mean_us': round(sum(latencies) / count / 1000, 3) if count else 0.0,
+        'p50_us': round(_percentile(latencies, 50) / 1000, 3),
+        'p99_us': round(_percentile(latencies, 99) / 1000, 3),
+        'peak_bytes_per_op': round(peak_total / len(sample), 1) if sample else 0.0,
+        'retained_bytes_per_item': round((retained - baseline) / len(sample), 1) if sample else 0.0
+    }
+
+
+def _traced_bytes(build: Callable) -> Tuple[object, int, float]:
+    """Build an object under tracemalloc; returns it, its net bytes and build time"""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, after - before, elapsed
+
+
+def measure_corpus(count: int, seed: int) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Measure resident bytes per email of the synthetic inbox held as plain
+    dicts and in the compact EmailStore (with and without body compression)
+
+    Returns:
+        tuple: (emails as dicts, corpus results)
+    """
+    emails, dict_bytes, dict_seconds = _traced_bytes(lambda: generate_synthetic_emails(count, seed))
+    results = [{
+        'name': 'corpus_dicts',
+        'count': count,
+        'seconds': round(dict_seconds, 6),
+        'bytes_per_email': round(dict_bytes / count, 1)
+    }]
+
+    # Stores are built from fresh copies so no string is shared with `emails`
+    for name, compress in (('corpus_compact', False), ('corpus_compressed', True)):
+        _, store_bytes, seconds = _traced_bytes(
+            lambda: SyntheticEmailClient(count, seed, compress_bodies=compress).store
+        )
+        results.append({
+            'name': name,
+            'count': count,
+            'seconds': round(seconds, 6),
+            'bytes_per_email': round(store_bytes / count, 1)
+        })
+
+    return emails, results
+
+
+def run_suite(count: int, seed: int = 42, lookups: int = 2000) -> Dict:
+    """
+    Run every micro-benchmark against a synthetic inbox of `count` emails
+
+    Returns:
+        dict: Benchmark results keyed by "<name>@<count>"
+    """
+    random.seed(seed)
+    emails, results = measure_corpus(count, seed)
+    classifier = EmailClassifier()
+    openai_client = OpenAIClient()
+    db = Database()
+
+    results.append(measure('classify', emails, lambda e: classifier.classify(e['subject'], e['body'])))
+    results.append(measure(
+        'classify_with_sender', emails, lambda e: classifier.classify(e['subject'], e['body'], e['sender'])
+    ))
+    results.append(measure('extract_action_items', emails, lambda e: classifier.extract_action_items(e['body'])))
+    results.append(measure(
+        'generate_reply', emails,
+        lambda e: openai_client.generate_reply(e['subject'], e['body'], e['sender'])
+    ))
+
+    actions = [
+        {'email_id': e['id'], 'classification': e['expected_category'], 'action': 'saved'}
+        for e in emails
+    ]
+    results.append(measure('save_action', actions, db.save_action))
+    batches = [actions[i:i + 500] for i in range(0, len(actions), 500)]
+    results.append(measure('save_actions_x500', batches, db.save_actions, memory_sample=5))
+    results.append(measure('analytics_summary', [None] * 20, lambda _: db.action_log.summary(), memory_sample=5))
+
+    rng = random.Random(seed)
+    action_ids = [f"action_{rng.randint(1, count):04d}" for _ in range(min(lookups, count))]
+    results.append(measure('get_action', action_ids, db.get_action, memory_sample=min(100, lookups)))
+
+    store = EmailStore()
+    store.extend(emails)
+    rows = list(range(len(store)))
+    results.append(measure('materialize', rows, store.to_dict))
+    results.append(measure('json_serialize', rows, lambda row: json.dumps(store.to_dict(row))))
+
+    similarity = SimilarityIndex(store)
+    results.append(measure(
+        'similarity_insert', rows, lambda row: similarity.add_email({'id': store.email_id(row)}), memory_sample=0
+    ))
+    email_ids = [store.email_id(rng.randrange(count)) for _ in range(min(lookups, count))]
+    results.append(measure('similar', email_ids, lambda email_id: similarity.similar(email_id, 10), memory_sample=100))
+
+    return {f"{r['name']}@{count}": r for r in results}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Flag benchmarks that regressed by more than `threshold` (fraction)
+
+    Throughput regresses when ops/sec drops, latency when p99 grows.
+
+    Returns:
+        list: One entry per regressed metric
+    """
+    regressions = []
+    base_results = baseline.get('results', {})
+
+    for key, result in current.get('results', {}).items():
+        base = base_results.get(key)
+        if not base:
+            continue
+
+        checks = [
+            ('ops_per_sec', -1),
+            ('p99_us', 1),
+            ('bytes_per_email', 1)
+        ]
+        for metric, direction in checks:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > threshold:
+                regressions.append({
+                    'benchmark': key,
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change': round(change, 4)
+                })
+
+    return regressions
+
+
+def _print_results(report: Dict):
+    """Print a human-readable summary of a benchmark report"""
+    for key, r in report['results'].items():
+        if 'ops_per_sec' in r:
+            print(f"{key:<32} {r['ops_per_sec']:>12,.0f} ops/s  p50 {r['p50_us']:>9.1f}us  "
+                  f"p99 {r['p99_us']:>9.1f}us  peak {r['peak_bytes_per_op']:>8.0f}B/op  "
+                  f"retained {r['retained_bytes_per_item']:>8.0f}B/item")
+        else:
+            print(f"{key:<32} {r['bytes_per_email']:>12,.0f} bytes/email  built in {r['seconds']:.2f}s")
+
+
+def _print_regressions(regressions: List[Dict]) -> int:
+    """Print regressions and return the process exit code"""
+    if not regressions:
+        print("No regressions detected")
+        return 0
+
+    print(f"{len(regressions)} regression(s) detected:")
+    for r in regressions:
+        print(f"  - {r['benchmark']} {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})")
+    return 1
+
+
+def _load(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Backend micro-benchmarks')
+    parser.add_argument('--sizes', default='1000', help='Comma-separated inbox sizes (e.g. 1000,100000)')
+    parser.add_argument('--seed', type=int, default=42, help='Synthetic corpus seed')
+    parser.add_argument('--lookups', type=int, default=2000, help='Number of get_action lookups')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare this run against a previous JSON report')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compare two existing JSON reports without running benchmarks')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Regression threshold as a fraction')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, current = (_load(path) for path in args.compare)
+        return _print_regressions(compare(baseline, current, args.threshold))
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'sizes': sizes
+        },
+        'results': {}
+    }
+
+    for size in sizes:
+        report['results'].update(run_suite(size, args.seed, args.lookups))
+
+    _print_results(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.baseline:
+        return _print_regressions(compare(_load(args.baseline), report, args.threshold))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Changes Module
+Sequence-numbered feed of inbox changes for push updates to clients
+"""
+
+import threading
+from collections import deque
+from typing import List, Tuple
+
+# Change operations
+EMAIL_ADDED = 'added'
+EMAIL_UPDATED = 'updated'
+EMAIL_REMOVED = 'removed'
+
+
+class ChangeFeed:
+    """
+    Bounded log of (sequence, operation, email id) entries
+
+    Sequence numbers increase by one per change. Clients remember the last
+    sequence they applied and ask for everything after it; if they fall
+    further behind than the log retains, `since` tells them to reload.
+    Entries hold only ids: the email itself is read from the store when the
+    change is delivered, so a burst of edits to one email costs one payload.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self._entries = deque(maxlen=capacity)
+        self._sequence = 0
+        self._cond = threading.Condition()
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the latest change (0 before any change)"""
+        return self._sequence
+
+    def publish(self, operation: str, email_id: str) -> int:
+        """
+        Record a change and wake any waiting clients
+
+        Returns:
+            int: The change's sequence number
+        """
+        with self._cond:
+            self._sequence += 1
+            self._entries.append((self._sequence, operation, email_id))
+            self._cond.notify_all()
+            return self._sequence
+
+    def since(self, sequence: int, limit: int = 1000) -> Tuple[List[Tuple[int, str, str]], int, bool]:
+        """
+        Changes after `sequence`, oldest first
+
+        Returns:
+            tuple: (changes, latest sequence included, reset) where reset is
+            True when changes after `sequence` have already been discarded,
+            or `sequence` is ahead of this feed (it was issued before a restart)
+        """
+        with self._cond:
+            return self._since(sequence, limit)
+
+    def wait(self, sequence: int, timeout: float, limit: int = 1000) -> Tuple[List[Tuple[int, str, str]], int, bool]:
+        """Like `since`, but block up to `timeout` seconds until there is a change"""
+        with self._cond:
+            # A cursor ahead of the feed is answered at once, with a reset
+            self._cond.wait_for(lambda: self._sequence != sequence, timeout)
+            return self._since(sequence, limit)
+
+    def _since(self, sequence: int, limit: int):
+        if sequence > self._sequence:
+            return [], self._sequence, True
+        if sequence == self._sequence:
+            return [], self._sequence, False
+
+        oldest = self._entries[0][0] if self._entries else self._sequence + 1
+        if sequence < oldest - 1:
+            return [], self._sequence, True
+
+        # Entries are consecutive, so the first wanted one is found by offset
+        start = sequence - oldest + 1
+        changes = [self._entries[i] for i in range(start, min(start + limit, len(self._entries)))]
+        return changes, changes[-1][0], False
+
+
+def compact(changes: List[Tuple[int, str, str]]) -> List[Tuple[int, str, str]]:
+    """
+    Keep only the latest change per email, in sequence order
+
+    An email added and then updated within the batch is still reported as
+    added, since the client has never seen it.
+    """
+    latest = {}
+    for change in changes:
+        previous = latest.get(change[2])
+        if previous is not None and previous[1] == EMAIL_ADDED and change[1] == EMAIL_UPDATED:
+            change = (change[0], EMAIL_ADDED, change[2])
+        latest[change[2]] = change
+    return sorted(latest.values())
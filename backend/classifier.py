@@ -4,8 +4,29 @@ Rule-based email classification system
 Future: Enhance with ML models (Naive Bayes, SVM, or Transformers)
 """
 
+import random
 import re
-from typing import Dict, List
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY
+from profiler import PROFILER
+from rules import DEFAULT_RULES_PATH, RuleStore
+from senders import SenderTrie
+
+CLASSIFY_SECONDS = REGISTRY.histogram(
+    'altme_classify_duration_seconds', 'Time spent in EmailClassifier.classify'
+)
+CLASSIFICATIONS = REGISTRY.counter(
+    'altme_classifications_total', 'Classified emails by category', ('category',)
+)
+SENDER_FAST_PATH = REGISTRY.counter(
+    'altme_classifier_sender_fast_path_total',
+    'Sender fast-path lookups (hit/miss) and sampled full-scan checks (agree/disagree)', ('result',)
+)
+FAST_PATH_HIT = SENDER_FAST_PATH.labels('hit')
+FAST_PATH_MISS = SENDER_FAST_PATH.labels('miss')
 
 
 class EmailClassifier:
@@ -14,112 +35,197 @@ class EmailClassifier:
     Categorizes emails into: Important, Promotional, Social, or General
     """
 
-    def __init__(self):
-        # Define keyword patterns for each category
-        self.patterns = {
-            'Important': {
-                'keywords': [
-                    'urgent', 'deadline', 'action required', 'important',
-                    'asap', 'critical', 'priority', 'immediately',
-                    'meeting', 'reschedule', 'confirm', 'approval',
-                    'review', 'feedback', 'proposal', 'contract'
-                ],
-                'senders': [
-                    'manager', 'ceo', 'director', 'hr', 'admin',
-                    'team', 'client', 'partner'
-                ]
-            },
-            'Promotional': {
-                'keywords': [
-                    'sale', 'offer', 'discount', 'deal', 'promotion',
-                    'limited time', 'free', 'save', 'shop now',
-                    'exclusive', 'clearance', 'bargain', 'coupon',
-                    'subscribe', 'unsubscribe'
-                ],
-                'senders': [
-                    'deals', 'marketing', 'newsletter', 'promo',
-                    'offers', 'sales'
-                ]
-            },
-            'Social': {
-                'keywords': [
-                    'connection request', 'tagged you', 'liked',
-                    'commented', 'shared', 'follow', 'friend request',
-                    'notification', 'activity'
-                ],
-                'senders': [
-                    'facebook', 'twitter', 'linkedin', 'instagram',
-                    'notifications', 'noreply'
-                ]
-            },
-            'Finance': {
-                'keywords': [
-                    'statement', 'balance', 'transaction', 'payment',
-                    'invoice', 'receipt', 'billing', 'account',
-                    'credit', 'debit', 'transfer'
-                ],
-                'senders': [
-                    'bank', 'paypal', 'support', 'billing',
-                    'finance', 'accounts'
-                ]
-            }
-        }
+    # A user confirming a category counts as this many classifier results
+    CONFIRMED_WEIGHT = 5.0
+
+    # Emails remembered as already learned from, so re-classifying one does not count it again
+    MAX_LEARNED_EMAILS = 100000
 
-    def classify(self, subject: str, body: str) -> Dict:
+    def __init__(self, rules_path: str = DEFAULT_RULES_PATH, watch_rules: bool = False,
+                 reload_interval: float = 5.0, sender_fast_path: bool = True,
+                 sender_min_support: float = 20, sender_min_share: float = 0.95,
+                 sender_sample_rate: float = 0.02):
+        """
+        Initialize the classifier
+
+        Args:
+            rules_path (str): Versioned JSON file with keyword and sender patterns
+            watch_rules (bool): Reload the rules in the background when the file changes
+            reload_interval (float): Seconds between checks of the rules file
+            sender_fast_path (bool): Classify well-known senders from their history alone
+            sender_min_support (float): Observations a sender needs before the fast path trusts it
+            sender_min_share (float): Share of those observations that must agree
+            sender_sample_rate (float): Fraction of fast-path hits re-checked with a full scan
+        """
+        self.rules = RuleStore(rules_path, watch=watch_rules, interval=reload_interval)
+        self.senders = SenderTrie(sender_min_support, sender_min_share) if sender_fast_path else None
+        self.sender_sample_rate = sender_sample_rate
+        self._learned: 'OrderedDict[int, None]' = OrderedDict()
+        self._fast_path_counts = dict.fromkeys(('lookups', 'hits', 'sampled', 'disagreements'), 0)
+
+    @property
+    def patterns(self) -> Dict:
+        """Keyword and sender patterns of the live ruleset"""
+        return self.rules.current.patterns
+
+    def classify(self, subject: str, body: str, sender: Optional[str] = None, learn: bool = True) -> Dict:
         """
         Classify an email based on subject and body
 
+        When the sender is given and its history is conclusive, the category
+        comes from the learned sender statistics without scanning the content;
+        otherwise the content is scanned and, with `learn`, the result is
+        recorded for the sender once per distinct email.
+
         Args:
             subject (str): Email subject line
             body (str): Email body content
+            sender (str): Sender address, if known
+            learn (bool): Record the result in the sender history (pass False
+                for content that is not the user's own mail)
 
         Returns:
-            dict: Classification result with category, confidence, and matched keywords
+            dict: Classification result with category, confidence, matched keywords,
+            the version of the ruleset that produced it and whether the sender
+            fast path was used
+        """
+        started = time.perf_counter()
+        counts = self._fast_path_counts
+
+        if sender and self.senders is not None:
+            counts['lookups'] += 1
+            hit = self.senders.lookup(sender)
+            if hit is not None:
+                category, share, _ = hit
+                counts['hits'] += 1
+                FAST_PATH_HIT.inc()
+
+                if random.random() < self.sender_sample_rate:
+                    # Audit a sample against the content, and keep learning from it
+                    scanned = self._scan(subject, body, sender)
+                    agree = scanned['category'] == category
+                    counts['sampled'] += 1
+                    counts['disagreements'] += not agree
+                    SENDER_FAST_PATH.labels('agree' if agree else 'disagree').inc()
+                    if learn:
+                        self._learn_once(sender, subject, body, scanned['category'])
+
+                CLASSIFY_SECONDS.observe(time.perf_counter() - started)
+                CLASSIFICATIONS.labels(category).inc()
+                return {
+                    'category': category,
+                    'confidence': share,
+                    'keywords': [],
+                    'scores': {},
+                    'rule_version': self.rules.current.version,
+                    'fast_path': True
+                }
+            FAST_PATH_MISS.inc()
+
+        result = self._scan(subject, body, sender)
+        if learn and sender and self.senders is not None:
+            self._learn_once(sender, subject, body, result['category'])
+
+        CLASSIFY_SECONDS.observe(time.perf_counter() - started)
+        CLASSIFICATIONS.labels(result['category']).inc()
+        return result
+
+    def scan(self, subject: str, body: str, sender: Optional[str] = None) -> Dict:
         """
-        # Combine subject and body for analysis
-        text = f"{subject} {body}".lower()
+        Classify from content alone, without side effects
 
-        # Score each category
-        scores = {}
-        matched_keywords = {}
+        Unlike `classify`, this neither consults nor updates the sender
+        history and records no metrics, so it can evaluate a ruleset (for
+        example a shadow candidate) without disturbing the live one.
+        """
+        return self._scan(subject, body, sender)
 
-        for category, patterns in self.patterns.items():
-            score = 0
-            keywords_found = []
+    def _scan(self, subject: str, body: str, sender: Optional[str] = None) -> Dict:
+        """Full keyword and sender-pattern scan of an email's content"""
+        # One read of the live ruleset: a concurrent reload cannot change the
+        # rules halfway through this classification
+        ruleset = self.rules.current
 
-            # Check for keyword matches
-            for keyword in patterns['keywords']:
-                if keyword.lower() in text:
-                    score += 2
-                    keywords_found.append(keyword)
+        # Combine subject, body and (when known) the sender address for analysis
+        text = f"{subject} {body} {sender}".lower() if sender else f"{subject} {body}".lower()
 
-            # Check for sender patterns (if sender info in subject/body)
-            for sender_pattern in patterns['senders']:
-                if sender_pattern.lower() in text:
-                    score += 1
+        # Score each category
+        points = [0] * len(ruleset.categories)
+        matched = [[] for _ in ruleset.categories]
+
+        with PROFILER.span('classify.score'):
+            # Keywords and sender patterns
+            for term, hits in ruleset.terms:
+                if term in text:
+                    for index, weight, keyword in hits:
+                        points[index] += weight
+                        if keyword is not None:
+                            matched[index].append(keyword)
 
-            scores[category] = score
-            matched_keywords[category] = keywords_found
+        scores = dict(zip(ruleset.categories, points))
 
         # Determine the category with highest score
-        if max(scores.values()) == 0:
-            category = 'General'
-            confidence = 0.5
+        if max(points) == 0:
+            category = ruleset.default_category
+            confidence = ruleset.default_confidence
             keywords = []
         else:
-            category = max(scores, key=scores.get)
-            max_score = scores[category]
-            total_score = sum(scores.values())
-            confidence = round(max_score / total_score, 2) if total_score > 0 else 0.5
-            keywords = matched_keywords[category]
+            best = points.index(max(points))
+            category = ruleset.categories[best]
+            total_score = sum(points)
+            confidence = round(points[best] / total_score, 2) if total_score > 0 else ruleset.default_confidence
+            keywords = matched[best]
 
         return {
             'category': category,
             'confidence': confidence,
             'keywords': keywords,
-            'scores': scores
+            'scores': scores,
+            'rule_version': ruleset.version,
+            'fast_path': False
         }
 
+    def _learn_once(self, sender: str, subject: str, body: str, category: str):
+        """Record a classifier result unless this email was already learned from"""
+        key = hash((sender, subject, body))
+        learned = self._learned
+        with self.senders.lock:
+            if key in learned:
+                return
+            learned[key] = None
+            if len(learned) > self.MAX_LEARNED_EMAILS:
+                learned.popitem(last=False)
+        self.senders.learn(sender, category)
+
+    def learn_sender(self, sender: str, category: str, confirmed: bool = True) -> bool:
+        """
+        Record a category for a sender outside of classification
+
+        Args:
+            sender (str): Sender address
+            category (str): Category the email belongs to
+            confirmed (bool): The user confirmed it (weighted above classifier results)
+
+        Returns:
+            bool: Whether it was recorded
+        """
+        if self.senders is None:
+            return False
+        return self.senders.learn(sender, category, self.CONFIRMED_WEIGHT if confirmed else 1.0)
+
+    def sender_stats(self) -> Dict:
+        """Fast-path hit ratio and sampled disagreement rate"""
+        counts = dict(self._fast_path_counts)
+        counts['hit_ratio'] = round(counts['hits'] / counts['lookups'], 4) if counts['lookups'] else None
+        counts['disagreement_rate'] = (
+            round(counts['disagreements'] / counts['sampled'], 4) if counts['sampled'] else None
+        )
+        counts['enabled'] = self.senders is not None
+        if self.senders is not None:
+            counts['senders_learned'] = self.senders.senders
+            counts['trie_nodes'] = self.senders.nodes
+        return counts
+
     def extract_action_items(self, body: str) -> List[str]:
         """
         Extract potential action items from email body
@@ -4,63 +4,185 @@ Application settings and environment variables
 """
 
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-
-class Config:
-    """Application configuration"""
-
-    # Flask settings
-    ENV = os.getenv('FLASK_ENV', 'development')
-    DEBUG = os.getenv('FLASK_DEBUG', 'True') == 'True'
-    SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-
-    # API Keys
-    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
-    GMAIL_API_CREDENTIALS = os.getenv('GMAIL_API_CREDENTIALS', '')
-
-    # Database settings
-    MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
-    DATABASE_NAME = os.getenv('DATABASE_NAME', 'email_assistant_db')
+from typing import Optional
 
-    # Email settings
-    EMAIL_FETCH_LIMIT = int(os.getenv('EMAIL_FETCH_LIMIT', '10'))
-    AUTO_CLASSIFY = os.getenv('AUTO_CLASSIFY', 'True') == 'True'
-
-    # AI settings
-    AI_MODEL = os.getenv('AI_MODEL', 'gpt-3.5-turbo')
-    MAX_TOKENS = int(os.getenv('MAX_TOKENS', '150'))
-    TEMPERATURE = float(os.getenv('TEMPERATURE', '0.7'))
-
-    # Security
-    CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
-
-    # Logging
-    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-
-    @staticmethod
-    def validate():
-        """Validate configuration"""
-        warnings = []
-
-        if Config.ENV == 'production':
-            if Config.SECRET_KEY == 'dev-secret-key-change-in-production':
-                warnings.append('WARNING: Using default SECRET_KEY in production!')
-
-            if not Config.OPENAI_API_KEY:
-                warnings.append('WARNING: OPENAI_API_KEY not set!')
+from dotenv import load_dotenv
 
-            if not Config.GMAIL_API_CREDENTIALS:
-                warnings.append('WARNING: GMAIL_API_CREDENTIALS not set!')
 
-        return warnings
+def load_config(env_file: Optional[str] = None) -> type:
+    """
+    Read the application settings from the environment
+
+    The .env file (`env_file`, or the first one found from the working
+    directory) is loaded first without overriding variables that are
+    already set, so settings reflect the environment when the app is
+    created rather than when this module was imported.
+
+    Args:
+        env_file (str): Path of the .env file to load
+
+    Returns:
+        type: Config class for create_app()
+    """
+    load_dotenv(env_file)
+
+    class Config:
+        """Application configuration"""
+
+        # Flask settings
+        ENV = os.getenv('FLASK_ENV', 'development')
+        DEBUG = os.getenv('FLASK_DEBUG', 'True') == 'True'
+        SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+
+        # API Keys
+        OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+        GMAIL_API_CREDENTIALS = os.getenv('GMAIL_API_CREDENTIALS', '')
+
+        # Database settings
+        MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
+        DATABASE_NAME = os.getenv('DATABASE_NAME', 'email_assistant_db')
+
+        # Email settings
+        EMAIL_FETCH_LIMIT = int(os.getenv('EMAIL_FETCH_LIMIT', '10'))
+        AUTO_CLASSIFY = os.getenv('AUTO_CLASSIFY', 'True') == 'True'
+        EMAIL_COMPRESS_BODIES = os.getenv('EMAIL_COMPRESS_BODIES', 'False') == 'True'
+        EMAIL_CHANGE_FEED_CAPACITY = int(os.getenv('EMAIL_CHANGE_FEED_CAPACITY', '10000'))
+        EMAIL_CHANGE_KEEPALIVE_SECONDS = float(os.getenv('EMAIL_CHANGE_KEEPALIVE_SECONDS', '15'))
+
+        # Classifier rules (hot-reloaded when the file changes)
+        CLASSIFIER_RULES_PATH = os.getenv(
+            'CLASSIFIER_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+        )
+        CLASSIFIER_RULES_WATCH = os.getenv('CLASSIFIER_RULES_WATCH', 'True') == 'True'
+        CLASSIFIER_RULES_RELOAD_SECONDS = float(os.getenv('CLASSIFIER_RULES_RELOAD_SECONDS', '5'))
+
+        # Classifier sender fast path (learned sender -> category history)
+        CLASSIFIER_SENDER_FAST_PATH = os.getenv('CLASSIFIER_SENDER_FAST_PATH', 'True') == 'True'
+        CLASSIFIER_SENDER_MIN_SUPPORT = float(os.getenv('CLASSIFIER_SENDER_MIN_SUPPORT', '20'))
+        CLASSIFIER_SENDER_MIN_SHARE = float(os.getenv('CLASSIFIER_SENDER_MIN_SHARE', '0.95'))
+        CLASSIFIER_SENDER_SAMPLE_RATE = float(os.getenv('CLASSIFIER_SENDER_SAMPLE_RATE', '0.02'))
+
+        # Shadow evaluation of a candidate ruleset on sampled /classify traffic
+        SHADOW_ENABLED = os.getenv('SHADOW_ENABLED', 'True') == 'True'
+        SHADOW_RULES_PATH = os.getenv('SHADOW_RULES_PATH', '')   # unset: no candidate, shadowing off
+        SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', '0.05'))
+        SHADOW_MAX_QUEUED = int(os.getenv('SHADOW_MAX_QUEUED', '1000'))
+
+        # AI settings
+        AI_MODEL = os.getenv('AI_MODEL', 'gpt-3.5-turbo')
+        MAX_TOKENS = int(os.getenv('MAX_TOKENS', '150'))
+        TEMPERATURE = float(os.getenv('TEMPERATURE', '0.7'))
+        AI_CONTEXT_TOKENS = int(os.getenv('AI_CONTEXT_TOKENS', '4096'))   # model context window
+
+        # Draft prompt construction (input token budget and context packing)
+        PROMPT_MAX_INPUT_TOKENS = int(os.getenv('PROMPT_MAX_INPUT_TOKENS', '1500'))
+        PROMPT_MAX_THREAD_MESSAGES = int(os.getenv('PROMPT_MAX_THREAD_MESSAGES', '5'))
+        PROMPT_MAX_MESSAGE_TOKENS = int(os.getenv('PROMPT_MAX_MESSAGE_TOKENS', '200'))
+        PROMPT_MAX_EXAMPLES = int(os.getenv('PROMPT_MAX_EXAMPLES', '3'))
+        PROMPT_MAX_EXAMPLE_TOKENS = int(os.getenv('PROMPT_MAX_EXAMPLE_TOKENS', '120'))
+
+        # Draft generation admission control (0 disables a limit)
+        DRAFT_RATE_PER_SECOND = float(os.getenv('DRAFT_RATE_PER_SECOND', '20'))
+        DRAFT_BURST = float(os.getenv('DRAFT_BURST', '40'))
+        DRAFT_USER_RATE_PER_SECOND = float(os.getenv('DRAFT_USER_RATE_PER_SECOND', '0'))
+        DRAFT_USER_BURST = float(os.getenv('DRAFT_USER_BURST', '10'))
+        DRAFT_COST_BUDGET = float(os.getenv('DRAFT_COST_BUDGET', '0'))             # tokens per window
+        DRAFT_USER_COST_BUDGET = float(os.getenv('DRAFT_USER_COST_BUDGET', '0'))   # tokens per window
+        DRAFT_COST_WINDOW_SECONDS = float(os.getenv('DRAFT_COST_WINDOW_SECONDS', '3600'))
+        DRAFT_MAX_CONCURRENCY = int(os.getenv('DRAFT_MAX_CONCURRENCY', '8'))
+        DRAFT_MAX_WAIT_SECONDS = float(os.getenv('DRAFT_MAX_WAIT_SECONDS', '2'))
+
+        # Batch draft generation
+        DRAFT_BATCH_MAX_SIZE = int(os.getenv('DRAFT_BATCH_MAX_SIZE', '200'))
+        DRAFT_BATCH_CONCURRENCY = int(os.getenv('DRAFT_BATCH_CONCURRENCY', '8'))
+        DRAFT_BATCH_SKIP_CATEGORIES = os.getenv('DRAFT_BATCH_SKIP_CATEGORIES', 'Promotional,Social').split(',')
+
+        # Bulk action saving
+        SAVE_BATCH_MAX_ITEMS = int(os.getenv('SAVE_BATCH_MAX_ITEMS', '10000'))
+
+        # Action retention (0 disables a limit); older raw actions are rolled up per day
+        ACTION_RETENTION_DAYS = float(os.getenv('ACTION_RETENTION_DAYS', '30'))
+        ACTION_MAX_RAW = int(os.getenv('ACTION_MAX_RAW', '200000'))
+        ACTION_MAX_RAW_MB = float(os.getenv('ACTION_MAX_RAW_MB', '256'))
+        ACTION_LOG_RETENTION_DAYS = float(os.getenv('ACTION_LOG_RETENTION_DAYS', '365'))
+        ACTION_LOG_MAX_ROWS = int(os.getenv('ACTION_LOG_MAX_ROWS', '20000000'))
+        ACTION_RETENTION_STEP = int(os.getenv('ACTION_RETENTION_STEP', '1000'))
+        ACTION_RETENTION_INTERVAL_SECONDS = float(os.getenv('ACTION_RETENTION_INTERVAL_SECONDS', '5'))
+
+        # Similar-email search (token cache bounded by memory)
+        SIMILARITY_CACHE_MB = float(os.getenv('SIMILARITY_CACHE_MB', '64'))
+
+        # Speculative draft prefetching for high-priority mail
+        PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'True') == 'True'
+        PREFETCH_CATEGORIES = os.getenv('PREFETCH_CATEGORIES', 'Important').split(',')
+        PREFETCH_MIN_CONFIDENCE = float(os.getenv('PREFETCH_MIN_CONFIDENCE', '0.6'))
+        PREFETCH_MAX_CONCURRENCY = int(os.getenv('PREFETCH_MAX_CONCURRENCY', '1'))
+        PREFETCH_COST_BUDGET = float(os.getenv('PREFETCH_COST_BUDGET', '20000'))   # tokens per window
+        PREFETCH_IDLE_SECONDS = float(os.getenv('PREFETCH_IDLE_SECONDS', '2'))
+        PREFETCH_TTL_SECONDS = float(os.getenv('PREFETCH_TTL_SECONDS', '3600'))
+        PREFETCH_MAX_ENTRIES = int(os.getenv('PREFETCH_MAX_ENTRIES', '500'))
+        PREFETCH_SCAN_LIMIT = int(os.getenv('PREFETCH_SCAN_LIMIT', '100'))
+
+        # Digest mode: low-priority mail summarized once per window
+        DIGEST_ENABLED = os.getenv('DIGEST_ENABLED', 'True') == 'True'
+        DIGEST_CATEGORIES = os.getenv('DIGEST_CATEGORIES', 'Promotional,Social').split(',')
+        DIGEST_MIN_CONFIDENCE = float(os.getenv('DIGEST_MIN_CONFIDENCE', '0.5'))
+        DIGEST_WINDOW_SECONDS = float(os.getenv('DIGEST_WINDOW_SECONDS', '14400'))
+        DIGEST_MAX_ITEMS = int(os.getenv('DIGEST_MAX_ITEMS', '500'))
+        DIGEST_SCHEDULE = os.getenv('DIGEST_SCHEDULE', 'window')   # window or working_hours
+        DIGEST_USER_ID = os.getenv('DIGEST_USER_ID', 'anonymous')  # whose working_hours apply
+        DIGEST_SCAN_LIMIT = int(os.getenv('DIGEST_SCAN_LIMIT', '200'))
+
+        # Security
+        CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
+
+        # Logging
+        LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+        # Profiling (opt-in; /debug/profile is only served when enabled)
+        PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'False') == 'True'
+        PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.0'))
+        PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+        PROFILE_DEBUG_HEADER = os.getenv('PROFILE_DEBUG_HEADER', 'X-Debug-Profile')
+
+        @staticmethod
+        def validate():
+            """Validate configuration"""
+            warnings = []
+
+            if Config.ENV == 'production':
+                if Config.SECRET_KEY == 'dev-secret-key-change-in-production':
+                    warnings.append('WARNING: Using default SECRET_KEY in production!')
+
+                if not Config.OPENAI_API_KEY:
+                    warnings.append('WARNING: OPENAI_API_KEY not set!')
+
+                if not Config.GMAIL_API_CREDENTIALS:
+                    warnings.append('WARNING: GMAIL_API_CREDENTIALS not set!')
+
+            return warnings
+
+    return Config
+
+
+class ConfigView:
+    """Attribute access to a Flask app.config, as the from_config() constructors expect"""
+
+    __slots__ = ('_config',)
+
+    def __init__(self, config):
+        self._config = config
+
+    def __getattr__(self, name: str):
+        try:
+            return self._config[name]
+        except KeyError:
+            raise AttributeError(name) from None
 
 
 # Example usage
 if __name__ == '__main__':
+    Config = load_config()
     print("Configuration loaded:")
     print(f"  Environment: {Config.ENV}")
     print(f"  Debug: {Config.DEBUG}")
@@ -4,25 +4,132 @@ Mock database interface for storing email actions and user preferences
 Future: Integrate with MongoDB Atlas for persistent storage
 """
 
-from datetime import datetime
-from typing import Dict, List
+import math
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from action_log import APPROVED_ACTIONS, ActionLog
+from logging_utils import get_logger
+from metrics import REGISTRY
+from models import UserAction, UserPreferences
+from profiler import PROFILER
+
+logger = get_logger(__name__)
+
+SAVE_ACTION_SECONDS = REGISTRY.histogram(
+    'altme_db_save_action_duration_seconds', 'Time spent in Database.save_action'
+)
+SAVE_BATCH_SECONDS = REGISTRY.histogram(
+    'altme_db_save_actions_duration_seconds', 'Time spent in Database.save_actions'
+)
+SAVED_ACTIONS = REGISTRY.counter(
+    'altme_db_saved_actions_total', 'Actions submitted for saving by outcome', ('result',)
+)
+EVICTED_ROWS = REGISTRY.counter(
+    'altme_db_evicted_total', 'Rows removed by retention', ('store',)
+)
+
+ACTION_ID_PREFIX = 'action_'
+
+# Approximate memory of one stored action beyond its strings (dict, keys, boxes)
+RECORD_OVERHEAD_BYTES = 600
+
+
+def _record_bytes(record: Dict) -> int:
+    """Approximate memory held by one raw action, replies included"""
+    return RECORD_OVERHEAD_BYTES + sum(len(value) for value in record.values() if isinstance(value, str))
+
+
+def _action_number(action_id) -> Optional[int]:
+    """Sequence number of an action ID, or None if it is not one"""
+    if not isinstance(action_id, str) or not action_id.startswith(ACTION_ID_PREFIX):
+        return None
+    try:
+        return int(action_id[len(ACTION_ID_PREFIX):])
+    except ValueError:
+        return None
 
 
 class Database:
     """
     Mock database for storing email metadata and user actions
     In production, this would connect to MongoDB Atlas
+
+    Action IDs are sequential and `actions` holds a contiguous run of them
+    in save order, so an action's position is its number minus the number
+    of the first retained action; no separate index has to be kept in step
+    with eviction.
+
+    Retention (off unless configured) drops raw actions older than
+    `retention_days`, beyond `max_actions`, or beyond `max_bytes` of
+    approximate memory (reply bodies make row counts a poor proxy), oldest
+    first, folding each into a per-day summary in `rollups`. The
+    columnar action log has its
+    own, usually longer, limits. A background thread evicts in steps of at
+    most `step_size` rows, holding the write lock only for one step.
+    Idempotency keys outlive their action, so a late retry still resolves
+    to the original ID.
     """
 
-    def __init__(self):
+    # Idempotency keys remembered for deduplicating client retries
+    MAX_IDEMPOTENCY_KEYS = 100000
+
+    def __init__(self, retention_days: float = 0, max_actions: int = 0, log_retention_days: float = 0,
+                 max_log_rows: int = 0, step_size: int = 1000, retention_interval: float = 0,
+                 max_bytes: int = 0):
         # In-memory storage (simulating database)
         self.actions = []
+        self.action_log = ActionLog()
+        self.rollups: Dict[str, Dict] = {}
+        self._first_number = 1
+        self._next_number = 1
+        self._raw_bytes = 0
+        self._idempotency: 'OrderedDict[str, str]' = OrderedDict()
+        self._write_lock = threading.RLock()
         self.preferences = {}
-        self.statistics = {
+        self.statistics = self._empty_statistics()
+
+        # Retention policy (0 disables a limit)
+        self.retention_days = retention_days
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        # The log is never trimmed more eagerly than the raw actions it summarizes
+        self.log_retention_days = max(log_retention_days, retention_days) if log_retention_days else 0
+        self.max_log_rows = max(max_log_rows, max_actions) if max_log_rows else 0
+        self.step_size = step_size
+        self.retention_interval = retention_interval
+        self._stop = threading.Event()
+        self._retainer: Optional[threading.Thread] = None
+
+        if retention_interval > 0 and self.retention_enabled:
+            self.start_retention()
+
+    @classmethod
+    def from_config(cls, config) -> 'Database':
+        return cls(
+            retention_days=config.ACTION_RETENTION_DAYS,
+            max_actions=config.ACTION_MAX_RAW,
+            max_bytes=int(config.ACTION_MAX_RAW_MB * (1 << 20)),
+            log_retention_days=config.ACTION_LOG_RETENTION_DAYS,
+            max_log_rows=config.ACTION_LOG_MAX_ROWS,
+            step_size=config.ACTION_RETENTION_STEP,
+            retention_interval=config.ACTION_RETENTION_INTERVAL_SECONDS
+        )
+
+    @staticmethod
+    def _empty_statistics() -> Dict:
+        return {
             'total_emails_processed': 0,
             'emails_classified': 0,
             'replies_generated': 0,
-            'actions_saved': 0
+            'actions_saved': 0,
+            'actions_rolled_up': 0
         }
 
     def save_action(self, action_data: Dict) -> Dict:
@@ -30,29 +137,124 @@ class Database:
         Save user action to database
 
         Args:
-            action_data (dict): Action metadata
+            action_data (dict): Action metadata (not modified)
 
         Returns:
-            dict: Saved action with ID
+            dict: Saved action with ID; `duplicate` is True when the
+            idempotency key was already used and nothing new was written
+
+        Raises:
+            ValueError: If the action does not validate as a UserAction
         """
-        # Generate unique ID
-        action_id = f"action_{len(self.actions) + 1:04d}"
+        started = time.perf_counter()
+        result = self.save_actions([action_data])[0]
+        SAVE_ACTION_SECONDS.observe(time.perf_counter() - started)
 
-        # Add timestamp and ID
-        action_data['id'] = action_id
-        action_data['timestamp'] = datetime.now().isoformat()
+        if result['status'] == 'invalid':
+            raise ValueError(result['error'])
 
-        # Save to in-memory storage
-        self.actions.append(action_data)
+        return {'id': result['id'], 'success': True, 'duplicate': result['status'] == 'duplicate'}
 
-        # Update statistics
-        self.statistics['actions_saved'] += 1
+    def save_actions(self, batch: Iterable[Dict]) -> List[Dict]:
+        """
+        Save many user actions in one transaction
+
+        Every item is validated first; then all valid, not previously seen
+        items are written together under the write lock, so readers see
+        either none or all of them. Items repeating an idempotency key,
+        from an earlier request or earlier in this batch, resolve to the
+        action already stored under it.
 
-        print(f"[DB] Saved action: {action_id}")
-        print(f"[DB] Email ID: {action_data.get('email_id')}")
-        print(f"[DB] Classification: {action_data.get('classification')}")
+        Args:
+            batch (iterable): Action dicts (not modified)
 
-        return {'id': action_id, 'success': True}
+        Returns:
+            list: Per-item results with `index`, `status` (created, duplicate
+            or invalid) and `id` or `error`
+        """
+        started = time.perf_counter()
+        now = datetime.now()
+        epoch = now.timestamp()
+
+        results = []
+        validated = []
+        for index, data in enumerate(batch):
+            try:
+                # IDs are assigned at commit time
+                validated.append((index, UserAction.from_request(data, '', now)))
+                results.append(None)
+            except ValueError as e:
+                results.append({'index': index, 'status': 'invalid', 'error': str(e)})
+
+        with self._write_lock, PROFILER.span('db.write'):
+            records = []
+            claimed: Dict[str, str] = {}
+            next_number = self._next_number
+
+            for index, action in validated:
+                key = action.idempotency_key
+                existing = (self._idempotency.get(key) or claimed.get(key)) if key is not None else None
+                if existing is not None:
+                    results[index] = {'index': index, 'status': 'duplicate', 'id': existing}
+                    continue
+
+                action.id = f"{ACTION_ID_PREFIX}{next_number:04d}"
+                next_number += 1
+                if key is not None:
+                    claimed[key] = action.id
+                records.append(action.to_record())
+                results[index] = {'index': index, 'status': 'created', 'id': action.id}
+
+            # Commit: nothing below can fail on validated records
+            self.actions.extend(records)
+            self._raw_bytes += sum(_record_bytes(record) for record in records)
+            self._next_number = next_number
+            self._remember_keys(claimed)
+            self._log_actions(records, epoch)
+            self.statistics['actions_saved'] += len(records)
+
+        for result in results:
+            SAVED_ACTIONS.labels(result['status']).inc()
+
+        logger.debug("Saved %d of %d actions", len(records), len(results))
+        SAVE_BATCH_SECONDS.observe(time.perf_counter() - started)
+        return results
+
+    def _remember_keys(self, claimed: Dict[str, str]):
+        self._idempotency.update(claimed)
+        while len(self._idempotency) > self.MAX_IDEMPOTENCY_KEYS:
+            self._idempotency.popitem(last=False)
+
+    def _log_actions(self, records: List[Dict], timestamp: float):
+        """Append actions to the columnar action log in one bulk write"""
+        if not records:
+            return
+
+        response_seconds = []
+        for record in records:
+            email_timestamp = record.get('email_timestamp')
+            if email_timestamp is None:
+                response_seconds.append(float('nan'))
+                continue
+            if isinstance(email_timestamp, str):
+                email_timestamp = datetime.fromisoformat(email_timestamp).timestamp()
+            response_seconds.append(max(0.0, timestamp - float(email_timestamp)))
+
+        if len(records) == 1:
+            # Column encoding has fixed NumPy overhead; a plain append is cheaper
+            seconds = response_seconds[0]
+            self.action_log.append(timestamp, records[0].get('classification'), records[0].get('action'),
+                                   has_reply=bool(records[0].get('reply')),
+                                   response_seconds=None if math.isnan(seconds) else seconds)
+            return
+
+        self.action_log.extend_columns(
+            [int(timestamp)] * len(records),
+            [record.get('classification') for record in records],
+            [record.get('action') for record in records],
+            has_reply=[bool(record.get('reply')) for record in records],
+            response_seconds=response_seconds
+        )
 
     def get_action(self, action_id: str) -> Dict:
         """
@@ -64,20 +266,224 @@ class Database:
         Returns:
             dict: Action data or None
         """
-        for action in self.actions:
-            if action['id'] == action_id:
+        number = _action_number(action_id)
+        return self._locate(number) if number is not None else None
+
+    def _locate(self, number: int) -> Optional[Dict]:
+        """Retained action with this sequence number, without taking the lock"""
+        while True:
+            actions = self.actions
+            position = number - self._first_number
+            if position < 0 or position >= len(actions):
+                return None
+            action = actions[position]
+            # An eviction step between reading the offset and the list shifts
+            # positions; the ID check catches that and the lookup is retried
+            if _action_number(action['id']) == number:
                 return action
 
-        return None
-
     def get_all_actions(self) -> List[Dict]:
         """
         Get all saved actions
 
         Returns:
-            list: List of all actions
+            list: Copy of the list of all actions (use iter_actions for large histories)
+        """
+        return list(self.actions)
+
+    def recent_replies(self, limit: int = 200, max_scan: int = 5000) -> List[Dict]:
         """
-        return self.actions
+        Most recent approved or sent actions that carry a reply
+
+        Args:
+            limit (int): Most actions to return
+            max_scan (int): Most actions to look at, newest first
+
+        Returns:
+            list: Actions, newest first
+        """
+        replies = []
+        actions = self.actions
+        end = len(actions)
+        for position in range(end - 1, max(end - max_scan, 0) - 1, -1):
+            if len(replies) >= limit:
+                break
+            try:
+                action = actions[position]
+            except IndexError:
+                # Retention trimmed the front while scanning
+                break
+            if action.get('action') in APPROVED_ACTIONS and action.get('reply'):
+                replies.append(action)
+        return replies
+
+    def iter_actions(self, since: Optional[float] = None, until: Optional[float] = None,
+                     after_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Lazily iterate saved actions in the order they were saved
+
+        Actions are appended in time order, so the start of a time range is
+        found by binary search and iteration stops at its end. Actions
+        evicted by retention while iterating are skipped, as is the part of
+        a range that has already been rolled up.
+
+        Args:
+            since (float): Only actions at or after this epoch time
+            until (float): Only actions before this epoch time
+            after_id (str): Resume after this action ID
+
+        Raises:
+            KeyError: If `after_id` is not an action ID this database issued
+        """
+        number = self._first_number
+        if after_id is not None:
+            after = _action_number(after_id)
+            if after is None or after >= self._next_number:
+                raise KeyError(after_id)
+            number = max(number, after + 1)
+        if since is not None:
+            start = datetime.fromtimestamp(since).isoformat()
+            with self._write_lock:
+                position = bisect_left(self.actions, start, key=lambda action: action['timestamp'])
+                number = max(number, self._first_number + position)
+        end = datetime.fromtimestamp(until).isoformat() if until is not None else None
+        return self._iter_from(number, end)
+
+    def _iter_from(self, number: int, end: Optional[str]) -> Iterator[Dict]:
+        while True:
+            number = max(number, self._first_number)
+            action = self._locate(number)
+            if action is None or (end is not None and action['timestamp'] >= end):
+                return
+            yield action
+            number += 1
+
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+
+    @property
+    def retention_enabled(self) -> bool:
+        return bool(self.retention_days or self.max_actions or self.max_bytes
+                    or self.log_retention_days or self.max_log_rows)
+
+    def enforce_retention(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Run one bounded retention step
+
+        Evicts at most `step_size` raw actions (rolling each into its day's
+        summary) and at most `step_size` action log rows.
+
+        Args:
+            now (float): Current epoch time (defaults to time.time())
+
+        Returns:
+            dict: Rows evicted from `actions` and `log`
+        """
+        now = time.time() if now is None else now
+        cutoff = None
+        if self.retention_days:
+            cutoff = (datetime.fromtimestamp(now) - timedelta(days=self.retention_days)).isoformat()
+
+        with self._write_lock, PROFILER.span('db.retention'):
+            actions = self.actions
+            overflow = len(actions) - self.max_actions if self.max_actions else 0
+            excess_bytes = self._raw_bytes - self.max_bytes if self.max_bytes else 0
+            limit = min(self.step_size, len(actions))
+            count = freed = 0
+            while count < limit and (count < overflow or freed < excess_bytes
+                                     or (cutoff is not None and actions[count]['timestamp'] < cutoff)):
+                freed += _record_bytes(actions[count])
+                count += 1
+
+            if count:
+                self._roll_up(actions[:count])
+                del actions[:count]
+                self._first_number += count
+                self._raw_bytes -= freed
+                self.statistics['actions_rolled_up'] += count
+
+        log_rows = self.action_log.evict(
+            before=now - self.log_retention_days * 86400 if self.log_retention_days else None,
+            max_rows=self.max_log_rows or None,
+            limit=self.step_size
+        )
+
+        if count:
+            EVICTED_ROWS.labels('actions').inc(count)
+        if log_rows:
+            EVICTED_ROWS.labels('log').inc(log_rows)
+        return {'actions': count, 'log': log_rows}
+
+    def _roll_up(self, actions: List[Dict]):
+        """Fold raw actions into per-day summaries (called with the write lock held)"""
+        for action in actions:
+            day = action['timestamp'][:10]
+            summary = self.rollups.get(day)
+            if summary is None:
+                summary = self.rollups[day] = {'actions': 0, 'replies': 0, 'by_category': {}, 'by_action': {}}
+            summary['actions'] += 1
+            if action.get('reply'):
+                summary['replies'] += 1
+            category = action.get('classification') or 'Unknown'
+            summary['by_category'][category] = summary['by_category'].get(category, 0) + 1
+            kind = action.get('action') or 'unknown'
+            summary['by_action'][kind] = summary['by_action'].get(kind, 0) + 1
+
+    def get_rollups(self, since: Optional[float] = None, until: Optional[float] = None) -> List[Dict]:
+        """
+        Per-day summaries of actions evicted from raw storage
+
+        Args:
+            since (float): Only days containing or after this epoch time
+            until (float): Only days before this epoch time
+
+        Returns:
+            list: Summaries with a `day` (YYYY-MM-DD), oldest first
+        """
+        first = datetime.fromtimestamp(since).date().isoformat() if since is not None else ''
+        last = datetime.fromtimestamp(until).date().isoformat() if until is not None else None
+        with self._write_lock:
+            return [
+                dict(summary, day=day, by_category=dict(summary['by_category']),
+                     by_action=dict(summary['by_action']))
+                for day, summary in sorted(self.rollups.items())
+                if day >= first and (last is None or day < last)
+            ]
+
+    def retention_stats(self) -> Dict:
+        """Current retention state for /stats"""
+        actions = self.actions
+        return {
+            'enabled': self.retention_enabled,
+            'raw_actions': len(actions),
+            'raw_bytes': self._raw_bytes,
+            'oldest_action': actions[0]['timestamp'] if actions else None,
+            'log_rows': len(self.action_log),
+            'rollup_days': len(self.rollups),
+            'retention_days': self.retention_days,
+            'max_actions': self.max_actions,
+            'max_bytes': self.max_bytes
+        }
+
+    def start_retention(self):
+        if self._retainer is not None and self._retainer.is_alive():
+            return
+        self._stop = threading.Event()
+        self._retainer = threading.Thread(
+            target=_retain, args=(weakref.ref(self), self._stop, self.retention_interval),
+            name='db-retention', daemon=True
+        )
+        self._retainer.start()
+        _RETAINING.add(self)
+
+    def stop_retention(self):
+        self._stop.set()
+        _RETAINING.discard(self)
+
+    def _restart_after_fork(self):
+        self._retainer = None
+        self.start_retention()
 
     def save_preference(self, key: str, value) -> bool:
         """
@@ -91,7 +497,7 @@ class Database:
             bool: Success status
         """
         self.preferences[key] = value
-        print(f"[DB] Saved preference: {key} = {value}")
+        logger.debug("Saved preference %s = %r", key, value)
         return True
 
     def get_preference(self, key: str, default=None):
@@ -107,6 +513,30 @@ class Database:
         """
         return self.preferences.get(key, default)
 
+    def get_user_preferences(self, user_id: str) -> UserPreferences:
+        """
+        Get a user's preferences
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            UserPreferences: Stored preferences, or the defaults
+        """
+        return self.preferences.get(f"user:{user_id}") or UserPreferences(user_id=user_id)
+
+    def save_user_preferences(self, preferences: UserPreferences) -> bool:
+        """
+        Save a user's preferences
+
+        Args:
+            preferences (UserPreferences): Preferences to store
+
+        Returns:
+            bool: Success status
+        """
+        return self.save_preference(f"user:{preferences.user_id}", preferences)
+
     def update_statistics(self, metric: str, increment: int = 1):
         """
         Update statistics counter
@@ -129,15 +559,48 @@ class Database:
 
     def clear_all(self):
         """Clear all data (for testing)"""
-        self.actions = []
+        with self._write_lock:
+            self.actions = []
+            self.rollups = {}
+            self._first_number = 1
+            self._next_number = 1
+            self._idempotency = OrderedDict()
+            self.action_log.clear()
         self.preferences = {}
-        self.statistics = {
-            'total_emails_processed': 0,
-            'emails_classified': 0,
-            'replies_generated': 0,
-            'actions_saved': 0
-        }
-        print("[DB] All data cleared")
+        self.statistics = self._empty_statistics()
+        logger.info("All data cleared")
+
+
+
+# Databases whose retention thread is running. Threads do not survive fork,
+# so one hook restarts them in each child; the set holds no references, so
+# an app that is dropped does not keep its database alive
+_RETAINING: 'weakref.WeakSet[Database]' = weakref.WeakSet()
+
+
+def _restart_retention_after_fork():
+    for database in list(_RETAINING):
+        database._restart_after_fork()
+
+
+os.register_at_fork(after_in_child=_restart_retention_after_fork)
+
+
+def _retain(ref: 'weakref.ref', stop: threading.Event, delay: float):
+    """Retention loop; holds the database only while a step runs"""
+    while not stop.wait(delay):
+        database = ref()
+        if database is None:
+            return
+        try:
+            evicted = database.enforce_retention()
+        except Exception as e:
+            logger.error("Action retention error: %s", e)
+            evicted = {}
+        # Work through a backlog in quick steps, yielding the lock between them
+        backlog = any(count >= database.step_size for count in evicted.values())
+        delay = 0.01 if backlog else database.retention_interval
+        del database
 
 
 # Example usage
@@ -0,0 +1,348 @@
+"""
+Digest Module
+Batches low-priority mail into one generated summary per window
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from logging_utils import get_logger
+from metrics import REGISTRY
+from prompt import LINE_SEPARATOR_TOKENS, MESSAGE_OVERHEAD_TOKENS, estimate_tokens, trim_to_tokens
+
+logger = get_logger(__name__)
+
+DIGESTS = REGISTRY.counter('altme_digests_total', 'Digest windows closed by outcome', ('result',))
+DIGESTED_EMAILS = REGISTRY.counter('altme_digest_emails_total', 'Emails folded into digests')
+DIGEST_PENDING = REGISTRY.gauge('altme_digest_pending', 'Emails waiting for the next digest')
+
+# Emails listed per category in a digest's payload (all are counted)
+EMAILS_PER_GROUP = 10
+
+OMITTED_LINE = "(+{count} more not listed)"
+
+DIGEST_SYSTEM_PROMPT = (
+    "Summarize these low-priority emails as a short digest. Group them by category, "
+    "name the senders that matter, and call out anything time-limited. One line per group."
+)
+
+
+def within_working_hours(hours: Optional[Dict], when: datetime) -> bool:
+    """
+    Whether `when` falls inside a working_hours preference
+
+    Args:
+        hours (dict): {"start": "09:00", "end": "17:00", "days": [0, ..., 4]}
+            with Monday = 0; missing keys mean any time or any day
+        when (datetime): Local time to test
+
+    Returns:
+        bool: True if inside, or if `hours` is not set or not understood
+    """
+    if not hours:
+        return True
+    try:
+        days = hours.get('days')
+        if days is not None and when.weekday() not in days:
+            return False
+        start = datetime.strptime(hours.get('start', '00:00'), '%H:%M').time()
+        end = datetime.strptime(hours.get('end', '23:59'), '%H:%M').time()
+    except (AttributeError, TypeError, ValueError):
+        return True
+    now = when.time()
+    # An overnight range such as 22:00-06:00 wraps past midnight
+    return start <= now < end if start <= end else (now >= start or now < end)
+
+
+class DigestQueue:
+    """
+    Collects low-priority emails and summarizes each window with one call
+
+    Emails offered here are classified; those in `categories` with at
+    least `min_confidence` are held until the window closes. A window
+    closes once `window_seconds` have passed since it opened; with
+    `working_hours` scheduling it is also held back until the user's
+    working hours, so mail that arrives overnight becomes one morning
+    digest. Closing a window groups its emails by category and sender
+    and makes a single `summarize` call over a budgeted prompt.
+
+    Details of at most `max_items` emails are kept per window; beyond that
+    emails are only counted, so a flood cannot grow memory or the prompt.
+    The ids of the last MAX_SEEN_IDS counted emails are remembered either
+    way, so a re-offered email is not counted twice.
+    """
+
+    # Email ids remembered per window for de-duplication
+    MAX_SEEN_IDS = 100000
+
+    def __init__(self, summarize: Callable[[Dict], Dict], classify: Callable[[str, str, str], Dict],
+                 categories: Iterable[str] = ('Promotional', 'Social'), min_confidence: float = 0.5,
+                 window_seconds: float = 4 * 3600, max_items: int = 500, max_digests: int = 20,
+                 max_input_tokens: int = 1500, check_seconds: float = 60.0,
+                 working_hours: Optional[Callable[[], Optional[Dict]]] = None, enabled: bool = True):
+        self.summarize = summarize
+        self.classify = classify
+        self.categories = frozenset(categories)
+        self.min_confidence = min_confidence
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self.max_input_tokens = max_input_tokens
+        self.check_seconds = check_seconds
+        self.working_hours = working_hours
+        self.enabled = enabled
+
+        self._items: List[Dict] = []
+        self._counts: Counter = Counter()
+        self._seen: 'OrderedDict[str, None]' = OrderedDict()
+        self._opened: Optional[float] = None
+        self._digests = deque(maxlen=max_digests)
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._scheduler: Optional[threading.Thread] = None
+        self._pid = None
+
+    @classmethod
+    def from_config(cls, config, summarize, classify, working_hours=None) -> 'DigestQueue':
+        return cls(
+            summarize=summarize,
+            classify=classify,
+            categories=config.DIGEST_CATEGORIES,
+            min_confidence=config.DIGEST_MIN_CONFIDENCE,
+            window_seconds=config.DIGEST_WINDOW_SECONDS,
+            max_items=config.DIGEST_MAX_ITEMS,
+            max_input_tokens=min(config.PROMPT_MAX_INPUT_TOKENS, config.AI_CONTEXT_TOKENS - config.MAX_TOKENS),
+            working_hours=working_hours if config.DIGEST_SCHEDULE == 'working_hours' else None,
+            enabled=config.DIGEST_ENABLED
+        )
+
+    # ------------------------------------------------------------------
+    # Collecting
+    # ------------------------------------------------------------------
+
+    def offer(self, email: Dict, classification: Optional[Dict] = None) -> bool:
+        """
+        Consider an email for the next digest
+
+        Args:
+            email (dict): Email with id, subject, body and sender
+            classification (dict): Existing classifier result, if already computed
+
+        Returns:
+            bool: Whether the email was added
+        """
+        if not self.enabled or not email.get('unread', True):
+            return False
+
+        sender = email.get('sender', 'Unknown')
+        result = classification or self.classify(email['subject'], email['body'], sender)
+        if result['category'] not in self.categories or result['confidence'] < self.min_confidence:
+            return False
+
+        with self._lock:
+            if email['id'] in self._seen:
+                return False
+            self._seen[email['id']] = None
+            if len(self._seen) > self.MAX_SEEN_IDS:
+                self._seen.popitem(last=False)
+            if self._opened is None:
+                self._opened = time.time()
+            self._counts[result['category']] += 1
+            if len(self._items) < self.max_items:
+                self._items.append({
+                    'id': email['id'],
+                    'category': result['category'],
+                    'sender': sender,
+                    'subject': email['subject']
+                })
+            DIGEST_PENDING.set(sum(self._counts.values()))
+            self._ensure_scheduler()
+        return True
+
+    def offer_many(self, emails: Iterable[Dict]) -> int:
+        """Offer several emails; returns the number added"""
+        return sum(1 for email in emails if self.offer(email))
+
+    def pending(self) -> Dict:
+        """Preview of the open window (no generation)"""
+        with self._lock:
+            return {
+                'count': sum(self._counts.values()),
+                'by_category': dict(self._counts),
+                'opened_at': _iso(self._opened),
+                'due_at': _iso(self._opened + self.window_seconds) if self._opened is not None else None
+            }
+
+    # ------------------------------------------------------------------
+    # Summarizing
+    # ------------------------------------------------------------------
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """Whether the open window should be summarized now"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._opened is None or now - self._opened < self.window_seconds:
+                return False
+        hours = self.working_hours() if self.working_hours is not None else None
+        return within_working_hours(hours, datetime.fromtimestamp(now))
+
+    def flush(self) -> Optional[Dict]:
+        """
+        Close the open window and summarize it with one generation call
+
+        Returns:
+            dict: The new digest, or None if nothing was pending
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._opened is None:
+                    return None
+                items, counts, opened = self._items, self._counts, self._opened
+                self._items, self._counts, self._seen, self._opened = [], Counter(), OrderedDict(), None
+                DIGEST_PENDING.set(0)
+
+            groups = _group(items, counts)
+            prompt = self._prompt(groups)
+            started = time.perf_counter()
+            try:
+                summary = self.summarize(prompt)
+            except Exception as e:
+                # The window's emails are still listed; only the summary is missing
+                DIGESTS.labels('error').inc()
+                logger.warning("Digest summary failed: %s", e)
+                summary = {'summary': None, 'error': str(e)}
+            else:
+                DIGESTS.labels('generated').inc()
+
+            total = sum(counts.values())
+            DIGESTED_EMAILS.inc(total)
+            digest = {
+                'id': f"digest_{next(self._sequence):04d}",
+                'window_start': _iso(opened),
+                'window_end': _iso(time.time()),
+                'count': total,
+                'groups': groups,
+                'summary': summary.get('summary'),
+                'prompt_tokens': prompt['tokens'],
+                'generation_ms': round((time.perf_counter() - started) * 1000, 3)
+            }
+            if 'error' in summary:
+                digest['error'] = summary['error']
+            self._digests.appendleft(digest)
+            return digest
+
+    def digests(self, limit: int = 1) -> List[Dict]:
+        """Most recent digests, newest first"""
+        return list(itertools.islice(self._digests, max(limit, 0)))
+
+    def _prompt(self, groups: List[Dict]) -> Dict:
+        """Digest prompt: one line per email, grouped, packed into the input budget"""
+        remaining = self.max_input_tokens - estimate_tokens(DIGEST_SYSTEM_PROMPT) - 2 * MESSAGE_OVERHEAD_TOKENS
+        # Room for the omitted-emails line, whatever the count turns out to be
+        remaining -= estimate_tokens(OMITTED_LINE.format(count=10 ** 12)) + LINE_SEPARATOR_TOKENS
+        lines = []
+        omitted = 0
+        for group in groups:
+            header = f"{group['category']} ({group['count']} emails):"
+            if estimate_tokens(header) + LINE_SEPARATOR_TOKENS > remaining:
+                omitted += group['count']
+                continue
+            lines.append(header)
+            remaining -= estimate_tokens(header) + LINE_SEPARATOR_TOKENS
+            listed = 0
+            for email in group['emails']:
+                line = trim_to_tokens(f"- {email['sender']}: {email['subject']}",
+                                      min(remaining - LINE_SEPARATOR_TOKENS, 40))
+                if not line:
+                    break
+                lines.append(line)
+                remaining -= estimate_tokens(line) + LINE_SEPARATOR_TOKENS
+                listed += 1
+            omitted += group['count'] - listed
+        if omitted:
+            lines.append(OMITTED_LINE.format(count=omitted))
+
+        content = '\n'.join(lines)
+        return {
+            'messages': [
+                {'role': 'system', 'content': DIGEST_SYSTEM_PROMPT},
+                {'role': 'user', 'content': content}
+            ],
+            'groups': groups,
+            'tokens': estimate_tokens(DIGEST_SYSTEM_PROMPT) + estimate_tokens(content) + 2 * MESSAGE_OVERHEAD_TOKENS
+        }
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def _ensure_scheduler(self):
+        # Called with the lock held. Threads do not survive fork, so the
+        # scheduler is (re)started lazily in whichever process collects mail.
+        if self._pid == os.getpid() and self._scheduler is not None and self._scheduler.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._scheduler = threading.Thread(target=self._run, name='digest-scheduler', daemon=True)
+        self._scheduler.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(min(self.check_seconds, self.window_seconds)):
+            try:
+                if self.due():
+                    self.flush()
+            except Exception as e:
+                logger.error("Digest scheduler error: %s", e)
+
+
+def _group(items: List[Dict], counts: Counter) -> List[Dict]:
+    """Emails grouped by category (largest first), with their top senders"""
+    by_category: Dict[str, List[Dict]] = {}
+    for item in items:
+        by_category.setdefault(item['category'], []).append(item)
+
+    groups = []
+    for category, count in counts.most_common():
+        emails = by_category.get(category, [])
+        senders = Counter(email['sender'] for email in emails)
+        groups.append({
+            'category': category,
+            'count': count,
+            'senders': [{'sender': sender, 'count': n} for sender, n in senders.most_common(5)],
+            'emails': [{'id': email['id'], 'sender': email['sender'], 'subject': email['subject']}
+                       for email in emails[-EMAILS_PER_GROUP:]]
+        })
+    return groups
+
+
+def _iso(epoch: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(epoch).isoformat(timespec='seconds') if epoch is not None else None
+
+
+# Example usage
+if __name__ == '__main__':
+    from classifier import EmailClassifier
+    from openai_client import OpenAIClient
+
+    queue = DigestQueue(OpenAIClient().summarize_digest, EmailClassifier().classify, window_seconds=0)
+    queue.offer({'id': 'p1', 'sender': 'deals@shop.com', 'subject': 'Flash sale: 50% off today',
+                 'body': 'Limited time offer, exclusive discount on everything.'})
+    queue.offer({'id': 's1', 'sender': 'notifications@linkedin.com', 'subject': 'You have 3 new connection requests',
+                 'body': 'Someone liked and commented on your post. Grow your network.'})
+    print(f"Pending: {queue.pending()}")
+
+    digest = queue.flush()
+    if digest:
+        print(f"{digest['id']}: {digest['count']} emails, {digest['prompt_tokens']} prompt tokens")
+        print(digest['summary'])
+    queue.stop()
@@ -5,7 +5,25 @@ Future: Replace with actual Gmail API integration using OAuth2.0
 """
 
 import random
+import re
+import threading
 from datetime import datetime, timedelta
+from itertools import islice
+
+from changes import EMAIL_ADDED, EMAIL_REMOVED, EMAIL_UPDATED, ChangeFeed
+from logging_utils import get_logger
+from mailstore import EmailStore
+
+logger = get_logger(__name__)
+
+# Reply/forward prefixes, possibly repeated or numbered ("Re: Fwd:", "RE[2]:")
+_SUBJECT_PREFIX = re.compile(r'^\s*((re|fwd?|aw|sv|wg)\s*(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+
+
+def thread_key(subject):
+    """Conversation key of a subject: lowercased, without reply/forward prefixes"""
+    return ' '.join(_SUBJECT_PREFIX.sub('', subject or '').lower().split())
+
 
 
 class EmailClient:
@@ -14,8 +32,21 @@ class EmailClient:
     In production, this would use Google Gmail API
     """
 
-    def __init__(self):
-        self.mock_emails = self._generate_mock_emails()
+    def __init__(self, compress_bodies=False, change_feed_capacity=10000):
+        """
+        Initialize the email client
+
+        Args:
+            compress_bodies (bool): zlib-compress long bodies in the store
+            change_feed_capacity (int): Inbox changes retained for clients catching up
+        """
+        self.store = EmailStore(compress=compress_bodies)
+        self.store.extend(self._generate_mock_emails())
+        self.changes = ChangeFeed(change_feed_capacity)
+        self._subscribers = []
+        self._threads = None  # thread key -> rows, built on first use
+        # Held across a store write, the thread index and its change event
+        self._lock = threading.Lock()
 
     def _generate_mock_emails(self):
         """Generate realistic mock email data"""
@@ -99,14 +130,8 @@ class EmailClient:
         Returns:
             list: List of email dictionaries
         """
-        # Return mock emails (limited)
-        emails = self.mock_emails[:limit]
-
-        # Convert datetime to string for JSON serialization
-        for email in emails:
-            email['timestamp'] = email['timestamp'].isoformat()
-
-        return emails
+        # Emails are materialized from the compact store only when serialized
+        return list(islice(self.store.iter_dicts(), limit))
 
     def fetch_email_by_id(self, email_id):
         """
@@ -118,13 +143,89 @@ class EmailClient:
         Returns:
             dict: Email object or None
         """
-        for email in self.mock_emails:
-            if email['id'] == email_id:
-                email_copy = email.copy()
-                email_copy['timestamp'] = email_copy['timestamp'].isoformat()
-                return email_copy
+        return self.store.get(email_id)
 
-        return None
+    def subscribe(self, callback):
+        """
+        Register a callback invoked with each newly received email
+
+        Args:
+            callback (callable): Called with the email dict
+        """
+        self._subscribers.append(callback)
+
+    def receive(self, email):
+        """
+        Store a newly arrived email and notify subscribers
+
+        Args:
+            email (dict): Email object
+
+        Returns:
+            dict: The stored email
+
+        Raises:
+            DuplicateEmailError: If the id is already stored
+            ValueError: If a field cannot be stored
+        """
+        with self._lock:
+            row = self.store.add(email)
+            stored = self.store.to_dict(row)
+            if self._threads is not None:
+                self._add_to_thread(row)
+            self.changes.publish(EMAIL_ADDED, stored['id'])
+
+        for callback in self._subscribers:
+            try:
+                callback(stored)
+            except Exception as e:
+                logger.error("Email subscriber failed: %s", e)
+
+        return stored
+
+    def _add_to_thread(self, row):
+        key = thread_key(self.store.subject(row))
+        if key:
+            self._threads.setdefault(key, []).append(row)
+
+    def thread(self, subject, exclude_id=None, limit=5):
+        """
+        Earlier emails in the conversation a subject belongs to
+
+        Emails whose subjects match once reply/forward prefixes are removed
+        are treated as one thread.
+
+        Args:
+            subject (str): Subject of the email being answered
+            exclude_id (str): That email's id; only emails stored before it are returned
+            limit (int): Most emails to return
+
+        Returns:
+            list: Up to `limit` of the latest such emails, oldest first
+        """
+        with self._lock:
+            if self._threads is None:
+                threads = {}
+                for row in range(len(self.store)):
+                    key = thread_key(self.store.subject(row))
+                    if key:
+                        threads.setdefault(key, []).append(row)
+                self._threads = threads
+            rows = list(self._threads.get(thread_key(subject), ()))
+
+        if not rows or limit <= 0:
+            return []
+
+        before = self.store.row_of(exclude_id) if exclude_id else None
+        result = []
+        for row in reversed(rows):
+            if len(result) >= limit:
+                break
+            if (before is not None and row >= before) or self.store.is_deleted(row):
+                continue
+            result.append(self.store.to_dict(row))
+        result.reverse()
+        return result
 
     def mark_as_read(self, email_id):
         """
@@ -136,12 +237,55 @@ class EmailClient:
         Returns:
             bool: Success status
         """
-        for email in self.mock_emails:
-            if email['id'] == email_id:
-                email['unread'] = False
-                return True
+        row = self.store.row_of(email_id)
+        if row is None:
+            return False
+
+        if self.store.unread(row):
+            self.store.set_unread(row, False)
+            self.changes.publish(EMAIL_UPDATED, email_id)
+        return True
+
+    def set_classification(self, email_id, category, publish=True):
+        """
+        Record an email's category
+
+        Args:
+            email_id (str): The email ID
+            category (str): Category, or None to clear it
+            publish (bool): Announce it on the change feed (False for a
+                category derived while reading, which is not an inbox change)
+
+        Returns:
+            bool: Success status
+        """
+        row = self.store.row_of(email_id)
+        if row is None:
+            return False
+
+        if self.store.classification(row) != category:
+            self.store.set_classification(row, category)
+            if publish:
+                self.changes.publish(EMAIL_UPDATED, email_id)
+        return True
+
+    def delete_email(self, email_id):
+        """
+        Remove an email from the inbox
+
+        Args:
+            email_id (str): The email ID
+
+        Returns:
+            bool: Success status
+        """
+        row = self.store.row_of(email_id)
+        if row is None:
+            return False
 
-        return False
+        self.store.delete(row)
+        self.changes.publish(EMAIL_REMOVED, email_id)
+        return True
 
     def send_email(self, to, subject, body):
         """
@@ -156,9 +300,8 @@ class EmailClient:
             dict: Send status
         """
         # In production, this would use Gmail API to send emails
-        print(f"[MOCK] Sending email to {to}")
-        print(f"[MOCK] Subject: {subject}")
-        print(f"[MOCK] Body: {body[:100]}...")
+        logger.info("[MOCK] Sending email to %s (subject: %s)", to, subject)
+        logger.debug("[MOCK] Body: %s...", body[:100])
 
         return {
             'success': True,
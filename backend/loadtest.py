@@ -0,0 +1,398 @@
+"""
+Load Test Module
+Open-loop HTTP load generator for the Flask API with HDR-style latency histograms
+
+Usage:
+    python loadtest.py --rates 50,100,200,400 --duration 10 --output load.json
+    python loadtest.py --url http://localhost:5000 --rates 100 --mix classify=3,save=1
+"""
+
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from benchmark import generate_synthetic_emails
+
+
+# Default request mix (relative weights) modelled on a user triaging their inbox
+DEFAULT_MIX = {
+    'fetch_emails': 0.25,
+    'classify': 0.30,
+    'generate_reply': 0.15,
+    'save': 0.20,
+    'stats': 0.10
+}
+
+ENDPOINTS = {
+    'fetch_emails': ('GET', '/fetch_emails'),
+    'classify': ('POST', '/classify'),
+    'generate_reply': ('POST', '/generate_reply'),
+    'save': ('POST', '/save'),
+    'stats': ('GET', '/stats')
+}
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear latency histogram
+
+    Values (microseconds) are bucketed by power of two, and each power of two
+    is split into 2**precision linear sub-buckets, giving a bounded relative
+    error of 2**-precision with a fixed number of counters.
+    """
+
+    def __init__(self, precision: int = 7, max_exponent: int = 40):
+        self.precision = precision
+        self.sub_buckets = 1 << precision
+        self.counts = [0] * (self.sub_buckets * (max_exponent + 1))
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_buckets:
+            return value
+        exponent = value.bit_length() - self.precision
+        return (exponent << self.precision) + (value >> exponent)
+
+    def _value_at(self, index: int) -> int:
+        exponent, offset = divmod(index, self.sub_buckets)
+        return offset << exponent
+
+    def record(self, value_us: float):
+        """Record one latency sample in microseconds"""
+        value = max(0, int(value_us))
+        index = min(self._index(value), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Add all samples of another histogram with the same layout"""
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, pct: float) -> int:
+        """Value (microseconds) at the given percentile"""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(pct / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value_at(index), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        """Summarize the histogram in milliseconds"""
+        return {
+            'count': self.total,
+            'min_ms': round((self.min or 0) / 1000, 3),
+            'mean_ms': round(self.sum / self.total / 1000, 3) if self.total else 0.0,
+            'p50_ms': round(self.percentile(50) / 1000, 3),
+            'p90_ms': round(self.percentile(90) / 1000, 3),
+            'p99_ms': round(self.percentile(99) / 1000, 3),
+            'p999_ms': round(self.percentile(99.9) / 1000, 3),
+            'max_ms': round(self.max / 1000, 3)
+        }
+
+
+class EndpointStats:
+    """Latency histogram, error and status counts for one endpoint"""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+        self.statuses = {}
+
+    def to_dict(self, seconds: float) -> Dict:
+        count = self.histogram.total
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'error_rate': round(self.errors / count, 4) if count else 0.0,
+            'throughput_rps': round(count / seconds, 2) if seconds else 0.0,
+            'statuses': self.statuses,
+            'latency': self.histogram.to_dict()
+        }
+
+
+class LoadGenerator:
+    """
+    Open-loop load generator
+
+    Requests are scheduled on a Poisson arrival process independent of
+    response times, and latency is measured from the *intended* send time so
+    that queueing inside a saturated server is not hidden (no coordinated
+    omission).
+    """
+
+    def __init__(self, base_url: str, mix: Dict[str, float], corpus_size: int = 500,
+                 max_inflight: int = 256, seed: int = 42):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.mix = mix
+        self.max_inflight = max_inflight
+        self.rng = random.Random(seed)
+        self.emails = generate_synthetic_emails(corpus_size, seed)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _payload(self, endpoint: str) -> Optional[Dict]:
+        email = self.rng.choice(self.emails)
+        if endpoint in ('classify', 'generate_reply'):
+            return {'subject': email['subject'], 'body': email['body'], 'sender': email['sender']}
+        if endpoint == 'save':
+            return {
+                'email_id': email['id'],
+                'classification': email['expected_category'],
+                'action': self.rng.choice(['approved', 'edited', 'dismissed'])
+            }
+        return None
+
+    def _send(self, endpoint: str, payload: Optional[Dict]) -> int:
+        method, path = ENDPOINTS[endpoint]
+        body = json.dumps(payload) if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, ConnectionError, OSError):
+                # Stale keep-alive connection: reconnect once before failing
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        return 0
+
+    def _execute(self, endpoint: str, payload: Optional[Dict], intended: float,
+                 stats: Dict[str, EndpointStats], state: Dict):
+        try:
+            status = self._send(endpoint, payload)
+        except Exception:
+            status = 0
+        latency_us = (time.perf_counter() - intended) * 1e6
+
+        with self._lock:
+            endpoint_stats = stats[endpoint]
+            endpoint_stats.histogram.record(latency_us)
+            endpoint_stats.statuses[str(status)] = endpoint_stats.statuses.get(str(status), 0) + 1
+            if status == 0 or status >= 500:
+                endpoint_stats.errors += 1
+            state['inflight'] -= 1
+
+    def run_stage(self, rate: float, duration: float) -> Dict:
+        """
+        Drive the server at `rate` requests/sec for `duration` seconds
+
+        Returns:
+            dict: Per-endpoint and overall results for this stage
+        """
+        names = list(self.mix)
+        weights = list(self.mix.values())
+        stats = {name: EndpointStats() for name in names}
+        state = {'inflight': 0, 'peak_inflight': 0, 'dropped': 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_inflight) as pool:
+            started = time.perf_counter()
+            next_send = started
+            deadline = started + duration
+
+            while next_send < deadline:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                endpoint = self.rng.choices(names, weights)[0]
+                with self._lock:
+                    if state['inflight'] >= self.max_inflight:
+                        state['dropped'] += 1
+                        admit = False
+                    else:
+                        state['inflight'] += 1
+                        state['peak_inflight'] = max(state['peak_inflight'], state['inflight'])
+                        admit = True
+
+                if admit:
+                    pool.submit(self._execute, endpoint, self._payload(endpoint), next_send, stats, state)
+
+                next_send += self.rng.expovariate(rate)
+
+        elapsed = time.perf_counter() - started
+        overall = LatencyHistogram()
+        errors = 0
+        for endpoint_stats in stats.values():
+            overall.merge(endpoint_stats.histogram)
+            errors += endpoint_stats.errors
+
+        return {
+            'offered_rps': rate,
+            'duration_s': round(elapsed, 3),
+            'achieved_rps': round(overall.total / elapsed, 2) if elapsed else 0.0,
+            'requests': overall.total,
+            'errors': errors,
+            'error_rate': round(errors / overall.total, 4) if overall.total else 0.0,
+            'dropped': state['dropped'],
+            'peak_inflight': state['peak_inflight'],
+            'latency': overall.to_dict(),
+            'endpoints': {name: s.to_dict(elapsed) for name, s in stats.items()}
+        }
+
+
+def find_saturation(stages: List[Dict], slo_ms: float, max_error_rate: float = 0.01) -> Optional[Dict]:
+    """
+    First stage where the server stops keeping up with the offered load
+
+    A stage is saturated when achieved throughput falls below 90% of the
+    offered rate, p99 exceeds the SLO, errors exceed `max_error_rate`, or
+    requests had to be dropped at the client.
+    """
+    for stage in stages:
+        reasons = []
+        if stage['achieved_rps'] < 0.9 * stage['offered_rps']:
+            reasons.append('throughput')
+        if stage['latency']['p99_ms'] > slo_ms:
+            reasons.append('p99')
+        if stage['error_rate'] > max_error_rate:
+            reasons.append('errors')
+        if stage['dropped']:
+            reasons.append('dropped')
+        if reasons:
+            return {'offered_rps': stage['offered_rps'], 'reasons': reasons}
+    return None
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "classify=3,save=1" into a weight mapping"""
+    if not spec:
+        return dict(DEFAULT_MIX)
+
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+@contextlib.contextmanager
+def local_server(port: int):
+    """Start the Flask app in-process on a threaded WSGI server"""
+    from werkzeug.serving import make_server
+
+    from main import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+
+
+def _print_stage(stage: Dict):
+    latency = stage['latency']
+    print(f"offered {stage['offered_rps']:>7.0f} rps  achieved {stage['achieved_rps']:>8.1f} rps  "
+          f"p50 {latency['p50_ms']:>8.2f}ms  p99 {latency['p99_ms']:>8.2f}ms  "
+          f"errors {stage['error_rate']:>6.2%}  inflight {stage['peak_inflight']:>4}  "
+          f"dropped {stage['dropped']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='HTTP load test for the Flask API')
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=0, help='Port for the local server (0 = any free port)')
+    parser.add_argument('--rates', default='50,100,200,400', help='Comma-separated arrival rates (req/s) to ramp')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per stage')
+    parser.add_argument('--mix', help='Endpoint weights, e.g. classify=3,save=1,stats=1')
+    parser.add_argument('--max-inflight', type=int, default=256, help='Client concurrency cap')
+    parser.add_argument('--slo-ms', type=float, default=250.0, help='p99 latency objective for saturation')
+    parser.add_argument('--stop-at-saturation', action='store_true', help='Stop ramping once saturated')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    rates = [float(rate) for rate in args.rates.split(',') if rate]
+
+    with contextlib.ExitStack() as stack:
+        base_url = args.url or stack.enter_context(local_server(args.port))
+        generator = LoadGenerator(base_url, mix, max_inflight=args.max_inflight, seed=args.seed)
+
+        stages = []
+        for rate in rates:
+            stage = generator.run_stage(rate, args.duration)
+            stages.append(stage)
+            _print_stage(stage)
+            if args.stop_at_saturation and find_saturation([stage], args.slo_ms):
+                break
+
+    saturation = find_saturation(stages, args.slo_ms)
+    if saturation:
+        print(f"Saturated at {saturation['offered_rps']:.0f} rps ({', '.join(saturation['reasons'])})")
+    else:
+        print("No saturation within the tested rates")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'target': args.url or 'local',
+            'mix': mix,
+            'duration_s': args.duration,
+            'slo_ms': args.slo_ms,
+            'max_inflight': args.max_inflight
+        },
+        'stages': stages,
+        'saturation': saturation
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Logging Utilities Module
+Leveled, rate-limited logging for hot code paths
+"""
+
+import logging
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drop repeats of the same log call beyond `burst` records per `interval`
+
+    Records are keyed by their call site (logger, file, line), so a hot
+    debug line cannot flood the output while distinct messages still get
+    through. The number of suppressed records is appended to the next record
+    that is let through.
+    """
+
+    def __init__(self, burst: int = 10, interval: float = 1.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+
+        with self._lock:
+            window_start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+
+            if count >= self.burst:
+                self._windows[key] = (window_start, count, suppressed + 1)
+                return False
+
+            self._windows[key] = (window_start, count + 1, 0)
+
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def get_logger(name: str, burst: int = 10, interval: float = 1.0) -> logging.Logger:
+    """Get a module logger with a rate limit on repeated log calls"""
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(burst, interval))
+    return logger
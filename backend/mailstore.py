@@ -0,0 +1,325 @@
+"""
+Mail Store Module
+Compact array-backed storage for large inboxes
+Emails are only materialized into dicts at serialization time
+"""
+
+import threading
+import zlib
+from array import array
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+
+# Flag bits stored per email
+FLAG_UNREAD = 0x01
+FLAG_COMPRESSED = 0x02
+FLAG_DELETED = 0x04
+
+# Bodies shorter than this are never worth compressing
+COMPRESS_MIN_BYTES = 256
+
+
+class DuplicateEmailError(ValueError):
+    """Raised when an email id is already stored"""
+
+
+class StringTable:
+    """
+    Interning table mapping repeated strings to small integer codes
+    A million emails from a few thousand senders store each sender once
+    """
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._values: List[str] = []
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._values)
+            self._codes[value] = code
+            self._values.append(value)
+        return code
+
+    def decode(self, code: int) -> str:
+        return self._values[code]
+
+    def code_of(self, value: str) -> Optional[int]:
+        """Code of an existing value without interning it"""
+        return self._codes.get(value)
+
+    def values(self) -> List[str]:
+        return list(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class EmailStore:
+    """
+    Columnar store of emails
+
+    Each field lives in its own column: senders and categories as interned
+    codes, timestamps as epoch seconds, flags as one byte, and bodies as
+    UTF-8 bytes (zlib-compressed when `compress` is on and it pays off).
+    Per-email cost is a few pointers and array slots instead of a dict with
+    boxed datetime and duplicated sender/category strings.
+
+    Rows are append-only and never renumbered: deleting an email leaves a
+    tombstone, so row numbers can be used as stable ids by other indexes.
+    Adds are serialized, and every column value is validated before the
+    first column grows, so a rejected email leaves no partial row behind.
+    """
+
+    def __init__(self, compress: bool = False, compress_level: int = 6):
+        self.compress = compress
+        self.compress_level = compress_level
+
+        self.senders = StringTable()
+        self.categories = StringTable()
+
+        self._ids: List[str] = []
+        self._subjects: List[str] = []
+        self._bodies: List[bytes] = []
+        self._sender_codes = array('I')
+        self._category_codes = array('h')   # -1 = not classified
+        self._priorities = array('b')       # -1 = no priority
+        self._timestamps = array('q')       # epoch seconds
+        self._flags = bytearray()
+        self._index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.deleted = 0
+
+    def __len__(self) -> int:
+        """Number of rows, including deleted ones"""
+        return len(self._ids)
+
+    @property
+    def live(self) -> int:
+        """Number of emails not deleted"""
+        return len(self._ids) - self.deleted
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def add(self, email: Dict) -> int:
+        """
+        Add an email given as a dict (as produced by the email client)
+
+        Args:
+            email (dict): id, sender, subject, body, timestamp, unread and
+                optional classification/priority
+
+        Returns:
+            int: Row index of the stored email
+
+        Raises:
+            DuplicateEmailError: If the id is already stored
+            ValueError: If a field cannot be stored
+        """
+        email_id = email['id']
+        subject = email.get('subject', '')
+        body, flags = self._encode_body(email.get('body', ''))
+        if email.get('unread', True):
+            flags |= FLAG_UNREAD
+        epoch = _to_epoch(email.get('timestamp'))
+        priority = email.get('priority')
+        priority = -1 if priority is None else priority
+        if not isinstance(priority, int) or not -1 <= priority <= 127:
+            raise ValueError(f"Invalid priority: {priority!r}")
+        category = email.get('classification')
+
+        with self._lock:
+            if email_id in self._index:
+                raise DuplicateEmailError(f"Duplicate email id: {email_id}")
+
+            sender_code = self.senders.encode(email.get('sender', ''))
+            category_code = self.categories.encode(category) if category else -1
+
+            # Nothing below can fail; the id goes in last so readers that
+            # size by len(self) never see a partly appended row
+            row = len(self._ids)
+            self._subjects.append(subject)
+            self._bodies.append(body)
+            self._sender_codes.append(sender_code)
+            self._category_codes.append(category_code)
+            self._priorities.append(priority)
+            self._timestamps.append(epoch)
+            self._flags.append(flags)
+            self._ids.append(email_id)
+            self._index[email_id] = row
+            return row
+
+    def extend(self, emails) -> int:
+        """Add many emails; returns the number added"""
+        count = 0
+        for email in emails:
+            self.add(email)
+            count += 1
+        return count
+
+    def set_unread(self, row: int, unread: bool):
+        if unread:
+            self._flags[row] |= FLAG_UNREAD
+        else:
+            self._flags[row] &= ~FLAG_UNREAD & 0xFF
+
+    def set_classification(self, row: int, category: Optional[str]):
+        self._category_codes[row] = self.categories.encode(category) if category else -1
+
+    def delete(self, row: int) -> bool:
+        """
+        Tombstone a row; its id stops resolving but the row number stays taken
+
+        Returns:
+            bool: False if it was already deleted
+        """
+        if self._flags[row] & FLAG_DELETED:
+            return False
+        self._flags[row] |= FLAG_DELETED
+        del self._index[self._ids[row]]
+        self.deleted += 1
+        return True
+
+    def _encode_body(self, body: str):
+        data = body.encode('utf-8')
+        if self.compress and len(data) >= COMPRESS_MIN_BYTES:
+            packed = zlib.compress(data, self.compress_level)
+            if len(packed) < len(data):
+                return packed, FLAG_COMPRESSED
+        return data, 0
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def row_of(self, email_id: str) -> Optional[int]:
+        return self._index.get(email_id)
+
+    def email_id(self, row: int) -> str:
+        return self._ids[row]
+
+    def sender(self, row: int) -> str:
+        return self.senders.decode(self._sender_codes[row])
+
+    def subject(self, row: int) -> str:
+        return self._subjects[row]
+
+    def body(self, row: int) -> str:
+        data = self._bodies[row]
+        if self._flags[row] & FLAG_COMPRESSED:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    def timestamp(self, row: int) -> int:
+        return self._timestamps[row]
+
+    def unread(self, row: int) -> bool:
+        return bool(self._flags[row] & FLAG_UNREAD)
+
+    def is_deleted(self, row: int) -> bool:
+        return bool(self._flags[row] & FLAG_DELETED)
+
+    def classification(self, row: int) -> Optional[str]:
+        code = self._category_codes[row]
+        return self.categories.decode(code) if code >= 0 else None
+
+    def to_dict(self, row: int) -> Dict:
+        """Materialize one email in the API's dict shape"""
+        priority = self._priorities[row]
+        return {
+            'id': self._ids[row],
+            'sender': self.sender(row),
+            'subject': self._subjects[row],
+            'body': self.body(row),
+            'timestamp': datetime.fromtimestamp(self._timestamps[row]).isoformat(),
+            'unread': self.unread(row),
+            'classification': self.classification(row),
+            'priority': priority if priority >= 0 else None
+        }
+
+    def get(self, email_id: str) -> Optional[Dict]:
+        row = self._index.get(email_id)
+        return self.to_dict(row) if row is not None else None
+
+    def iter_dicts(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict]:
+        """Materialize the live rows in [start, stop) one at a time"""
+        stop = len(self._ids) if stop is None else min(stop, len(self._ids))
+        flags = self._flags
+        for row in range(start, stop):
+            if not flags[row] & FLAG_DELETED:
+                yield self.to_dict(row)
+
+    def page(self, offset: int = 0, limit: int = 50, unread: Optional[bool] = None,
+             category: Optional[str] = None) -> List[int]:
+        """
+        Rows of one page of the inbox, most recently stored first
+
+        Order is insertion order, which for received mail is arrival order;
+        the emails' own timestamps are not consulted, so an email stored
+        late with an old Date header still comes first.
+
+        Without filters or deletions this is a direct slice; otherwise the
+        flag and category columns are scanned from the newest row until the
+        page is filled.
+
+        Args:
+            offset (int): Number of matching emails to skip
+            limit (int): Page size
+            unread (bool): Only unread (True) or read (False) emails
+            category (str): Only emails with this classification
+
+        Returns:
+            list: Row numbers
+        """
+        size = len(self._ids)
+        if unread is None and category is None and not self.deleted:
+            first = size - 1 - offset
+            return list(range(first, max(first - limit, -1), -1))
+
+        return list(islice(self._matching(unread, category, newest_first=True), offset, offset + limit))
+
+    def count(self, unread: Optional[bool] = None, category: Optional[str] = None) -> int:
+        """Number of live emails matching the filters"""
+        if unread is None and category is None:
+            return self.live
+        return sum(1 for _ in self._matching(unread, category))
+
+    def _matching(self, unread: Optional[bool], category: Optional[str],
+                  newest_first: bool = False) -> Iterator[int]:
+        """Live rows matching the filters"""
+        category_code = self.categories.code_of(category) if category is not None else None
+        if category is not None and category_code is None:
+            return
+        flags, categories = self._flags, self._category_codes
+        rows = range(len(self._ids) - 1, -1, -1) if newest_first else range(len(self._ids))
+        for row in rows:
+            flag = flags[row]
+            if flag & FLAG_DELETED:
+                continue
+            if unread is not None and bool(flag & FLAG_UNREAD) != unread:
+                continue
+            if category_code is not None and categories[row] != category_code:
+                continue
+            yield row
+
+
+def _to_epoch(timestamp) -> int:
+    """Epoch seconds of a timestamp; ValueError if it cannot be stored"""
+    try:
+        if timestamp is None:
+            epoch = int(datetime.now().timestamp())
+        elif isinstance(timestamp, datetime):
+            epoch = int(timestamp.timestamp())
+        elif isinstance(timestamp, str):
+            epoch = int(datetime.fromisoformat(timestamp).timestamp())
+        else:
+            epoch = int(timestamp)
+        # Rows are read back through fromtimestamp, so it must accept them
+        datetime.fromtimestamp(epoch)
+    except (OverflowError, OSError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid timestamp: {timestamp!r}") from e
+    return epoch
@@ -3,37 +3,276 @@ Context-Aware Digital Twin Email Assistant - Main Backend Application
 Flask-based REST API server for email management and AI-driven automation
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify
 from flask_cors import CORS
+from werkzeug.local import LocalProxy
+import json
 import logging
-from email_client import EmailClient
-from classifier import EmailClassifier
-from openai_client import OpenAIClient
-from db import Database
-from config import Config
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import partial
+from typing import Dict
+from admission import AdmissionRejected, draft_key
+from changes import EMAIL_REMOVED, compact
+from export import ACTION_FIELDS, EMAIL_FIELDS, FORMATS, GZIP_CONTENT_TYPE, encode, iter_emails
+from components import Components
+from config import ConfigView, load_config
+from logging_utils import get_logger
+from mailstore import DuplicateEmailError
+from metrics import REGISTRY, CONTENT_TYPE, MetricsRegistry
+from profiler import PROFILER
+
+logger = get_logger(__name__)
+
+# Routes are registered on a blueprint so that create_app() can build any
+# number of independently configured apps
+api = Blueprint('api', __name__)
+
+# Components of the current app, constructed on first use
+components = LocalProxy(lambda: current_app.extensions['components'])
+email_client = LocalProxy(lambda: components.email_client)
+classifier = LocalProxy(lambda: components.classifier)
+openai_client = LocalProxy(lambda: components.openai_client)
+db = LocalProxy(lambda: components.db)
+draft_admission = LocalProxy(lambda: components.draft_admission)
+draft_flights = LocalProxy(lambda: components.draft_flights)
+prefetcher = LocalProxy(lambda: components.prefetcher)
+prompt_builder = LocalProxy(lambda: components.prompt_builder)
+similarity = LocalProxy(lambda: components.similarity)
+digests = LocalProxy(lambda: components.digest)
+shadow = LocalProxy(lambda: components.shadow)
+
+# Request metrics
+REQUEST_SECONDS = REGISTRY.histogram(
+    'altme_http_request_duration_seconds', 'HTTP request latency', ('method', 'route', 'status')
 )
-logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)  # Enable Cross-Origin Resource Sharing
+# Longest /debug/profile capture window
+MAX_CAPTURE_SECONDS = 60.0
+
+
+def _build_email_client(config):
+    from email_client import EmailClient
+    return EmailClient(
+        compress_bodies=config.EMAIL_COMPRESS_BODIES,
+        change_feed_capacity=config.EMAIL_CHANGE_FEED_CAPACITY
+    )
+
+
+def _build_classifier(config):
+    from classifier import EmailClassifier
+    return EmailClassifier(
+        rules_path=config.CLASSIFIER_RULES_PATH,
+        watch_rules=config.CLASSIFIER_RULES_WATCH,
+        reload_interval=config.CLASSIFIER_RULES_RELOAD_SECONDS,
+        sender_fast_path=config.CLASSIFIER_SENDER_FAST_PATH,
+        sender_min_support=config.CLASSIFIER_SENDER_MIN_SUPPORT,
+        sender_min_share=config.CLASSIFIER_SENDER_MIN_SHARE,
+        sender_sample_rate=config.CLASSIFIER_SENDER_SAMPLE_RATE
+    )
+
+
+def _build_openai_client(config):
+    from openai_client import OpenAIClient
+    return OpenAIClient(api_key=config.OPENAI_API_KEY or None)
+
 
-# Load configuration
-app.config.from_object(Config)
+def _build_shadow(config, app_components: Components):
+    from shadow import ShadowEvaluator
+    candidate = baseline = None
+    if config.SHADOW_RULES_PATH:
+        from classifier import EmailClassifier
+        # Content-only scans: the candidate neither learns nor records live metrics
+        candidate = EmailClassifier(
+            rules_path=config.SHADOW_RULES_PATH,
+            watch_rules=config.CLASSIFIER_RULES_WATCH,
+            reload_interval=config.CLASSIFIER_RULES_RELOAD_SECONDS,
+            sender_fast_path=False
+        ).scan
+        # Live fast-path answers are re-scanned by content before comparing
+        baseline = app_components.classifier.scan
+    return ShadowEvaluator.from_config(config, candidate, baseline=baseline)
+
+
+def _build_database(config):
+    from db import Database
+    return Database.from_config(config)
+
+
+def _build_draft_admission(config):
+    from admission import AdmissionController
+    return AdmissionController.from_config(config)
+
+
+def _build_draft_flights(config):
+    from admission import SingleFlight
+    return SingleFlight()
+
+
+def _build_prompt_builder(config, app_components: Components):
+    from prompt import PromptBuilder
+    return PromptBuilder.from_config(
+        config,
+        threads=app_components.email_client.thread,
+        examples=app_components.db.recent_replies,
+        preferences=app_components.db.get_user_preferences
+    )
+
+
+def _build_prefetcher(config, app_components: Components):
+    from prefetch import DraftPrefetcher
+    client = app_components.email_client
+    openai = app_components.openai_client
+    builder = app_components.prompt_builder
+
+    prefetch = DraftPrefetcher.from_config(
+        config, openai.generate_reply, app_components.classifier.classify, build_prompt=builder.build
+    )
+
+    # Newly arriving mail is offered as it lands; the most recent stored
+    # mail is offered once at startup
+    client.subscribe(prefetch.offer)
+    prefetch.offer_many(client.store.iter_dicts(max(0, len(client.store) - config.PREFETCH_SCAN_LIMIT)))
+    return prefetch
+
+
+def _build_digest(config, app_components: Components):
+    from digest import DigestQueue
+    client = app_components.email_client
+    database = app_components.db
+    queue = DigestQueue.from_config(
+        config,
+        app_components.openai_client.summarize_digest,
+        app_components.classifier.classify,
+        working_hours=lambda: database.get_user_preferences(config.DIGEST_USER_ID).working_hours
+    )
+
+    # Low-priority mail is collected as it lands; recent stored mail once at startup
+    client.subscribe(queue.offer)
+    queue.offer_many(client.store.iter_dicts(max(0, len(client.store) - config.DIGEST_SCAN_LIMIT)))
+    return queue
+
+
+def _build_similarity(config, app_components: Components):
+    from similarity import SimilarityIndex
+    client = app_components.email_client
+    index = SimilarityIndex(client.store, cache_bytes=int(config.SIMILARITY_CACHE_MB * (1 << 20)))
+
+    # Embeddings are computed as each new email is ingested; stored mail is
+    # indexed in the background so the first query does not wait for it
+    client.subscribe(index.add_email)
+    index.start_build()
+    return index
+
+
+COMPONENT_FACTORIES = {
+    'email_client': _build_email_client,
+    'classifier': _build_classifier,
+    'openai_client': _build_openai_client,
+    'db': _build_database,
+    'draft_admission': _build_draft_admission,
+    'draft_flights': _build_draft_flights,
+}
+
+
+def create_app(config_object=None, warmup: bool = False, preload: bool = False) -> Flask:
+    """
+    Application factory
+
+    Components are built lazily on first use. `warmup` builds them before the
+    app is returned; `preload` additionally freezes the heap so that forked
+    workers share the preloaded state copy-on-write, e.g.:
+
+        gunicorn --preload 'main:create_app(preload=True)'
+
+    Args:
+        config_object: Configuration class or object (default: load_config())
+        warmup (bool): Construct all components now
+        preload (bool): Construct all components and gc.freeze() for pre-fork servers
+
+    Returns:
+        Flask: Configured application
+    """
+    started = time.perf_counter()
+
+    app = Flask(__name__)
+    app.config.from_object(config_object if config_object is not None else load_config())
+    CORS(app)  # Enable Cross-Origin Resource Sharing
+
+    logging.basicConfig(
+        level=getattr(logging, app.config.get('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # Components read this app's config, not the process-wide defaults
+    config = ConfigView(app.config)
+    factories = {name: partial(factory, config) for name, factory in COMPONENT_FACTORIES.items()}
+    app_components = Components(dict(
+        factories,
+        prompt_builder=lambda: _build_prompt_builder(config, app_components),
+        prefetcher=lambda: _build_prefetcher(config, app_components),
+        shadow=lambda: _build_shadow(config, app_components),
+        similarity=lambda: _build_similarity(config, app_components),
+        digest=lambda: _build_digest(config, app_components)
+    ))
+    app.extensions['components'] = app_components
+    app.register_blueprint(api)
+
+    # Size gauges describe this app's components, so each app has its own;
+    # they must not force a lazy component into existence
+    app_metrics = MetricsRegistry()
+    app_metrics.gauge('altme_db_actions', 'Actions held by the database').set_function(
+        lambda: len(app_components.db.actions) if app_components.is_loaded('db') else 0
+    )
+    app_metrics.gauge('altme_emails_cached', 'Emails held by the email client').set_function(
+        lambda: len(app_components.email_client.store) if app_components.is_loaded('email_client') else 0
+    )
+    app.extensions['metrics'] = app_metrics
 
-# Initialize components
-email_client = EmailClient()
-classifier = EmailClassifier()
-openai_client = OpenAIClient()
-db = Database()
+    if preload:
+        app_components.preload_for_fork()
+    elif warmup:
+        app_components.warmup()
 
+    logger.info("App created in %.1f ms", (time.perf_counter() - started) * 1000)
+    return app
 
-@app.route('/', methods=['GET'])
+
+@api.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    if not request.path.startswith(('/metrics', '/debug/')) and components.is_loaded('prefetcher'):
+        prefetcher.note_activity()
+    config = current_app.config
+    if config['PROFILE_ENABLED'] and not request.path.startswith('/debug/'):
+        PROFILER.begin(
+            request.url_rule.rule if request.url_rule else 'unmatched', request.headers,
+            sample_rate=config['PROFILE_SAMPLE_RATE'],
+            debug_header=config['PROFILE_DEBUG_HEADER'],
+            interval_ms=config['PROFILE_INTERVAL_MS']
+        )
+
+
+@api.teardown_app_request
+def stop_profiler(error=None):
+    PROFILER.end()
+
+
+@api.after_app_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+
+@api.route('/', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
@@ -43,16 +282,103 @@ def health_check():
     }), 200
 
 
-@app.route('/fetch_emails', methods=['GET'])
+@api.route('/debug/startup', methods=['GET'])
+def debug_startup():
+    """Construction time per component, in milliseconds"""
+    return jsonify({
+        'success': True,
+        'components': {
+            name: round(seconds * 1000, 3)
+            for name, seconds in components.startup_report().items()
+        }
+    }), 200
+
+
+@api.route('/debug/prefetch', methods=['GET'])
+def debug_prefetch():
+    """Draft prefetch hit rate, waste and budget, for tuning its thresholds"""
+    return jsonify({
+        'success': True,
+        'prefetch': prefetcher.stats()
+    }), 200
+
+
+@api.route('/debug/classifier', methods=['GET'])
+def debug_classifier():
+    """Live rule version and sender fast-path statistics"""
+    return jsonify({
+        'success': True,
+        'rule_version': classifier.rules.current.version,
+        'sender_fast_path': classifier.sender_stats()
+    }), 200
+
+
+@api.route('/debug/shadow', methods=['GET'])
+def debug_shadow():
+    """Agreement, confusion counts and latency of the live vs the shadow classifier"""
+    return jsonify({
+        'success': True,
+        'shadow': shadow.stats()
+    }), 200
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(REGISTRY.render() + current_app.extensions['metrics'].render(), content_type=CONTENT_TYPE)
+
+
+@api.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """
+    Collapsed-stack profile (flamegraph.pl / speedscope input)
+    Query: route=<route template>, seconds=<capture window; 0 = samples so far>,
+    format=collapsed|json
+
+    A capture window is opened without waiting for it (202); fetch the
+    stacks with another request once it has closed.
+    """
+    if not current_app.config['PROFILE_ENABLED']:
+        return not_found(None)
+
+    route = request.args.get('route', '')
+    try:
+        seconds = min(float(request.args.get('seconds', '0')), MAX_CAPTURE_SECONDS)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'seconds must be a number'
+        }), 400
+
+    if seconds > 0:
+        return jsonify({
+            'success': True,
+            'route': route or None,
+            'capturing_seconds': PROFILER.start_capture(route, seconds)
+        }), 202
+
+    stacks = PROFILER.collapsed(route)
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'route': route or None,
+            'stacks': stacks.splitlines(),
+            'spans': PROFILER.span_summary(route)
+        }), 200
+
+    return Response(stacks, content_type='text/plain; charset=utf-8')
+
+
+@api.route('/fetch_emails', methods=['GET'])
 def fetch_emails():
     """
     Fetch emails from the email client (currently mocked)
     Returns a list of email objects with metadata
     """
     try:
-        logger.info("Fetching emails...")
         emails = email_client.fetch_emails()
-        logger.info(f"Successfully fetched {len(emails)} emails")
+        logger.debug("Fetched %d emails", len(emails))
 
         return jsonify({
             'success': True,
@@ -68,11 +394,276 @@ def fetch_emails():
         }), 500
 
 
-@app.route('/classify', methods=['POST'])
+def _parse_bool(value):
+    """Optional boolean query parameter"""
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _classified(row: int) -> Dict:
+    """Materialize a stored email, classifying it first if AUTO_CLASSIFY is on"""
+    store = email_client.store
+    if store.classification(row) is None and current_app.config.get('AUTO_CLASSIFY'):
+        result = classifier.classify(store.subject(row), store.body(row), store.sender(row))
+        # Cached for later reads; reading does not change the inbox, so nothing is published
+        email_client.set_classification(store.email_id(row), result['category'], publish=False)
+    return store.to_dict(row)
+
+
+@api.route('/emails', methods=['GET'])
+def list_emails():
+    """
+    One page of the inbox, most recently received first
+    Query: offset=<emails to skip>, limit=<page size, max 200>, unread=true|false,
+    category=<classification>
+    The returned "seq" is the change feed position the page reflects: follow
+    /emails/changes?since=<seq> to keep the page current.
+    """
+    try:
+        offset = max(0, int(request.args.get('offset', '0')))
+        limit = max(1, min(int(request.args.get('limit', '50')), 200))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'offset and limit must be integers'
+        }), 400
+
+    try:
+        unread = _parse_bool(request.args.get('unread'))
+        category = request.args.get('category') or None
+        store = email_client.store
+
+        # Read the position first: changes racing with this page are replayed
+        sequence = email_client.changes.sequence
+        emails = [_classified(row) for row in store.page(offset, limit, unread, category)]
+
+        return jsonify({
+            'success': True,
+            'emails': emails,
+            'offset': offset,
+            'limit': limit,
+            'total': store.count(unread, category),
+            'seq': sequence
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error listing emails: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/emails', methods=['POST'])
+def receive_email():
+    """
+    Ingest a newly arrived email (from a mail provider webhook or sync job)
+    Body: { "sender", "subject", "body", "id"?, "timestamp"? (ISO 8601), "unread"? }
+    The email is stored, announced on the change feed and handed to the
+    subscribers (prefetch, digest, similarity) as it lands.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not all(isinstance(data.get(field), str)
+                                             for field in ('sender', 'subject', 'body')):
+        return jsonify({
+            'success': False,
+            'error': 'sender, subject and body must be strings'
+        }), 400
+
+    if not isinstance(data.get('unread', True), bool):
+        return jsonify({
+            'success': False,
+            'error': 'unread must be a boolean'
+        }), 400
+
+    email = {
+        'id': data.get('id') or f"email_{uuid.uuid4().hex[:12]}",
+        'sender': data['sender'],
+        'subject': data['subject'],
+        'body': data['body'],
+        'unread': data.get('unread', True)
+    }
+    try:
+        if data.get('timestamp') is not None:
+            email['timestamp'] = datetime.fromisoformat(str(data['timestamp']))
+            # Dates such as year 1 parse but have no epoch the store can hold
+            email['timestamp'].timestamp()
+    except (OverflowError, OSError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'timestamp must be an ISO 8601 date and time'
+        }), 400
+    if not isinstance(email['id'], str):
+        return jsonify({
+            'success': False,
+            'error': 'id must be a string'
+        }), 400
+
+    try:
+        stored = email_client.receive(email)
+        return jsonify({
+            'success': True,
+            'email': stored,
+            'seq': email_client.changes.sequence
+        }), 201
+
+    except DuplicateEmailError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
+
+    except ValueError as e:
+        # A field the store cannot hold
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error receiving email: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+def _change_events(client, changes):
+    """Changes as client events, with the email's current state for additions and updates"""
+    store = client.store
+    events = []
+    for sequence, operation, email_id in compact(changes):
+        row = store.row_of(email_id) if operation != EMAIL_REMOVED else None
+        if row is None:
+            events.append({'seq': sequence, 'op': EMAIL_REMOVED, 'id': email_id})
+        else:
+            events.append({'seq': sequence, 'op': operation, 'id': email_id, 'email': store.to_dict(row)})
+    return events
+
+
+@api.route('/emails/changes', methods=['GET'])
+def email_changes():
+    """
+    Inbox changes after a sequence number
+    Query: since=<last applied seq>, timeout=<long-poll seconds, max 30>
+    With Accept: text/event-stream the response is an SSE stream of "change"
+    events (resuming from Last-Event-ID on reconnect); otherwise it is a
+    long-poll returning as soon as there is at least one change. "reset"
+    means the client fell too far behind and must reload /emails.
+    """
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', '0'))
+        timeout = max(0.0, min(float(request.args.get('timeout', '25')), 30.0))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'since and timeout must be numbers'
+        }), 400
+
+    client = email_client._get_current_object()
+    feed = client.changes
+
+    if 'text/event-stream' not in request.headers.get('Accept', ''):
+        changes, sequence, reset = feed.wait(since, timeout)
+        return jsonify({
+            'success': True,
+            'changes': _change_events(client, changes),
+            'seq': sequence,
+            'reset': reset
+        }), 200
+
+    keepalive = current_app.config['EMAIL_CHANGE_KEEPALIVE_SECONDS']
+
+    def stream(position):
+        while True:
+            changes, sequence, reset = feed.wait(position, keepalive)
+            if reset:
+                yield f"event: reset\ndata: {json.dumps({'seq': sequence})}\n\n"
+            elif not changes:
+                yield ': keepalive\n\n'
+            for event in _change_events(client, changes):
+                yield f"id: {event['seq']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+            position = sequence
+
+    return Response(
+        stream(since),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@api.route('/emails/<email_id>', methods=['DELETE'])
+def delete_email(email_id):
+    """Remove an email from the inbox"""
+    if not email_client.delete_email(email_id):
+        return jsonify({
+            'success': False,
+            'error': f"Email not found: {email_id}"
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'id': email_id
+    }), 200
+
+
+@api.route('/emails/<email_id>/similar', methods=['GET'])
+def similar_emails(email_id):
+    """
+    Find emails similar to a stored email (earlier invoices from the same
+    vendor, earlier messages on the same topic)
+    Query: k=<number of results, default 10, max 50>
+    """
+    try:
+        k = int(request.args.get('k', '10'))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'k must be an integer'
+        }), 400
+    k = max(1, min(k, 50))
+
+    try:
+        hits = similarity.similar(email_id, k)
+        if hits is None:
+            return jsonify({
+                'success': False,
+                'error': f"Email not found: {email_id}"
+            }), 404
+
+        store = email_client.store
+        results = []
+        for similar_id, score in hits:
+            row = store.row_of(similar_id)
+            results.append({
+                'id': similar_id,
+                'sender': store.sender(row),
+                'subject': store.subject(row),
+                'timestamp': datetime.fromtimestamp(store.timestamp(row)).isoformat(),
+                'similarity': score
+            })
+
+        return jsonify({
+            'success': True,
+            'id': email_id,
+            'count': len(results),
+            'similar': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error finding similar emails: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/classify', methods=['POST'])
 def classify_email():
     """
     Classify an email based on its content
-    Expects JSON: { "subject": "...", "body": "..." }
+    Expects JSON: { "subject": "...", "body": "...", "sender": "..." (optional) }
     """
     try:
         data = request.get_json()
@@ -86,14 +677,20 @@ def classify_email():
         subject = data['subject']
         body = data['body']
 
-        logger.info(f"Classifying email: {subject}")
-        classification = classifier.classify(subject, body)
+        logger.debug("Classifying email: %s", subject)
+        started = time.perf_counter()
+        # Arbitrary client input is classified but not learned from
+        classification = classifier.classify(subject, body, data.get('sender'), learn=False)
+        # Sampled inputs are replayed through the candidate classifier off the request path
+        shadow.submit(subject, body, data.get('sender'), classification, time.perf_counter() - started)
 
         return jsonify({
             'success': True,
             'classification': classification['category'],
             'confidence': classification['confidence'],
-            'keywords': classification.get('keywords', [])
+            'keywords': classification.get('keywords', []),
+            'rule_version': classification.get('rule_version'),
+            'fast_path': classification.get('fast_path', False)
         }), 200
 
     except Exception as e:
@@ -104,7 +701,48 @@ def classify_email():
         }), 500
 
 
-@app.route('/generate_reply', methods=['POST'])
+def _user_id(data=None) -> str:
+    """Caller identity for per-user limits (X-User-Id header or user_id field)"""
+    return request.headers.get('X-User-Id') or (data or {}).get('user_id') or 'anonymous'
+
+
+def _generate_draft(user_id: str, subject: str, body: str, sender: str, email_id: str = None):
+    """
+    Generate a draft under admission control
+
+    The prompt is packed into the input token budget first, so its size
+    (rather than the raw email's) is what gets charged. Identical
+    concurrent requests share one generation, and only that one
+    generation is charged against the rate limits and cost budgets.
+
+    Returns:
+        tuple: (reply, coalesced)
+    """
+    client = openai_client._get_current_object()
+    admission = draft_admission._get_current_object()
+    prompt = prompt_builder.build(subject, body, sender, user_id=user_id, email_id=email_id)
+    cost = prompt['tokens'] + current_app.config.get('MAX_TOKENS', 150)
+
+    def generate():
+        with admission.admit(user_id, cost):
+            return client.generate_reply(subject, body, sender, prompt=prompt)
+
+    return draft_flights.do(draft_key(subject, body, sender, prompt['tone']), generate)
+
+
+def _rejected(error: AdmissionRejected):
+    """429 response for a shed request"""
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'reason': error.reason,
+        'retry_after': round(error.retry_after, 3)
+    })
+    response.headers['Retry-After'] = error.retry_after_header
+    return response, 429
+
+
+@api.route('/generate_reply', methods=['POST'])
 def generate_reply():
     """
     Generate an AI-powered reply to an email
@@ -123,14 +761,24 @@ def generate_reply():
         body = data['body']
         sender = data.get('sender', 'Unknown')
 
-        logger.info(f"Generating reply for email: {subject}")
-        reply = openai_client.generate_reply(subject, body, sender)
+        logger.debug("Generating reply for email: %s", subject)
+        user_id = _user_id(data)
+        reply = prefetcher.take(subject, body, sender, prompt_builder.tone_for(user_id))
+        prefetched = reply is not None
+        coalesced = False
+        if not prefetched:
+            reply, coalesced = _generate_draft(user_id, subject, body, sender, data.get('email_id'))
 
         return jsonify({
             'success': True,
-            'reply': reply
+            'reply': reply,
+            'coalesced': coalesced,
+            'prefetched': prefetched
         }), 200
 
+    except AdmissionRejected as e:
+        return _rejected(e)
+
     except Exception as e:
         logger.error(f"Error generating reply: {str(e)}")
         return jsonify({
@@ -139,11 +787,189 @@ def generate_reply():
         }), 500
 
 
-@app.route('/save', methods=['POST'])
+def _batch_items(data):
+    """
+    Resolve a batch request into email dicts
+
+    Returns:
+        tuple: (emails, missing ids)
+    """
+    emails, missing = [], []
+    for email_id in data.get('email_ids') or []:
+        email = email_client.fetch_email_by_id(email_id)
+        if email is None:
+            missing.append(email_id)
+        else:
+            emails.append(email)
+
+    for index, email in enumerate(data.get('emails') or []):
+        if not isinstance(email, dict) or 'subject' not in email or 'body' not in email:
+            raise ValueError(f"emails[{index}] needs subject and body")
+        emails.append(dict(email, id=email.get('id', f"item_{index}")))
+
+    return emails, missing
+
+
+def _format_event(item: Dict, sse: bool) -> str:
+    payload = json.dumps(item)
+    if sse:
+        return f"event: {'done' if item.get('done') else 'draft'}\ndata: {payload}\n\n"
+    return payload + '\n'
+
+
+@api.route('/generate_reply/batch', methods=['POST'])
+def generate_reply_batch():
+    """
+    Generate drafts for many emails, streaming each one as it completes
+    Expects JSON: { "email_ids": [...] } and/or { "emails": [{ "subject", "body", "sender", "id" }] },
+    optional "concurrency". Responds with NDJSON, or SSE when the client
+    accepts text/event-stream. Emails classified as not needing a reply are
+    reported as skipped without a model call; the last event has "done": true.
+    """
+    try:
+        data = request.get_json()
+        if not data or not (data.get('email_ids') or data.get('emails')):
+            return jsonify({
+                'success': False,
+                'error': 'Missing required field: email_ids or emails'
+            }), 400
+
+        emails, missing = _batch_items(data)
+        max_batch = current_app.config['DRAFT_BATCH_MAX_SIZE']
+        if len(emails) > max_batch:
+            return jsonify({
+                'success': False,
+                'error': f"Batch too large: {len(emails)} emails (max {max_batch})"
+            }), 400
+
+        max_concurrency = current_app.config['DRAFT_BATCH_CONCURRENCY']
+        try:
+            concurrency = max(1, min(int(data.get('concurrency', max_concurrency)), max_concurrency))
+        except (TypeError, ValueError):
+            raise ValueError('concurrency must be an integer') from None
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    skip_categories = set(current_app.config['DRAFT_BATCH_SKIP_CATEGORIES'])
+    user_id = _user_id(data)
+    sse = 'text/event-stream' in request.headers.get('Accept', '')
+    app = current_app._get_current_object()
+    email_classifier = classifier._get_current_object()
+    prefetch = prefetcher._get_current_object()
+    tone = prompt_builder.tone_for(user_id)
+
+    def draft(email):
+        category = email.get('classification') or email_classifier.classify(
+            email['subject'], email['body'], email.get('sender'), learn=False
+        )['category']
+        if category in skip_categories:
+            return {'id': email['id'], 'status': 'skipped', 'category': category}
+
+        sender = email.get('sender', 'Unknown')
+        reply = prefetch.take(email['subject'], email['body'], sender, tone)
+        if reply is not None:
+            return {'id': email['id'], 'status': 'ok', 'category': category,
+                    'reply': reply, 'coalesced': False, 'prefetched': True}
+
+        with app.app_context():
+            try:
+                reply, coalesced = _generate_draft(user_id, email['subject'], email['body'], sender, email['id'])
+            except AdmissionRejected as e:
+                return {'id': email['id'], 'status': 'rejected', 'category': category,
+                        'reason': e.reason, 'retry_after': round(e.retry_after, 3)}
+        return {'id': email['id'], 'status': 'ok', 'category': category,
+                'reply': reply, 'coalesced': coalesced, 'prefetched': False}
+
+    def stream():
+        started = time.perf_counter()
+        counts = {'ok': 0, 'skipped': 0, 'rejected': 0, 'error': 0, 'missing': len(missing)}
+
+        for email_id in missing:
+            yield _format_event({'id': email_id, 'status': 'missing'}, sse)
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='draft-batch')
+        try:
+            futures = {executor.submit(draft, email): email['id'] for email in emails}
+            for future in as_completed(futures):
+                try:
+                    item = future.result()
+                except Exception as e:
+                    logger.error(f"Error generating batch reply: {str(e)}")
+                    item = {'id': futures[future], 'status': 'error', 'error': str(e)}
+                counts[item['status']] += 1
+                yield _format_event(item, sse)
+
+            yield _format_event({
+                'done': True,
+                'counts': counts,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+            }, sse)
+        finally:
+            # Client disconnects close the generator: drop work not yet started
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(
+        stream(),
+        content_type='text/event-stream' if sse else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _with_email_timestamp(data):
+    """
+    Copy of an action with the email's arrival time filled in, so analytics
+    can compute time-to-action
+    """
+    if not isinstance(data, dict) or 'email_timestamp' in data or not isinstance(data.get('email_id'), str):
+        return data
+
+    row = email_client.store.row_of(data['email_id'])
+    if row is None:
+        return data
+    return dict(data, email_timestamp=email_client.store.timestamp(row))
+
+
+@api.route('/digest', methods=['GET'])
+def get_digest():
+    """
+    Grouped summaries of low-priority mail, newest first
+    Query: limit (digests to return, default 1), flush=true to close the open window now
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 1)), 20))
+        flushed = digests.flush() if _parse_bool(request.args.get('flush')) else None
+
+        return jsonify({
+            'success': True,
+            'digests': digests.digests(limit),
+            'flushed': flushed is not None,
+            'pending': digests.pending()
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error building digest: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/save', methods=['POST'])
 def save_action():
     """
     Save user actions and AI decisions to database
-    Expects JSON: { "email_id": "...", "classification": "...", "reply": "...", "action": "..." }
+    Expects JSON: { "email_id": "...", "classification": "...", "reply": "...", "action": "...",
+    "idempotency_key": "..." }
     """
     try:
         data = request.get_json()
@@ -154,15 +980,24 @@ def save_action():
                 'error': 'Missing required field: email_id'
             }), 400
 
-        logger.info(f"Saving action for email: {data['email_id']}")
-        result = db.save_action(data)
+        logger.debug("Saving action for email: %s", data['email_id'])
+        result = db.save_action(_with_email_timestamp(data))
+        if not result['duplicate']:
+            _apply_confirmations([data], [{'status': 'created'}])
 
         return jsonify({
             'success': True,
-            'message': 'Action saved successfully',
-            'id': result.get('id')
+            'message': 'Action already saved' if result['duplicate'] else 'Action saved successfully',
+            'id': result.get('id'),
+            'duplicate': result['duplicate']
         }), 200
 
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
     except Exception as e:
         logger.error(f"Error saving action: {str(e)}")
         return jsonify({
@@ -171,7 +1006,108 @@ def save_action():
         }), 500
 
 
-@app.route('/stats', methods=['GET'])
+# Actions after which the email no longer needs attention
+READ_ACTIONS = ('sent', 'approved', 'archived')
+
+
+def _apply_confirmations(items, results):
+    """
+    Reflect newly saved actions in the inbox and the classifier's sender
+    history: a confirmed category is stored on the email and learned for its
+    sender, and handled emails are marked read
+    """
+    store = email_client.store
+    for item, result in zip(items, results):
+        if result['status'] != 'created':
+            continue
+        row = store.row_of(item['email_id'])
+        if row is None:
+            continue
+
+        if item.get('classification'):
+            classifier.learn_sender(store.sender(row), item['classification'])
+            email_client.set_classification(item['email_id'], item['classification'])
+        if item.get('action') in READ_ACTIONS:
+            email_client.mark_as_read(item['email_id'])
+
+
+def _read_action_batch(limit: int):
+    """
+    Parse a /save/batch body: an NDJSON stream, a JSON array, or { "actions": [...] }
+
+    Lines that are not valid JSON are passed through as errors so they get
+    a per-item result like any other invalid action.
+
+    Raises:
+        ValueError: If the body is malformed or holds more than `limit` actions
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/jsonlines'):
+        batch = []
+        for number, line in enumerate(request.stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if len(batch) >= limit:
+                raise ValueError(f"Batch too large (max {limit} actions)")
+            try:
+                batch.append(json.loads(line))
+            except ValueError:
+                batch.append(ValueError(f"line {number} is not valid JSON"))
+        return batch
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('actions')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of actions, { "actions": [...] } or NDJSON')
+    if len(data) > limit:
+        raise ValueError(f"Batch too large: {len(data)} actions (max {limit})")
+    return data
+
+
+@api.route('/save/batch', methods=['POST'])
+def save_actions_batch():
+    """
+    Save many actions in one request and one storage transaction
+    Accepts a JSON array, { "actions": [...] }, or an NDJSON body
+    (Content-Type: application/x-ndjson). Each action is validated as a
+    UserAction; actions repeating an "idempotency_key" already used are
+    reported as duplicates with the original ID instead of being saved again.
+    """
+    try:
+        batch = _read_action_batch(current_app.config['SAVE_BATCH_MAX_ITEMS'])
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    try:
+        parse_errors = {index: str(item) for index, item in enumerate(batch) if isinstance(item, ValueError)}
+        results = db.save_actions(_with_email_timestamp(item) for item in batch)
+        for index, error in parse_errors.items():
+            results[index] = {'index': index, 'status': 'invalid', 'error': error}
+        _apply_confirmations(batch, results)
+
+        counts = {'created': 0, 'duplicate': 0, 'invalid': 0}
+        for result in results:
+            counts[result['status']] += 1
+
+        return jsonify({
+            'success': True,
+            'counts': counts,
+            'results': results
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error saving action batch: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/stats', methods=['GET'])
 def get_stats():
     """
     Get user statistics and productivity metrics
@@ -181,7 +1117,10 @@ def get_stats():
 
         return jsonify({
             'success': True,
-            'stats': stats
+            'stats': stats,
+            'retention': db.retention_stats(),
+            # Reported once drafts have been requested; /stats does not build the controller
+            'admission': draft_admission.status() if components.is_loaded('draft_admission') else None
         }), 200
 
     except Exception as e:
@@ -192,7 +1131,210 @@ def get_stats():
         }), 500
 
 
-@app.errorhandler(404)
+@api.route('/preferences', methods=['GET'])
+def get_preferences():
+    """
+    Get the caller's preferences (X-User-Id header or user_id query parameter)
+    """
+    try:
+        user_id = request.headers.get('X-User-Id') or request.args.get('user_id') or 'anonymous'
+        return jsonify({
+            'success': True,
+            'preferences': db.get_user_preferences(user_id).to_dict()
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error fetching preferences: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/preferences', methods=['POST'])
+def save_preferences():
+    """
+    Update the caller's preferences
+    Expects JSON with any of: auto_classify, auto_reply_promotional,
+    notification_important, preferred_tone, working_hours
+    """
+    try:
+        data = request.get_json(silent=True)
+        preferences = db.get_user_preferences(_user_id(data if isinstance(data, dict) else None)).updated(data)
+        db.save_user_preferences(preferences)
+
+        return jsonify({
+            'success': True,
+            'preferences': preferences.to_dict()
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error saving preferences: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+def _parse_time(value):
+    """Parse an epoch-seconds or ISO-8601 query parameter"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _export_response(records, fields, dataset: str):
+    """
+    Streamed export in the requested format
+
+    With gzip the body is a .gz file (application/gzip), not a transfer
+    encoding, so clients save it compressed instead of unpacking it.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    gzip = _parse_bool(request.args.get('gzip')) or False
+    chunks = encode(records, fmt, fields, dataset, gzip)
+
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    headers = {
+        'Content-Disposition': f"attachment; filename={dataset}.{extension}{'.gz' if gzip else ''}",
+        'Cache-Control': 'no-cache'
+    }
+    return Response(chunks, content_type=GZIP_CONTENT_TYPE if gzip else FORMATS[fmt], headers=headers)
+
+
+def _export_limit(records, limit):
+    for count, record in enumerate(records):
+        if limit is not None and count >= limit:
+            return
+        yield record
+
+
+@api.route('/export/actions', methods=['GET'])
+def export_actions():
+    """
+    Stream every saved action without building the response in memory
+    Query: format=ndjson|csv, gzip=true, since, until (epoch or ISO),
+    cursor=<id of the last action received, to resume>, limit
+    """
+    try:
+        since = _parse_time(request.args.get('since'))
+        until = _parse_time(request.args.get('until'))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        records = db.iter_actions(since, until, request.args.get('cursor') or None)
+        return _export_response(_export_limit(records, limit), ACTION_FIELDS, 'actions')
+
+    except KeyError:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown cursor: {request.args.get('cursor')}"
+        }), 400
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@api.route('/export/emails', methods=['GET'])
+def export_emails():
+    """
+    Stream every stored email with its classification
+    Query: format=ndjson|csv, gzip=true, since, until (epoch or ISO, by arrival time),
+    category, cursor=<id of the last email received, to resume>, limit
+    """
+    try:
+        since = _parse_time(request.args.get('since'))
+        until = _parse_time(request.args.get('until'))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        store = email_client.store
+
+        after_row = -1
+        cursor = request.args.get('cursor')
+        if cursor:
+            after_row = store.row_of(cursor)
+            if after_row is None:
+                return jsonify({
+                    'success': False,
+                    'error': f"Unknown cursor: {cursor}"
+                }), 400
+
+        records = iter_emails(store, since, until, after_row, request.args.get('category') or None)
+        return _export_response(_export_limit(records, limit), EMAIL_FIELDS, 'emails')
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@api.route('/analytics', methods=['GET'])
+def get_analytics():
+    """
+    Vectorized analytics over the action history
+    Query: query=summary|group_by|percentiles|histogram|rollups, since, until (epoch or ISO),
+    by=category|action, q=50,90,99, interval=hour|day|week, only_replies=true
+    """
+    try:
+        log = db.action_log
+        query = request.args.get('query', 'summary')
+        since = _parse_time(request.args.get('since'))
+        until = _parse_time(request.args.get('until'))
+        by = request.args.get('by')
+
+        started = time.perf_counter()
+        if query == 'summary':
+            result = log.summary(since, until)
+        elif query == 'group_by':
+            result = log.group_by(by or 'category', since, until)
+        elif query == 'percentiles':
+            q = [float(p) for p in request.args.get('q', '50,90,99').split(',')]
+            result = log.percentiles(q, by, since, until)
+        elif query == 'histogram':
+            only_replies = request.args.get('only_replies', 'false').lower() == 'true'
+            result = log.histogram(request.args.get('interval', 'day'), only_replies, since, until)
+        elif query == 'rollups':
+            # Daily summaries of actions past raw retention
+            result = db.get_rollups(since, until)
+        else:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown query: {query}"
+            }), 400
+
+        return jsonify({
+            'success': True,
+            'query': query,
+            'rows': len(log),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3),
+            'result': result
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error running analytics: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
     return jsonify({
@@ -201,7 +1343,7 @@ def not_found(error):
     }), 404
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     return jsonify({
@@ -210,7 +1352,11 @@ def internal_error(error):
     }), 500
 
 
+app = create_app()
+
+
 if __name__ == '__main__':
+    app.extensions['components'].warmup()
     logger.info("Starting Context-Aware Digital Twin Email Assistant...")
     logger.info(f"Environment: {app.config['ENV']}")
 
@@ -0,0 +1,338 @@
+"""
+Metrics Module
+In-process metrics registry exposed in Prometheus text format
+Future: Swap for prometheus_client if multi-process aggregation is needed
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Latency buckets in seconds, from 50us (in-process work) to 10s (model calls)
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _ThreadCells:
+    """
+    Per-thread accumulators for one metric child
+
+    Each thread adds into its own cell (a small list), so a write is an
+    unlocked in-place add that no other thread races with. The lock is only
+    taken when a thread writes for the first time and when a reader sums the
+    cells; cells of finished threads are then folded into `_retired`, so
+    thread churn does not grow the list.
+    """
+
+    __slots__ = ('_local', '_cells', '_retired', '_lock')
+
+    # Registering beyond this many cells first folds away dead threads
+    COMPACT_AT = 32
+
+    def __init__(self, size: int):
+        self._local = threading.local()
+        self._cells: List[Tuple[threading.Thread, list]] = []
+        self._retired = [0] * size
+        self._lock = threading.Lock()
+
+    def cell(self) -> list:
+        """The calling thread's cell"""
+        try:
+            return self._local.cell
+        except AttributeError:
+            return self._register()
+
+    def _register(self) -> list:
+        cell = [0] * len(self._retired)
+        with self._lock:
+            if len(self._cells) >= self.COMPACT_AT:
+                self._compact()
+            self._cells.append((threading.current_thread(), cell))
+        self._local.cell = cell
+        return cell
+
+    def _compact(self):
+        # Called with the lock held; a finished thread never writes again
+        live = []
+        retired = self._retired
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                for index, value in enumerate(cell):
+                    retired[index] += value
+        self._cells = live
+
+    def totals(self) -> list:
+        """Sum of every thread's cell"""
+        with self._lock:
+            self._compact()
+            totals = list(self._retired)
+            for _, cell in self._cells:
+                for index, value in enumerate(cell):
+                    totals[index] += value
+        return totals
+
+
+class _CounterChild:
+    """Monotonic counter for one label combination"""
+
+    __slots__ = ('_cells',)
+
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount: float = 1):
+        self._cells.cell()[0] += amount
+
+    def get(self) -> float:
+        return float(self._cells.totals()[0])
+
+
+class _GaugeChild:
+    """Settable value, or a callback evaluated only at scrape time"""
+
+    __slots__ = ('_value', '_lock', '_function')
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+        self._function = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Report `function()` on every scrape instead of a stored value"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float('nan')
+        return self._value
+
+
+class _HistogramChild:
+    """Fixed-bucket histogram; observe() only bumps the calling thread's counters"""
+
+    __slots__ = ('_bounds', '_cells')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        # One slot per bucket (including +Inf), then the sum
+        self._cells = _ThreadCells(len(bounds) + 2)
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        totals = self._cells.totals()
+        return totals[:-1], float(totals[-1])
+
+
+class _Metric:
+    """Base class for a named metric family with optional labels"""
+
+    kind = 'untyped'
+    child_class = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # Children by the label values exactly as passed, so repeat lookups skip str()
+        self._by_raw: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        """
+        Get the child metric for a label combination
+
+        The lookup is one dict read keyed by the values as passed; label
+        strings are only built, and the lock only taken, the first time a
+        combination is seen.
+        """
+        try:
+            child = self._by_raw.get(values)
+        except TypeError:
+            # Unhashable label values: go through their string form every time
+            return self._child_for(values)
+        if child is None:
+            child = self._child_for(values)
+            self._by_raw[values] = child
+        return child
+
+    def _child_for(self, values: tuple):
+        key = tuple(map(str, values))
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    child_class = _CounterChild
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+    child_class = _GaugeChild
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default.set_function(function)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metric families rendered together at /metrics
+    Registering the same name twice returns the existing metric
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, *args, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+# Process-wide default registry
+REGISTRY = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -3,12 +3,12 @@ Data Models
 Define data structures for emails, actions, and user preferences
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import Optional, List
 from datetime import datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class Email:
     """Email data model"""
     id: str
@@ -80,6 +80,72 @@ class UserAction:
     action_type: str  # 'classify', 'reply', 'archive', 'delete'
     timestamp: datetime
     metadata: Optional[dict] = None
+    idempotency_key: Optional[str] = None
+
+    # Request fields kept in metadata, with the types they may take
+    METADATA_FIELDS = {
+        'classification': (str,),
+        'reply': (str, dict),
+        'email_timestamp': (int, float, str),
+        'confidence': (int, float),
+        'user_id': (str,)
+    }
+    MAX_IDEMPOTENCY_KEY_LENGTH = 200
+
+    @classmethod
+    def from_request(cls, data, action_id: str, timestamp: datetime) -> 'UserAction':
+        """
+        Validate a /save payload and build the action it describes
+
+        Args:
+            data (dict): { "email_id", "action", "classification", "reply", ... }
+            action_id (str): ID to assign
+            timestamp (datetime): Time the action is recorded
+
+        Returns:
+            UserAction: The validated action
+
+        Raises:
+            ValueError: If a field is missing or has the wrong type
+        """
+        if not isinstance(data, dict):
+            raise ValueError('action must be a JSON object')
+
+        email_id = data.get('email_id')
+        if not isinstance(email_id, str) or not email_id:
+            raise ValueError('email_id must be a non-empty string')
+
+        action_type = data.get('action', 'saved')
+        if not isinstance(action_type, str) or not action_type:
+            raise ValueError('action must be a non-empty string')
+
+        key = data.get('idempotency_key')
+        if key is not None and (not isinstance(key, str) or not 0 < len(key) <= cls.MAX_IDEMPOTENCY_KEY_LENGTH):
+            raise ValueError(f"idempotency_key must be a string of 1-{cls.MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+
+        metadata = {}
+        for field, types in cls.METADATA_FIELDS.items():
+            value = data.get(field)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, types):
+                raise ValueError(f"{field} has the wrong type")
+            metadata[field] = value
+
+        if isinstance(metadata.get('email_timestamp'), str):
+            try:
+                datetime.fromisoformat(metadata['email_timestamp'])
+            except ValueError:
+                raise ValueError('email_timestamp must be epoch seconds or ISO-8601')
+
+        return cls(
+            id=action_id,
+            email_id=email_id,
+            action_type=action_type,
+            timestamp=timestamp,
+            metadata=metadata,
+            idempotency_key=key
+        )
 
     def to_dict(self):
         """Convert to dictionary"""
@@ -91,6 +157,19 @@ class UserAction:
             'metadata': self.metadata
         }
 
+    def to_record(self):
+        """Flat stored form, as returned by the /save API's storage"""
+        record = {
+            'id': self.id,
+            'email_id': self.email_id,
+            'action': self.action_type,
+            'timestamp': self.timestamp.isoformat() if isinstance(self.timestamp, datetime) else self.timestamp
+        }
+        record.update(self.metadata or {})
+        if self.idempotency_key is not None:
+            record['idempotency_key'] = self.idempotency_key
+        return record
+
 
 @dataclass
 class UserPreferences:
@@ -112,3 +191,35 @@ class UserPreferences:
             'preferred_tone': self.preferred_tone,
             'working_hours': self.working_hours
         }
+
+    # Updatable fields and their accepted types
+    FIELDS = {
+        'auto_classify': bool,
+        'auto_reply_promotional': bool,
+        'notification_important': bool,
+        'preferred_tone': str,
+        'working_hours': dict
+    }
+
+    def updated(self, data) -> 'UserPreferences':
+        """
+        Copy with the fields present in a request payload changed
+
+        Raises:
+            ValueError: If the payload is not an object or a field has the wrong type
+        """
+        if not isinstance(data, dict):
+            raise ValueError('preferences must be a JSON object')
+
+        changes = {}
+        for field, kind in self.FIELDS.items():
+            if field not in data:
+                continue
+            value = data[field]
+            if value is None and field == 'working_hours':
+                changes[field] = None
+                continue
+            if not isinstance(value, kind) or (kind is str and not value.strip()):
+                raise ValueError(f"{field} has the wrong type")
+            changes[field] = value
+        return replace(self, **changes)
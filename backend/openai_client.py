@@ -5,7 +5,17 @@ Future: Integrate with OpenAI GPT API for dynamic, context-aware responses
 """
 
 import random
-from typing import Dict
+import time
+from typing import Dict, Optional
+
+from metrics import REGISTRY
+from profiler import PROFILER
+
+OPENAI_SECONDS = REGISTRY.histogram(
+    'altme_openai_request_duration_seconds', 'OpenAIClient call latency', ('operation',)
+)
+GENERATE_REPLY_SECONDS = OPENAI_SECONDS.labels('generate_reply')
+SUMMARIZE_DIGEST_SECONDS = OPENAI_SECONDS.labels('summarize_digest')
 
 
 class OpenAIClient:
@@ -54,7 +64,8 @@ class OpenAIClient:
             ]
         }
 
-    def generate_reply(self, subject: str, body: str, sender: str = "Unknown") -> Dict:
+    def generate_reply(self, subject: str, body: str, sender: str = "Unknown",
+                       prompt: Optional[Dict] = None) -> Dict:
         """
         Generate an AI-powered email reply
 
@@ -62,19 +73,25 @@ class OpenAIClient:
             subject (str): Email subject
             body (str): Email body
             sender (str): Sender's email/name
+            prompt (dict): Budgeted prompt from PromptBuilder.build; its
+                messages are what the model is sent
 
         Returns:
             dict: Generated reply with metadata
         """
+        started = time.perf_counter()
+
         # Analyze the email to determine reply type
-        reply_type = self._determine_reply_type(subject, body)
+        with PROFILER.span('openai.reply_type'):
+            reply_type = self._determine_reply_type(subject, body)
 
         # Select a template
         templates = self.response_templates.get(reply_type, self.response_templates['General'])
         template = random.choice(templates)
 
         # Customize the template
-        reply_body = self._customize_template(template, subject, body)
+        with PROFILER.span('openai.customize'):
+            reply_body = self._customize_template(template, subject, body)
 
         # Add greeting and signature
         greeting = f"Hi,\n\n"
@@ -82,13 +99,44 @@ class OpenAIClient:
 
         full_reply = greeting + reply_body + signature
 
-        return {
+        GENERATE_REPLY_SECONDS.observe(time.perf_counter() - started)
+
+        reply = {
             'reply_body': full_reply,
             'reply_type': reply_type,
             'confidence': round(random.uniform(0.75, 0.95), 2),
-            'tone': 'Professional',
+            'tone': prompt['tone'] if prompt else 'Professional',
             'subject': f"Re: {subject}"
         }
+        if prompt:
+            reply['prompt_tokens'] = prompt['tokens']
+        return reply
+
+    def summarize_digest(self, prompt: Dict) -> Dict:
+        """
+        Summarize a window of low-priority emails in one call
+
+        Args:
+            prompt (dict): Digest prompt with `messages` and the `groups`
+                (category, count, senders) they were built from
+
+        Returns:
+            dict: Summary text with metadata
+        """
+        started = time.perf_counter()
+
+        lines = []
+        for group in prompt['groups']:
+            senders = ', '.join(entry['sender'] for entry in group['senders'][:3])
+            subjects = '; '.join(email['subject'] for email in group['emails'][-2:])
+            lines.append(f"{group['category']}: {group['count']} emails, mostly from {senders}. Latest: {subjects}")
+
+        SUMMARIZE_DIGEST_SECONDS.observe(time.perf_counter() - started)
+
+        return {
+            'summary': '\n'.join(lines),
+            'prompt_tokens': prompt['tokens']
+        }
 
     def _determine_reply_type(self, subject: str, body: str) -> str:
         """Determine the type of reply needed based on email content"""
@@ -0,0 +1,313 @@
+"""
+Prefetch Module
+Speculative background drafting of replies to high-priority emails
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+from admission import AdmissionRejected, CostBudget, draft_key, estimate_cost
+from logging_utils import get_logger
+from metrics import REGISTRY
+from prompt import DEFAULT_TONE
+
+logger = get_logger(__name__)
+
+PREFETCHES = REGISTRY.counter(
+    'altme_draft_prefetch_total', 'Speculative draft outcomes', ('result',)
+)
+PREFETCH_QUEUE = REGISTRY.gauge('altme_draft_prefetch_queued', 'Emails waiting to be prefetched')
+PREFETCH_CACHED = REGISTRY.gauge('altme_draft_prefetch_cached', 'Prefetched drafts ready to serve')
+
+
+class DraftPrefetcher:
+    """
+    Drafts replies ahead of time for emails the user will probably answer
+
+    Emails offered to the prefetcher are classified; those in `categories`
+    with at least `min_confidence` are queued, highest confidence first.
+    Worker threads only generate once the foreground has been quiet for
+    `idle_seconds`, never run more than `max_concurrency` generations, and
+    stop when the prefetch cost budget for the window is spent.
+
+    Drafts are written for the default user. When `build_prompt` is given,
+    each is generated from that prompt and charged its prompt tokens plus
+    `max_tokens`, exactly as admission charges a foreground draft; the
+    prompt's tone is kept with the draft and `take` only serves it to a
+    caller asking for the same tone, so a user with other preferences
+    gets a fresh draft instead.
+
+    Finished drafts wait in a bounded cache, so `take` returns one
+    instantly. A lookup for an email that was never queued (wrong
+    category, low confidence, already read) counts as `ineligible` rather
+    than a miss, so the hit rate reflects only what prefetching attempted.
+    Every draft that
+    expires or is evicted without being taken counts as wasted; together
+    with hits and misses this is what the thresholds should be tuned on.
+    """
+
+    # Keys of queued emails remembered for telling misses from ineligible lookups
+    MAX_OFFERED_KEYS = 100000
+
+    def __init__(self, generate: Callable[[str, str, str, Optional[Dict]], Dict], classify: Callable[[str, str], Dict],
+                 build_prompt: Optional[Callable[[str, str, str], Dict]] = None,
+                 categories: Iterable[str] = ('Important',), min_confidence: float = 0.6,
+                 max_concurrency: int = 1, budget: float = 0.0, budget_window: float = 3600.0,
+                 max_tokens: int = 150, idle_seconds: float = 2.0, ttl: float = 3600.0,
+                 max_entries: int = 500, max_queued: int = 1000, enabled: bool = True):
+        self.generate = generate
+        self.classify = classify
+        self.build_prompt = build_prompt
+        self.categories = frozenset(categories)
+        self.min_confidence = min_confidence
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_tokens = max_tokens
+        self.idle_seconds = idle_seconds
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_queued = max_queued
+        self.enabled = enabled
+
+        self._budget = CostBudget(budget, budget_window)
+        self._queue = []                    # (-confidence, seq, key, email)
+        self._pending = set()               # keys queued or being generated
+        self._offered: 'OrderedDict[str, None]' = OrderedDict()  # keys ever queued
+        self._ready: 'OrderedDict[str, tuple]' = OrderedDict()  # key -> (reply, expires_at, tone)
+        self._sequence = itertools.count()
+        self._last_activity = time.monotonic()
+        self._counts = dict.fromkeys(
+            ('queued', 'generated', 'hits', 'misses', 'ineligible', 'wasted', 'over_budget', 'errors', 'dropped'), 0
+        )
+        self._cond = threading.Condition()
+        self._workers = []
+        self._pid = None
+        self._stopped = False
+
+    @classmethod
+    def from_config(cls, config, generate, classify, build_prompt=None) -> 'DraftPrefetcher':
+        return cls(
+            generate=generate,
+            classify=classify,
+            build_prompt=build_prompt,
+            categories=config.PREFETCH_CATEGORIES,
+            min_confidence=config.PREFETCH_MIN_CONFIDENCE,
+            max_concurrency=config.PREFETCH_MAX_CONCURRENCY,
+            budget=config.PREFETCH_COST_BUDGET,
+            budget_window=config.DRAFT_COST_WINDOW_SECONDS,
+            max_tokens=config.MAX_TOKENS,
+            idle_seconds=config.PREFETCH_IDLE_SECONDS,
+            ttl=config.PREFETCH_TTL_SECONDS,
+            max_entries=config.PREFETCH_MAX_ENTRIES,
+            enabled=config.PREFETCH_ENABLED
+        )
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def offer(self, email: Dict, classification: Optional[Dict] = None) -> bool:
+        """
+        Consider an email for prefetching
+
+        Args:
+            email (dict): Email with subject, body and sender
+            classification (dict): Existing classifier result, if already computed
+
+        Returns:
+            bool: Whether the email was queued
+        """
+        if not self.enabled or not email.get('unread', True):
+            return False
+
+        subject, body, sender = email['subject'], email['body'], email.get('sender', 'Unknown')
+        result = classification or self.classify(subject, body, sender)
+        if result['category'] not in self.categories or result['confidence'] < self.min_confidence:
+            return False
+
+        key = draft_key(subject, body, sender)
+        with self._cond:
+            if key in self._pending or key in self._ready:
+                return False
+            if len(self._queue) >= self.max_queued:
+                self._count('dropped')
+                return False
+
+            item = {'subject': subject, 'body': body, 'sender': sender}
+            heapq.heappush(self._queue, (-result['confidence'], next(self._sequence), key, item))
+            self._pending.add(key)
+            self._offered[key] = None
+            if len(self._offered) > self.MAX_OFFERED_KEYS:
+                self._offered.popitem(last=False)
+            self._count('queued')
+            PREFETCH_QUEUE.set(len(self._queue))
+            self._ensure_workers()
+            self._cond.notify()
+        return True
+
+    def offer_many(self, emails: Iterable[Dict]) -> int:
+        """Offer several emails; returns the number queued"""
+        return sum(1 for email in emails if self.offer(email))
+
+    def note_activity(self):
+        """Record foreground activity; prefetching backs off until it is idle again"""
+        self._last_activity = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    def take(self, subject: str, body: str, sender: str, tone: str = DEFAULT_TONE) -> Optional[Dict]:
+        """
+        Claim the prefetched draft for an email, if one is ready
+
+        Args:
+            subject (str): Email subject
+            body (str): Email body
+            sender (str): Sender's email/name
+            tone (str): The caller's preferred tone; a draft written in
+                another tone is a miss and stays cached
+
+        Returns:
+            dict: The draft, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        key = draft_key(subject, body, sender)
+        with self._cond:
+            entry = self._ready.get(key)
+            if entry is not None and entry[2] != tone:
+                entry = None
+            elif entry is not None:
+                del self._ready[key]
+            eligible = key in self._offered or key in self._pending
+            PREFETCH_CACHED.set(len(self._ready))
+
+        if entry is not None and entry[1] > time.monotonic():
+            self._count('hits')
+            return entry[0]
+
+        if entry is not None:
+            self._count('wasted')
+        self._count('misses' if eligible else 'ineligible')
+        return None
+
+    def stats(self) -> Dict:
+        """Counters plus the derived rates used to tune the trigger thresholds"""
+        with self._cond:
+            self._expire(time.monotonic())
+            counts = dict(self._counts)
+            counts['queued_now'] = len(self._queue)
+            counts['cached_now'] = len(self._ready)
+
+        lookups = counts['hits'] + counts['misses']
+        settled = counts['hits'] + counts['wasted']
+        counts['hit_rate'] = round(counts['hits'] / lookups, 4) if lookups else None
+        counts['waste_rate'] = round(counts['wasted'] / settled, 4) if settled else None
+        remaining = self._budget.remaining()
+        counts['budget_remaining'] = remaining if remaining != float('inf') else None
+        return counts
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _ensure_workers(self):
+        # Called with the lock held. Threads do not survive fork, so workers
+        # are (re)started lazily in whichever process first queues work.
+        if self._pid == os.getpid() and all(worker.is_alive() for worker in self._workers):
+            return
+        self._pid = os.getpid()
+        self._workers = [
+            threading.Thread(target=self._run, name=f'draft-prefetch-{index}', daemon=True)
+            for index in range(self.max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+
+            # Defer to the foreground: wait for a quiet period before spending
+            idle_for = time.monotonic() - self._last_activity
+            if idle_for < self.idle_seconds:
+                time.sleep(self.idle_seconds - idle_for)
+                continue
+
+            with self._cond:
+                if not self._queue:
+                    continue
+                _, _, key, item = heapq.heappop(self._queue)
+                PREFETCH_QUEUE.set(len(self._queue))
+
+            try:
+                self._prefetch(key, item)
+            finally:
+                with self._cond:
+                    self._pending.discard(key)
+
+    def _prefetch(self, key: str, item: Dict):
+        subject, body, sender = item['subject'], item['body'], item['sender']
+        try:
+            prompt = self.build_prompt(subject, body, sender) if self.build_prompt is not None else None
+        except Exception as e:
+            self._count('errors')
+            logger.warning("Draft prefetch prompt failed: %s", e)
+            return
+
+        if prompt is not None:
+            cost, tone = prompt['tokens'] + self.max_tokens, prompt['tone']
+        else:
+            cost, tone = estimate_cost(subject, body, self.max_tokens), DEFAULT_TONE
+        try:
+            self._budget.charge(cost)
+        except AdmissionRejected:
+            self._count('over_budget')
+            return
+
+        try:
+            reply = self.generate(subject, body, sender, prompt)
+        except Exception as e:
+            self._count('errors')
+            logger.warning("Draft prefetch failed: %s", e)
+            return
+
+        self._count('generated')
+        now = time.monotonic()
+        with self._cond:
+            self._expire(now)
+            self._ready[key] = (reply, now + self.ttl, tone)
+            while len(self._ready) > self.max_entries:
+                self._ready.popitem(last=False)
+                self._count('wasted')
+            PREFETCH_CACHED.set(len(self._ready))
+
+    def _expire(self, now: float):
+        # Called with the lock held; entries are in insertion (= expiry) order
+        while self._ready:
+            key, (_, expires_at, _) = next(iter(self._ready.items()))
+            if expires_at > now:
+                break
+            del self._ready[key]
+            self._count('wasted')
+        PREFETCH_CACHED.set(len(self._ready))
+
+    def _count(self, result: str):
+        with self._cond:
+            self._counts[result] += 1
+        PREFETCHES.labels(result).inc()
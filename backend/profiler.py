@@ -0,0 +1,297 @@
+"""
+Profiler Module
+Opt-in sampling profiler for individual requests with collapsed-stack output
+Output is compatible with flamegraph.pl and speedscope
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+
+# How often an idle sampler checks for new work before parking
+IDLE_POLL_SECONDS = 0.005
+
+
+class _NoopSpan:
+    """Shared do-nothing span returned whenever the current request is not profiled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """Timing span that is also visible to the sampler as a pseudo-frame"""
+
+    __slots__ = ('_profile', '_name', '_started')
+
+    def __init__(self, profile: '_RequestProfile', name: str):
+        self._profile = profile
+        self._name = name
+
+    def __enter__(self):
+        self._profile.spans.append(self._name)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._started
+        self._profile.spans.pop()
+        count, total = self._profile.span_times.get(self._name, (0, 0.0))
+        self._profile.span_times[self._name] = (count + 1, total + elapsed)
+        return False
+
+
+class _RequestProfile:
+    """Profiling state of one in-flight request"""
+
+    __slots__ = ('route', 'interval', 'spans', 'span_times')
+
+    def __init__(self, route: str, interval: float):
+        self.route = route
+        self.interval = interval
+        self.spans = []
+        self.span_times = {}
+
+
+class Profiler:
+    """
+    Sampling profiler for selected requests
+
+    A request is profiled when it carries the debug header, falls into the
+    sample fraction, or matches an active capture window. While at least one
+    request is profiled, a background thread samples the stacks of the
+    profiled threads every `interval` seconds and aggregates them per route
+    as collapsed stacks. While nothing is profiled, `span` and `end` return
+    after a single dict check.
+
+    One profiler serves the whole process, because stacks are sampled per
+    thread; which requests are selected, and how often they are sampled, is
+    passed to `begin` by each app from its own configuration.
+    """
+
+    def __init__(self):
+        self.max_depth = 64
+        self.max_stacks_per_route = 5000
+
+        self._active: Dict[int, _RequestProfile] = {}
+        self._stacks: Dict[str, Counter] = {}
+        self._span_totals: Dict[str, Dict[str, list]] = {}
+        self._captures: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Request lifecycle
+    # ------------------------------------------------------------------
+
+    def begin(self, route: str, headers=None, sample_rate: float = 0.0,
+              debug_header: str = 'X-Debug-Profile', interval_ms: float = 5.0) -> bool:
+        """
+        Start profiling the current request if it is selected
+
+        Args:
+            route (str): Route template of the request
+            headers: Request headers (checked for the debug header)
+            sample_rate (float): Fraction of requests to profile
+            debug_header (str): Header that selects a request
+            interval_ms (float): Sampling interval while this request runs
+
+        Returns:
+            bool: Whether the request is being profiled
+        """
+        selected = (
+            (headers is not None and headers.get(debug_header))
+            or (sample_rate and random.random() < sample_rate)
+            or self._capturing(route)
+        )
+        if not selected:
+            return False
+
+        self._active[threading.get_ident()] = _RequestProfile(route, interval_ms / 1000)
+        self._ensure_sampler()
+        return True
+
+    def end(self):
+        """Stop profiling the current request and fold its span timings in"""
+        if not self._active:
+            return
+
+        profile = self._active.pop(threading.get_ident(), None)
+        if profile is None or not profile.span_times:
+            return
+
+        with self._lock:
+            totals = self._span_totals.setdefault(profile.route, {})
+            for name, (count, elapsed) in profile.span_times.items():
+                entry = totals.setdefault(name, [0, 0.0])
+                entry[0] += count
+                entry[1] += elapsed
+
+    def span(self, name: str):
+        """
+        Annotate a phase of work inside a profiled request
+
+        Usage:
+            with PROFILER.span('classify.score'):
+                ...
+        """
+        if not self._active:
+            return _NOOP_SPAN
+        profile = self._active.get(threading.get_ident())
+        if profile is None:
+            return _NOOP_SPAN
+        return _Span(profile, name)
+
+    # ------------------------------------------------------------------
+    # Capture windows and results
+    # ------------------------------------------------------------------
+
+    def _capturing(self, route: str) -> bool:
+        if not self._captures:
+            return False
+        now = time.monotonic()
+        until = self._captures.get(route) or self._captures.get('')
+        return until is not None and until > now
+
+    def start_capture(self, route: str = '', seconds: float = 10.0) -> float:
+        """
+        Profile every request on `route` (all routes if empty) for the next
+        `seconds`, without waiting; samples are read with `collapsed` later
+
+        Returns:
+            float: Seconds until the window closes
+        """
+        self.reset(route)
+        now = time.monotonic()
+        with self._lock:
+            # Windows that have closed are dropped here rather than by a timer
+            self._captures = {name: until for name, until in self._captures.items() if until > now}
+            self._captures[route] = now + seconds
+        return seconds
+
+    def capture(self, route: str = '', seconds: float = 10.0) -> str:
+        """
+        Profile every request on `route` (all routes if empty) for `seconds`
+        and return the collapsed stacks recorded during the window
+        """
+        self.start_capture(route, seconds)
+        try:
+            time.sleep(seconds)
+        finally:
+            with self._lock:
+                self._captures.pop(route, None)
+        return self.collapsed(route)
+
+    def collapsed(self, route: str = '') -> str:
+        """Aggregated samples as "frame;frame;frame count" lines"""
+        with self._lock:
+            routes = [route] if route else list(self._stacks)
+            lines = []
+            for name in routes:
+                for stack, count in self._stacks.get(name, {}).items():
+                    lines.append(f"{stack} {count}")
+        return '\n'.join(sorted(lines)) + ('\n' if lines else '')
+
+    def span_summary(self, route: str = '') -> Dict:
+        """Total time and call count per span, per route"""
+        with self._lock:
+            routes = [route] if route else list(self._span_totals)
+            return {
+                name: {
+                    span: {'count': count, 'total_ms': round(total * 1000, 3)}
+                    for span, (count, total) in self._span_totals.get(name, {}).items()
+                }
+                for name in routes
+            }
+
+    def reset(self, route: str = ''):
+        """Drop collected samples for one route, or all routes"""
+        with self._lock:
+            if route:
+                self._stacks.pop(route, None)
+                self._span_totals.pop(route, None)
+            else:
+                self._stacks.clear()
+                self._span_totals.clear()
+
+    # ------------------------------------------------------------------
+    # Sampler thread
+    # ------------------------------------------------------------------
+
+    def _ensure_sampler(self):
+        # The sampler clears `_sampler` under the lock as it exits, so a
+        # thread seen here either keeps running or has not decided to exit
+        # yet and will see the request added to `_active` before this call.
+        with self._lock:
+            if self._sampler is not None and self._sampler.is_alive():
+                self._wakeup.set()
+                return
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        idle_since = None
+        while True:
+            active = list(self._active.values())
+            if active:
+                idle_since = None
+                self._sample()
+                time.sleep(min(profile.interval for profile in active))
+                continue
+
+            # Park once nothing has been profiled for a second
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > 1.0:
+                # Clear before re-checking, so a request that arrives after
+                # the check has its wakeup seen by the wait below
+                self._wakeup.clear()
+                if not self._active and not self._wakeup.wait(timeout=30):
+                    with self._lock:
+                        if not self._active:
+                            self._sampler = None
+                            return
+                idle_since = None
+            else:
+                time.sleep(IDLE_POLL_SECONDS)
+
+    def _sample(self):
+        frames = sys._current_frames()
+        for thread_id, profile in list(self._active.items()):
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                names.append(f"{module}:{code.co_name}")
+                frame = frame.f_back
+            names.reverse()
+
+            prefix = [profile.route] + [f"[{span}]" for span in profile.spans]
+            stack = ';'.join(prefix + names)
+
+            with self._lock:
+                counts = self._stacks.setdefault(profile.route, Counter())
+                if stack not in counts and len(counts) >= self.max_stacks_per_route:
+                    stack = f"{profile.route};[truncated]"
+                counts[stack] += 1
+
+
+# Process-wide profiler shared by every app
+PROFILER = Profiler()
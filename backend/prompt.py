@@ -0,0 +1,358 @@
+"""
+Prompt Module
+Token-budgeted prompt construction for draft generation
+"""
+
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+
+from metrics import REGISTRY
+
+PROMPT_TOKENS = REGISTRY.histogram(
+    'altme_prompt_tokens', 'Estimated input tokens per draft prompt',
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192)
+)
+PROMPT_TRUNCATED = REGISTRY.counter(
+    'altme_prompt_truncated_total', 'Prompt sections trimmed or dropped to fit the budget', ('section',)
+)
+
+# Chat formatting overhead per message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Charged for joining two pieces of text with a newline, and with the
+# blank line between prompt sections; with these, a joined prompt never
+# estimates higher than the sum of what its pieces were charged
+LINE_SEPARATOR_TOKENS = 1
+SECTION_SEPARATOR_TOKENS = 2
+
+# Below this, a trimmed section carries too little to be worth including
+MIN_SECTION_TOKENS = 24
+
+TRUNCATION_MARK = ' [...]'
+
+# Characters per token that a budget can possibly use; text beyond
+# budget * this is cut before any per-character work
+MAX_CHARS_PER_TOKEN = 8
+
+# Shares of the input budget the subject and sender lines may use; longer
+# ones are cut so a pathological header cannot push the prompt over budget
+SUBJECT_BUDGET_SHARE = 0.1
+SENDER_BUDGET_SHARE = 0.05
+
+DEFAULT_TONE = 'Professional'
+
+_WORD = re.compile(r'[a-z0-9]{4,}')
+
+# Start of quoted history, forwarded headers or legal footers in a body
+_BOILERPLATE = re.compile(
+    r'^(on .{0,200} wrote:|-{2,} ?(original|forwarded) message ?-{2,}|from: .+@.+'
+    r'|confidentiality notice|this e-?mail (and any attachments )?(is|may be) confidential|sent from my )',
+    re.IGNORECASE
+)
+
+EXAMPLES_TITLE = "Replies the user approved before:\n"
+THREAD_TITLE = "Earlier in this thread:\n"
+
+SYSTEM_TEMPLATE = (
+    "You draft email replies on behalf of the user. Write in a {tone} tone, "
+    "answer only what the latest email asks, and keep the reply short. "
+    "Return only the reply body."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local estimate of model tokens in `text`
+
+    Uses the larger of two cheap bounds: about 4 characters per token for
+    ASCII characters plus 3 UTF-8 bytes per token for other scripts (which
+    tokenize densely), and about 4 tokens per 3 words. Both are single
+    C-level passes, and the estimate errs high so a packed prompt stays
+    within budget. Each bound is rounded up from a per-character sum, so
+    the estimate of two texts joined by a newline is at most the sum of
+    their estimates plus LINE_SEPARATOR_TOKENS.
+    """
+    if not text:
+        return 0
+    if text.isascii():
+        by_size = (len(text) + 3) // 4
+    else:
+        data = text.encode('utf-8')
+        ascii_chars = len(data.decode('ascii', 'ignore'))
+        by_size = (3 * ascii_chars + 4 * (len(data) - ascii_chars) + 11) // 12
+    by_words = -(-(text.count(' ') + text.count('\n') + 1) * 4 // 3)
+    return max(by_size, by_words)
+
+
+def trim_to_tokens(text: str, budget: int) -> str:
+    """
+    Cut `text` at a word boundary so that it fits in `budget` tokens
+
+    Returns:
+        str: `text` unchanged if it fits, otherwise a prefix ending in a
+        truncation mark, or '' if the budget cannot hold any of it
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    if budget <= estimate_tokens(TRUNCATION_MARK):
+        return ''
+
+    cut = len(text)
+    trimmed = text
+    while tokens > budget and cut > 0:
+        # Shrink in proportion to the overshoot, then back off to a space
+        cut = min(cut - 1, int(cut * budget / tokens * 0.95))
+        space = text.rfind(' ', 0, cut)
+        if space > cut // 2:
+            cut = space
+        trimmed = text[:cut].rstrip() + TRUNCATION_MARK
+        tokens = estimate_tokens(trimmed)
+    return trimmed if cut > 0 else ''
+
+
+def strip_boilerplate(body: str) -> str:
+    """
+    Drop quoted history, signatures and footers from an email body
+
+    Everything after a reply header ("On ... wrote:"), a forwarded or
+    original message marker, a signature separator or a legal footer is
+    removed, along with '>'-quoted lines; blank lines are collapsed.
+    """
+    kept = []
+    for line in body.splitlines():
+        stripped = line.strip()
+        if line.rstrip() == '--' or _BOILERPLATE.match(stripped):
+            break
+        if stripped.startswith('>'):
+            continue
+        if not stripped and (not kept or not kept[-1]):
+            continue
+        kept.append(stripped)
+    return '\n'.join(kept).strip()
+
+
+def _words(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def select_examples(candidates: Iterable[Dict], subject: str, body: str, k: int = 3) -> List[Dict]:
+    """
+    Past approved replies most relevant to an email
+
+    Relevance is the share of the email's distinctive words that the reply
+    also uses; candidates sharing none are skipped, and ties go to the one
+    listed first (the most recent).
+
+    Args:
+        candidates (iterable): Action records with a `reply`, newest first
+        subject (str): Email subject
+        body (str): Email body
+        k (int): Most examples to return
+
+    Returns:
+        list: Up to `k` records, most relevant first
+    """
+    words = _words(f"{subject} {body}")
+    if not words or k <= 0:
+        return []
+
+    scored = []
+    for order, candidate in enumerate(candidates):
+        overlap = len(words & _words(candidate.get('reply') or ''))
+        if overlap:
+            scored.append((-overlap / len(words), order, candidate))
+    scored.sort(key=lambda item: item[:2])
+    return [candidate for _, _, candidate in scored[:k]]
+
+
+class PromptBuilder:
+    """
+    Packs draft context into a fixed input token budget
+
+    Sections are added in priority order, each trimmed to what is left:
+
+        1. instructions, including the user's preferred tone (always kept)
+        2. the email being answered, without quoted history or footers
+        3. earlier messages in its thread, newest first
+        4. the most relevant replies the user approved before
+
+    so the prompt never exceeds `max_input_tokens`, and a long email crowds
+    out optional context rather than the other way round. Every piece,
+    title and separator is charged as it is added, and the reported
+    `tokens` is that sum, which bounds the estimate of the joined text. Context comes
+    from the `threads`, `examples` and `preferences` callables, any of
+    which may be omitted.
+    """
+
+    def __init__(self, max_input_tokens: int = 1500, max_thread_messages: int = 5,
+                 max_message_tokens: int = 200, max_examples: int = 3, max_example_tokens: int = 120,
+                 example_scan: int = 200,
+                 threads: Optional[Callable[..., List[Dict]]] = None,
+                 examples: Optional[Callable[[int], List[Dict]]] = None,
+                 preferences: Optional[Callable[[str], object]] = None):
+        self.max_input_tokens = max_input_tokens
+        self.max_thread_messages = max_thread_messages
+        self.max_message_tokens = max_message_tokens
+        self.max_examples = max_examples
+        self.max_example_tokens = max_example_tokens
+        self.example_scan = example_scan
+        self.threads = threads
+        self.examples = examples
+        self.preferences = preferences
+
+    @classmethod
+    def from_config(cls, config, threads=None, examples=None, preferences=None) -> 'PromptBuilder':
+        return cls(
+            # The completion shares the model's context window with the prompt
+            max_input_tokens=min(config.PROMPT_MAX_INPUT_TOKENS, config.AI_CONTEXT_TOKENS - config.MAX_TOKENS),
+            max_thread_messages=config.PROMPT_MAX_THREAD_MESSAGES,
+            max_message_tokens=config.PROMPT_MAX_MESSAGE_TOKENS,
+            max_examples=config.PROMPT_MAX_EXAMPLES,
+            max_example_tokens=config.PROMPT_MAX_EXAMPLE_TOKENS,
+            threads=threads,
+            examples=examples,
+            preferences=preferences
+        )
+
+    def tone_for(self, user_id: str) -> str:
+        """The user's preferred tone (Professional if unknown)"""
+        if self.preferences is not None:
+            prefs = self.preferences(user_id)
+            if prefs is not None and getattr(prefs, 'preferred_tone', None):
+                return prefs.preferred_tone
+        return DEFAULT_TONE
+
+    def build(self, subject: str, body: str, sender: str = 'Unknown', user_id: str = 'anonymous',
+              email_id: Optional[str] = None) -> Dict:
+        """
+        Build the prompt for a draft reply
+
+        Args:
+            subject (str): Email subject
+            body (str): Email body
+            sender (str): Sender's email/name
+            user_id (str): User whose tone preference applies
+            email_id (str): Stored id of the email, if known (excluded from its thread)
+
+        Returns:
+            dict: `messages` (chat format), estimated input `tokens`, the
+            `budget`, the `tone` and per-section `sections` counts
+        """
+        tone = self.tone_for(user_id)
+        system = SYSTEM_TEMPLATE.format(tone=tone.lower())
+        remaining = self.max_input_tokens - estimate_tokens(system) - 2 * MESSAGE_OVERHEAD_TOKENS
+
+        # 1. The email itself, trimmed to whatever the instructions leave
+        short_sender = self._cap(sender, SENDER_BUDGET_SHARE)
+        short_subject = self._cap(subject, SUBJECT_BUDGET_SHARE)
+        if short_sender != sender or short_subject != subject:
+            PROMPT_TRUNCATED.labels('header').inc()
+        header = f"Latest email from {short_sender}\nSubject: {short_subject}\n\n"
+        remaining -= estimate_tokens(header)
+        # Only a prefix can fit, so long bodies are not scanned in full
+        head = body[:max(remaining, 0) * MAX_CHARS_PER_TOKEN]
+        email_body = strip_boilerplate(head) or head
+        trimmed = trim_to_tokens(email_body, max(remaining, 0))
+        truncated = trimmed != email_body or len(head) < len(body)
+        if truncated:
+            PROMPT_TRUNCATED.labels('email').inc()
+        email = header + trimmed
+        remaining -= estimate_tokens(trimmed)
+
+        # 2. Thread context, newest first, then shown oldest first
+        thread_parts = []
+        if self.threads is not None and self.max_thread_messages > 0:
+            messages = [
+                message for message in self.threads(subject, exclude_id=email_id, limit=self.max_thread_messages)
+                if message.get('body') != body
+            ]
+            left = self._pack(
+                reversed(messages), thread_parts, self._section_room(THREAD_TITLE, remaining),
+                self.max_message_tokens, 'thread',
+                lambda message: (f"From {message.get('sender', 'Unknown')}: ", strip_boilerplate(
+                    (message.get('body') or '')[:self.max_message_tokens * MAX_CHARS_PER_TOKEN]))
+            )
+            if thread_parts:
+                remaining = left
+            thread_parts.reverse()
+
+        # 3. Approved replies as style examples
+        example_parts = []
+        if self.examples is not None and self.max_examples > 0:
+            chosen = select_examples(self.examples(self.example_scan), short_subject, head, self.max_examples)
+            left = self._pack(
+                chosen, example_parts, self._section_room(EXAMPLES_TITLE, remaining),
+                self.max_example_tokens, 'examples',
+                lambda record: ('Approved reply: ', record.get('reply') or '')
+            )
+            if example_parts:
+                remaining = left
+
+        sections = []
+        if example_parts:
+            sections.append(EXAMPLES_TITLE + '\n'.join(example_parts))
+        if thread_parts:
+            sections.append(THREAD_TITLE + '\n'.join(thread_parts))
+        sections.append(email)
+        content = '\n\n'.join(sections)
+
+        # What was charged, which is never less than the estimate of `content`
+        tokens = self.max_input_tokens - remaining
+        PROMPT_TOKENS.observe(tokens)
+        return {
+            'messages': [
+                {'role': 'system', 'content': system},
+                {'role': 'user', 'content': content}
+            ],
+            'tokens': tokens,
+            'budget': self.max_input_tokens,
+            'tone': tone,
+            'sections': {
+                'thread_messages': len(thread_parts),
+                'examples': len(example_parts),
+                'email_truncated': truncated
+            }
+        }
+
+    def _cap(self, text: str, share: float) -> str:
+        """`text` cut to its share of the input budget"""
+        budget = int(self.max_input_tokens * share)
+        return trim_to_tokens(text[:budget * MAX_CHARS_PER_TOKEN], budget)
+
+    @staticmethod
+    def _section_room(title: str, remaining: int) -> int:
+        """Budget left for a section's parts once its title and separator are paid"""
+        return remaining - estimate_tokens(title) - SECTION_SEPARATOR_TOKENS
+
+    @staticmethod
+    def _pack(items: Iterable, parts: List[str], remaining: int, cap: int, section: str,
+              render: Callable) -> int:
+        """Append rendered items to `parts` while they fit; returns the budget left"""
+        for item in items:
+            label, text = render(item)
+            room = min(cap, remaining - estimate_tokens(label) - LINE_SEPARATOR_TOKENS)
+            if room < MIN_SECTION_TOKENS:
+                PROMPT_TRUNCATED.labels(section).inc()
+                break
+            trimmed = trim_to_tokens(text, room)
+            if not trimmed:
+                continue
+            if trimmed != text:
+                PROMPT_TRUNCATED.labels(section).inc()
+            part = label + trimmed
+            parts.append(part)
+            remaining -= estimate_tokens(part) + LINE_SEPARATOR_TOKENS
+        return remaining
+
+
+# Example usage
+if __name__ == '__main__':
+    builder = PromptBuilder(max_input_tokens=120)
+    body = ("Hi, the deadline for the Q4 project is this Friday. Please submit your final deliverables "
+            "by EOD Thursday.\n\n-- \nJane Doe\nProject Manager\n\nOn Mon, Bob wrote:\n> Any update?")
+    prompt = builder.build("Project Deadline Approaching", body, "manager@company.com")
+
+    print(f"Tokens: {prompt['tokens']} of {prompt['budget']}")
+    for message in prompt['messages']:
+        print(f"\n[{message['role']}]\n{message['content']}")
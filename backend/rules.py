@@ -0,0 +1,170 @@
+"""
+Rules Module
+Versioned classifier rules loaded from a file, compiled off the request path
+and swapped atomically when the file changes
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from logging_utils import get_logger
+from metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+
+RULE_RELOADS = REGISTRY.counter(
+    'altme_classifier_rule_reloads_total', 'Classifier ruleset reload attempts', ('result',)
+)
+
+
+class CompiledRuleSet:
+    """
+    Immutable, ready-to-match form of a rules file
+
+    Every distinct term is lowercased once and scanned once per email, no
+    matter how many categories list it; each term carries the (category,
+    weight, is_keyword) contributions it makes when found.
+
+    Everything classification will touch is validated here, so a file with
+    a non-numeric weight or an empty term raises ValueError at compile time
+    instead of failing later on the request path.
+    """
+
+    __slots__ = ('version', 'categories', 'patterns', 'terms',
+                 'default_category', 'default_confidence')
+
+    def __init__(self, rules: Dict):
+        categories = rules.get('categories')
+        if not isinstance(categories, dict) or not categories:
+            raise ValueError("rules must define a non-empty 'categories' object")
+
+        keyword_weight = _number(rules, 'keyword_weight', 2)
+        sender_weight = _number(rules, 'sender_weight', 1)
+
+        self.version = str(rules.get('version', 'unversioned'))
+        self.default_category = rules.get('default_category', 'General')
+        if not isinstance(self.default_category, str) or not self.default_category:
+            raise ValueError("'default_category' must be a non-empty string")
+        self.default_confidence = _number(rules, 'default_confidence', 0.5)
+        self.categories: Tuple[str, ...] = tuple(categories)
+        self.patterns = categories
+
+        contributions: Dict[str, List[Tuple[int, int, Optional[str]]]] = {}
+        for index, (category, spec) in enumerate(categories.items()):
+            if not isinstance(spec, dict):
+                raise ValueError(f"category {category!r} must be an object")
+            for keyword in _terms(spec, 'keywords', category):
+                contributions.setdefault(keyword.lower(), []).append((index, keyword_weight, keyword))
+            for sender in _terms(spec, 'senders', category):
+                contributions.setdefault(sender.lower(), []).append((index, sender_weight, None))
+
+        self.terms: Tuple[Tuple[str, Tuple], ...] = tuple(
+            (term, tuple(hits)) for term, hits in contributions.items()
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> 'CompiledRuleSet':
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+
+def _number(rules: Dict, field: str, default: float) -> float:
+    value = rules.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{field!r} must be a number, got {value!r}")
+    return value
+
+
+def _terms(spec: Dict, field: str, category: str) -> List[str]:
+    terms = spec.get(field, [])
+    if not isinstance(terms, list):
+        raise ValueError(f"{field!r} of category {category!r} must be a list")
+    for term in terms:
+        # An empty term is found in every email
+        if not isinstance(term, str) or not term.strip():
+            raise ValueError(f"{field!r} of category {category!r} has an empty or non-string term: {term!r}")
+    return terms
+
+
+class RuleStore:
+    """
+    Holder of the live ruleset
+
+    Readers take `store.current` once per classification: a single attribute
+    read, with no lock, that always yields a fully built ruleset. A watcher
+    thread polls the rules file and, when it changes, parses and compiles the
+    new version before swapping the reference. Invalid files are rejected and
+    the previous ruleset stays live.
+    """
+
+    def __init__(self, path: str = DEFAULT_RULES_PATH, watch: bool = False, interval: float = 5.0):
+        self.path = path
+        self.interval = interval
+        self.current = CompiledRuleSet.from_file(path)
+        self._signature = self._file_signature()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+        if watch:
+            self.start_watching()
+            # Threads do not survive fork: restart the watcher in each worker
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def _file_signature(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Recompile and swap in the rules file if it changed
+
+        Returns:
+            bool: Whether a new ruleset went live
+        """
+        signature = self._file_signature()
+        if signature is None or (signature == self._signature and not force):
+            return False
+
+        try:
+            ruleset = CompiledRuleSet.from_file(self.path)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            RULE_RELOADS.labels('error').inc()
+            logger.error("Rejected classifier rules %s: %s", self.path, e)
+            self._signature = signature
+            return False
+
+        previous = self.current.version
+        self.current = ruleset
+        self._signature = signature
+        RULE_RELOADS.labels('success').inc()
+        logger.info("Classifier rules reloaded: version %s -> %s", previous, ruleset.version)
+        return True
+
+    def start_watching(self):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name='rules-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _restart_after_fork(self):
+        self._watcher = None
+        self._stop = threading.Event()
+        self.start_watching()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error("Classifier rules watcher error: %s", e)
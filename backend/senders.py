@@ -0,0 +1,126 @@
+"""
+Senders Module
+Learned sender -> category statistics for the classifier's fast path
+"""
+
+import threading
+from email.utils import parseaddr
+from typing import Dict, List, Optional, Tuple
+
+
+class _Node:
+    __slots__ = ('children', 'counts', 'total', 'senders')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.counts: Dict[str, float] = {}
+        self.total = 0.0
+        self.senders = 0  # distinct addresses at or below this node
+
+
+class SenderTrie:
+    """
+    Category statistics per sender, keyed by reversed domain then local part
+
+    "deals@amazon.com" is stored along the path com -> amazon -> @deals, and
+    every node on the path counts the categories seen below it, so a new
+    address at a known domain still benefits from the domain's history.
+
+    A lookup returns the most specific node (domain level or deeper) that
+    has at least `min_support` observations of which at least `min_share`
+    agree; a domain-level node must also have seen `min_senders` distinct
+    addresses, so one prolific sender cannot speak for a whole domain. A
+    node with enough support but mixed categories clears the verdict of
+    the nodes above it: a mixed sender does not inherit its domain's
+    verdict, while a consistent sender at a mixed domain still gets its own.
+    """
+
+    def __init__(self, min_support: float = 20, min_share: float = 0.95, max_nodes: int = 200000,
+                 min_senders: int = 2):
+        self.min_support = min_support
+        self.min_share = min_share
+        self.min_senders = min_senders
+        self.max_nodes = max_nodes
+        self.nodes = 1
+        self.senders = 0
+        self._root = _Node()
+        # Guards the trie; callers may also hold it around bookkeeping of
+        # their own that must stay consistent with what was learned
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def path(sender: str) -> Optional[List[str]]:
+        """Trie path of an address ("Name <user@mail.example.com>" forms included)"""
+        if not sender:
+            return None
+        if '<' in sender or ' ' in sender.strip():
+            sender = parseaddr(sender)[1]
+        address = sender.strip().lower()
+        local, at, domain = address.rpartition('@')
+        if not at or not local or '.' not in domain:
+            return None
+        return domain.split('.')[::-1] + ['@' + local]
+
+    def learn(self, sender: str, category: str, weight: float = 1.0) -> bool:
+        """
+        Count one observation of `sender` receiving `category`
+
+        Returns:
+            bool: Whether the sender could be recorded
+        """
+        path = self.path(sender)
+        if path is None or not category:
+            return False
+
+        with self.lock:
+            node = self._root
+            visited = []
+            for label in path:
+                child = node.children.get(label)
+                if child is None:
+                    if self.nodes >= self.max_nodes:
+                        # Full: keep refining known senders, stop adding new ones
+                        break
+                    child = _Node()
+                    node.children[label] = child
+                    self.nodes += 1
+                    if label[0] == '@':
+                        # A new address: every node above it has one more sender
+                        self.senders += 1
+                        child.senders = 1
+                        for ancestor in visited:
+                            ancestor.senders += 1
+                node = child
+                visited.append(node)
+                node.counts[category] = node.counts.get(category, 0.0) + weight
+                node.total += weight
+        return True
+
+    def lookup(self, sender: str) -> Optional[Tuple[str, float, int]]:
+        """
+        Confident category for a sender, if its history allows one
+
+        Returns:
+            tuple: (category, share, depth) or None
+        """
+        path = self.path(sender)
+        if path is None:
+            return None
+
+        best = None
+        # `learn` adds categories to these nodes' counts concurrently
+        with self.lock:
+            node = self._root
+            for depth, label in enumerate(path, 1):
+                node = node.children.get(label)
+                if node is None:
+                    break
+                if depth < 2 or node.total < self.min_support:
+                    continue
+                if label[0] != '@' and node.senders < self.min_senders:
+                    continue
+
+                category, count = max(node.counts.items(), key=lambda item: item[1])
+                share = count / node.total
+                best = (category, round(share, 2), depth) if share >= self.min_share else None
+        return best
@@ -0,0 +1,250 @@
+"""
+Shadow Module
+Off-path evaluation of a candidate classifier against live /classify traffic
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, Optional
+
+from logging_utils import get_logger
+from metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+SHADOW_SAMPLES = REGISTRY.counter(
+    'altme_classifier_shadow_total', 'Sampled /classify inputs by shadow outcome', ('result',)
+)
+SHADOW_SECONDS = REGISTRY.histogram(
+    'altme_classifier_shadow_duration_seconds', 'Classification latency of shadowed inputs', ('version',)
+)
+SHADOW_QUEUED = REGISTRY.gauge('altme_classifier_shadow_queued', 'Inputs waiting for the candidate classifier')
+
+# Recent latencies kept per version for percentiles in /debug/shadow
+LATENCY_WINDOW = 2048
+
+
+class ShadowEvaluator:
+    """
+    Replays a sample of live classifications through a candidate classifier
+
+    The request path only rolls a die and, for sampled inputs, does a
+    non-blocking put of the inputs and the live result onto a bounded
+    queue; when the queue is full the sample is dropped and counted, so a
+    slow candidate never adds latency or memory. A single background
+    worker runs the candidate and aggregates agreement, a confusion matrix
+    (live category -> candidate category) and per-version latency.
+
+    Live answers taken from the sender fast path never looked at the
+    content, so comparing them with a content-only candidate would measure
+    the fast path rather than the ruleset. The worker re-runs such inputs
+    through `baseline` (the live classifier's content scan) and compares
+    against that; without a baseline they are excluded and counted.
+    """
+
+    def __init__(self, candidate: Optional[Callable[[str, str, Optional[str]], Dict]], sample_rate: float = 0.05,
+                 max_queued: int = 1000, candidate_version: Optional[str] = None, enabled: bool = True,
+                 baseline: Optional[Callable[[str, str, Optional[str]], Dict]] = None):
+        self.candidate = candidate
+        self.baseline = baseline
+        self.sample_rate = sample_rate
+        self.candidate_version = candidate_version
+        self.enabled = enabled
+
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._pid = None
+        self._reset_stats()
+
+    @classmethod
+    def from_config(cls, config, candidate, candidate_version=None, baseline=None) -> 'ShadowEvaluator':
+        return cls(
+            candidate=candidate,
+            baseline=baseline,
+            sample_rate=config.SHADOW_SAMPLE_RATE,
+            max_queued=config.SHADOW_MAX_QUEUED,
+            candidate_version=candidate_version,
+            enabled=config.SHADOW_ENABLED and candidate is not None
+        )
+
+    def _reset_stats(self):
+        self._counts = dict.fromkeys(('sampled', 'evaluated', 'agreed', 'dropped', 'errors', 'rescanned', 'excluded'), 0)
+        self._confusion: Counter = Counter()
+        self._latency = {'live': deque(maxlen=LATENCY_WINDOW), 'candidate': deque(maxlen=LATENCY_WINDOW)}
+        self._confidence = {'live': 0.0, 'candidate': 0.0}
+        self._versions = {'live': None, 'candidate': self.candidate_version}
+        self._since = time.time()
+
+    def submit(self, subject: str, body: str, sender: Optional[str], result: Dict, seconds: float) -> bool:
+        """
+        Offer one live classification for shadowing (called on the request path)
+
+        Args:
+            subject (str): Email subject
+            body (str): Email body
+            sender (str): Sender address, if given
+            result (dict): The live classifier's result
+            seconds (float): The live classifier's latency
+
+        Returns:
+            bool: Whether the input was queued
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return False
+
+        try:
+            self._queue.put_nowait((subject, body, sender, result, seconds))
+        except queue.Full:
+            with self._lock:
+                self._counts['dropped'] += 1
+            SHADOW_SAMPLES.labels('dropped').inc()
+            return False
+
+        SHADOW_QUEUED.set(self._queue.qsize())
+        with self._lock:
+            self._counts['sampled'] += 1
+            self._ensure_worker()
+        return True
+
+    def stats(self) -> Dict:
+        """Agreement, confusion counts and latency of both versions"""
+        with self._lock:
+            counts = dict(self._counts)
+            confusion: Dict[str, Dict[str, int]] = {}
+            for (live, candidate), count in sorted(self._confusion.items()):
+                confusion.setdefault(live, {})[candidate] = count
+            latency = {version: _latency_summary(list(samples)) for version, samples in self._latency.items()}
+            confidence = dict(self._confidence)
+            versions = dict(self._versions)
+            since = self._since
+
+        evaluated = counts['evaluated']
+        return {
+            'enabled': self.enabled,
+            'versions': versions,
+            'sample_rate': self.sample_rate,
+            'since': since,
+            'queued': self._queue.qsize(),
+            'counts': counts,
+            'agreement_rate': round(counts['agreed'] / evaluated, 4) if evaluated else None,
+            'confusion': confusion,
+            'mean_confidence': {
+                version: round(total / evaluated, 4) if evaluated else None
+                for version, total in confidence.items()
+            },
+            'latency_ms': latency
+        }
+
+    def reset(self):
+        """Start a fresh comparison (queued samples are still evaluated)"""
+        with self._lock:
+            self._reset_stats()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            # Wakes an idle worker; a busy one sees the event after its item
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        # Called with the lock held. Threads do not survive fork, so the
+        # worker is (re)started lazily in whichever process samples traffic.
+        if self._pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='classifier-shadow', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        stop = self._stop
+        while not stop.is_set():
+            item = self._queue.get()
+            SHADOW_QUEUED.set(self._queue.qsize())
+            if item is None or stop.is_set():
+                return
+            try:
+                self._evaluate(*item)
+            except Exception as e:
+                with self._lock:
+                    self._counts['errors'] += 1
+                SHADOW_SAMPLES.labels('error').inc()
+                logger.warning("Shadow classification failed: %s", e)
+
+    def _evaluate(self, subject, body, sender, live, live_seconds):
+        if live.get('fast_path'):
+            if self.baseline is None:
+                with self._lock:
+                    self._counts['excluded'] += 1
+                SHADOW_SAMPLES.labels('excluded').inc()
+                return
+            started = time.perf_counter()
+            live = self.baseline(subject, body, sender)
+            live_seconds = time.perf_counter() - started
+            with self._lock:
+                self._counts['rescanned'] += 1
+
+        started = time.perf_counter()
+        result = self.candidate(subject, body, sender)
+        seconds = time.perf_counter() - started
+
+        live_category = live['category']
+        agreed = result['category'] == live_category
+        SHADOW_SAMPLES.labels('agree' if agreed else 'disagree').inc()
+        SHADOW_SECONDS.labels('live').observe(live_seconds)
+        SHADOW_SECONDS.labels('candidate').observe(seconds)
+
+        with self._lock:
+            self._counts['evaluated'] += 1
+            self._counts['agreed'] += agreed
+            self._confusion[(live_category, result['category'])] += 1
+            self._latency['live'].append(live_seconds)
+            self._latency['candidate'].append(seconds)
+            self._confidence['live'] += live['confidence']
+            self._confidence['candidate'] += result['confidence']
+            # Rulesets hot-reload, so report the versions actually compared last
+            self._versions['live'] = live.get('rule_version', self._versions['live'])
+            self._versions['candidate'] = result.get('rule_version', self._versions['candidate'])
+
+
+def _latency_summary(samples) -> Dict:
+    """p50/p99/mean in milliseconds of recent latencies"""
+    if not samples:
+        return {'p50': None, 'p99': None, 'mean': None, 'samples': 0}
+    samples.sort()
+    return {
+        'p50': round(samples[len(samples) // 2] * 1000, 4),
+        'p99': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 4),
+        'mean': round(sum(samples) / len(samples) * 1000, 4),
+        'samples': len(samples)
+    }
+
+
+# Example usage
+if __name__ == '__main__':
+    from classifier import EmailClassifier
+
+    live = EmailClassifier()
+    candidate = EmailClassifier(sender_fast_path=False)
+    shadow = ShadowEvaluator(candidate.scan, sample_rate=1.0, candidate_version='local', baseline=live.scan)
+
+    for subject, body in [("Urgent: deadline today", "Please review the contract ASAP."),
+                          ("Flash sale", "Limited time offer, 50% discount.")]:
+        started = time.perf_counter()
+        result = live.classify(subject, body)
+        shadow.submit(subject, body, None, result, time.perf_counter() - started)
+
+    time.sleep(0.2)
+    print(shadow.stats())
@@ -0,0 +1,420 @@
+"""
+Similarity Module
+CPU-only email embeddings and an approximate nearest-neighbour index
+Future: Swap the hashed embeddings for a small sentence-embedding model
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import REGISTRY
+
+SIMILAR_QUERY_SECONDS = REGISTRY.histogram(
+    'altme_similar_query_duration_seconds', 'Time spent finding similar emails'
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9']+")
+
+STOPWORDS = frozenset((
+    'the', 'and', 'for', 'you', 'your', 'are', 'with', 'this', 'that', 'have', 'from', 'our',
+    'will', 'can', 'not', 'all', 'any', 'was', 'has', 'its', 'let', 'know', 'please', 'thanks',
+    'hi', 'hello', 'best', 'regards', 'dear', 'com', 'www', 'http', 'https'
+))
+
+
+class HashingEmbedder:
+    """
+    TF-IDF weighted feature hashing followed by a sparse random projection
+
+    Tokens are hashed (crc32, so every process agrees) into `n_features`
+    document-frequency counters for IDF, and each token is projected onto
+    `projections` signed output dimensions. An email's vector is the
+    normalized sum of its tokens' projections weighted by (1 + log tf) * idf,
+    computed with a single bincount. IDF uses the document frequencies known
+    when the email is embedded.
+
+    Each token's hash and projection are cached in flat arrays, indexed by a
+    slot number per token. The cache is bounded by `cache_bytes`; once full,
+    tokens not in it are hashed again each time they are seen.
+    Not thread-safe; SimilarityIndex serializes access.
+    """
+
+    # Bytes per cached token besides its string: dict entry, slot int and array row
+    CACHE_ENTRY_BYTES = 120
+
+    def __init__(self, dim: int = 64, n_features: int = 1 << 20, projections: int = 4, seed: int = 0,
+                 cache_bytes: int = 64 << 20):
+        self.dim = dim
+        self.n_features = n_features
+        self.projections = projections
+        self.seed = seed
+        self.cache_bytes = cache_bytes
+        self.documents = 0
+        self._df = np.zeros(n_features, dtype=np.int32)
+
+        self._cache: Dict[str, int] = {}
+        self._cache_used = 0
+        self._features = np.zeros(1024, dtype=np.int64)
+        self._dims = np.zeros((1024, projections), dtype=np.int32)
+        self._signs = np.zeros((1024, projections), dtype=np.int8)
+
+    def tokens(self, subject: str, body: str, sender: str = '') -> Counter:
+        """Weighted token counts: subject words count twice, sender adds address and domain tokens"""
+        counts = Counter(
+            token for token in TOKEN_PATTERN.findall(body.lower()) if token not in STOPWORDS
+        )
+        for token in TOKEN_PATTERN.findall(subject.lower()):
+            if token not in STOPWORDS:
+                counts[token] += 2
+
+        sender = sender.lower()
+        if sender:
+            counts[f"from:{sender}"] += 2
+            domain = sender.rpartition('@')[2]
+            counts[f"domain:{domain}"] += 2
+        return counts
+
+    @property
+    def cache_used(self) -> int:
+        """Approximate bytes held by the token cache"""
+        return self._cache_used
+
+    def _slots(self, tokens) -> np.ndarray:
+        """Cache slots of `tokens`, hashing and projecting the ones not cached yet"""
+        cache = self._cache
+        missing = [token for token in tokens if token not in cache]
+        if not missing:
+            return np.fromiter((cache[token] for token in tokens), dtype=np.int64, count=len(tokens))
+
+        row_bytes = self._features.itemsize + self._dims[0].nbytes + self._signs[0].nbytes
+        cost = sum(map(sys.getsizeof, missing)) + len(missing) * (self.CACHE_ENTRY_BYTES + row_bytes)
+        keep = self._cache_used + cost <= self.cache_bytes
+
+        # Once the cache is full, new tokens use scratch rows past the cached
+        # ones that the next document overwrites
+        first = len(cache)
+        self._reserve(first + len(missing))
+        slots = cache if keep else dict(zip(missing, range(first, first + len(missing))))
+        for slot, token in enumerate(missing, first):
+            digest = zlib.crc32(token.encode('utf-8'), self.seed)
+            rng = np.random.default_rng(digest)
+            self._features[slot] = digest % self.n_features
+            self._dims[slot] = rng.integers(0, self.dim, self.projections)
+            self._signs[slot] = rng.choice(np.array([-1, 1]), self.projections)
+            if keep:
+                cache[token] = slot
+        if keep:
+            self._cache_used += cost
+        return np.fromiter((cache[token] if token in cache else slots[token] for token in tokens),
+                           dtype=np.int64, count=len(tokens))
+
+    def _reserve(self, count: int):
+        if count <= len(self._features):
+            return
+        capacity = max(count, 2 * len(self._features))
+        for name in ('_features', '_dims', '_signs'):
+            old = getattr(self, name)
+            grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def observe(self, counts: Counter):
+        """Add one document's tokens to the document frequencies"""
+        slots = self._slots(counts)
+        self._df[np.unique(self._features[slots])] += 1
+        self.documents += 1
+
+    def embed(self, counts: Counter) -> np.ndarray:
+        """Unit-length float32 embedding of weighted token counts"""
+        if not counts:
+            return np.zeros(self.dim, dtype=np.float32)
+
+        slots = self._slots(counts)
+        features = self._features[slots]
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(slots))
+        idf = np.log((1.0 + self.documents) / (1.0 + self._df[features])) + 1.0
+        weights = (1.0 + np.log(tf)) * idf
+
+        dims = self._dims[slots].ravel()
+        values = self._signs[slots].ravel() * np.repeat(weights, self.projections)
+        vector = np.bincount(dims, weights=values, minlength=self.dim).astype(np.float32)
+
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+
+class LSHIndex:
+    """
+    Random-hyperplane LSH over unit vectors, with query-directed multi-probe
+
+    Each of `tables` hash tables keys vectors by the signs of `bits` random
+    projections. A query gathers its own bucket in every table plus, if that
+    yields too few candidates, the buckets reached by flipping its least
+    certain bits; candidates are then re-ranked by exact cosine similarity.
+    Vectors are stored as float16 in one growable matrix; inserts are
+    incremental and positions are assigned in insertion order. Indexes of
+    at most `exact_below` vectors are simply scanned, which is both exact
+    and faster at that size.
+    """
+
+    def __init__(self, dim: int, tables: int = 12, bits: int = 14, probes: int = 2,
+                 max_candidates: int = 4096, exact_below: int = 4096, seed: int = 0,
+                 initial_capacity: int = 1024):
+        self.dim = dim
+        self.tables = tables
+        self.bits = bits
+        self.probes = probes
+        self.max_candidates = max_candidates
+        self.exact_below = exact_below
+
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((tables * bits, dim)).astype(np.float32)
+        self._bit_values = (1 << np.arange(bits, dtype=np.int64))
+        self._buckets: List[Dict[int, array]] = [{} for _ in range(tables)]
+        self._vectors = np.zeros((initial_capacity, dim), dtype=np.float16)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _margins(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors @ self._planes.T).reshape(len(vectors), self.tables, self.bits)
+
+    def _keys(self, margins: np.ndarray) -> np.ndarray:
+        return (margins > 0) @ self._bit_values
+
+    def add_many(self, vectors: np.ndarray) -> int:
+        """
+        Insert vectors in order
+
+        Returns:
+            int: Position of the first inserted vector
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        keys = self._keys(self._margins(vectors)).tolist()
+
+        with self._lock:
+            first = self._size
+            needed = first + len(vectors)
+            if needed > len(self._vectors):
+                grown = np.zeros((max(needed, 2 * len(self._vectors)), self.dim), dtype=np.float16)
+                grown[:first] = self._vectors[:first]
+                self._vectors = grown
+            self._vectors[first:needed] = vectors
+
+            for offset, row_keys in enumerate(keys):
+                position = first + offset
+                for table, key in zip(self._buckets, row_keys):
+                    bucket = table.get(key)
+                    if bucket is None:
+                        table[key] = array('I', (position,))
+                    else:
+                        bucket.append(position)
+            self._size = needed
+        return first
+
+    def vector(self, position: int) -> np.ndarray:
+        return self._vectors[position].astype(np.float32)
+
+    def query(self, vector: np.ndarray, k: int = 10, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Approximate k nearest neighbours by cosine similarity
+
+        Returns:
+            list: (position, similarity) pairs, most similar first
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if self._size <= self.exact_below:
+            with self._lock:
+                vectors, size = self._vectors, self._size
+            return self._rank(vectors, np.arange(size), vector, k, exclude)
+
+        margins = self._margins(vector[None, :])[0]
+        keys = self._keys(margins)
+        per_bucket = max(k, self.max_candidates // self.tables)
+
+        # Least certain bits first: the likeliest places for a near neighbour to land
+        flips = np.argsort(np.abs(margins), axis=1)[:, :self.probes]
+
+        with self._lock:
+            parts = [self._take(table, int(key), per_bucket) for table, key in zip(self._buckets, keys)]
+            if sum(map(len, parts)) < 4 * k:
+                for table, key, table_flips in zip(self._buckets, keys, flips):
+                    for bit in table_flips:
+                        parts.append(self._take(table, int(key) ^ (1 << int(bit)), per_bucket))
+            vectors = self._vectors
+            size = self._size
+
+        candidates = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        candidates = candidates[candidates < size]
+        return self._rank(vectors, candidates, vector, k, exclude)
+
+    @staticmethod
+    def _rank(vectors: np.ndarray, candidates: np.ndarray, vector: np.ndarray, k: int,
+              exclude: Optional[int]) -> List[Tuple[int, float]]:
+        """Exact top-k of the candidates by cosine similarity"""
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        if not len(candidates):
+            return []
+
+        scores = vectors[candidates].astype(np.float32) @ vector
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    @staticmethod
+    def _take(table: Dict[int, array], key: int, limit: int) -> np.ndarray:
+        # Copied under the lock; the newest entries are kept when a bucket is large
+        bucket = table.get(key)
+        if bucket is None:
+            return np.empty(0, dtype=np.int64)
+        return np.array(bucket[-limit:], dtype=np.int64)
+
+
+class SimilarityIndex:
+    """
+    Embeddings of an EmailStore's emails, kept in an LSH index
+
+    Index positions are store rows, so the store must only be appended to.
+    Stored emails are indexed by `start_build` on a background thread and
+    new ones as they are received, so queries never wait for a full build;
+    an email that is not indexed yet is embedded when it is queried.
+    """
+
+    def __init__(self, store, dim: int = 64, tables: int = 12, bits: int = 14, probes: int = 2, seed: int = 0,
+                 cache_bytes: int = 64 << 20):
+        self.store = store
+        self.embedder = HashingEmbedder(dim=dim, seed=seed, cache_bytes=cache_bytes)
+        self.index = LSHIndex(dim, tables=tables, bits=bits, probes=probes, seed=seed)
+        self._lock = threading.RLock()
+        self._builder: Optional[threading.Thread] = None
+        self._pid = None
+
+    def build(self, batch_size: int = 10000) -> int:
+        """
+        Index every stored email not yet indexed
+
+        Each email is tokenized once. A batch's document frequencies are
+        counted before it is embedded, so a corpus of up to `batch_size`
+        emails gets its full IDF, and a larger one the IDF of every email up
+        to the end of each batch. The lock is held per batch, so queries and
+        ingest are not held up for the whole build.
+
+        Returns:
+            int: Number of emails indexed
+        """
+        indexed = 0
+        while True:
+            with self._lock:
+                start = len(self.index)
+                stop = min(len(self.store), start + batch_size)
+                if start >= stop:
+                    return indexed
+                batch = [self._tokens(row) for row in range(start, stop)]
+                for counts in batch:
+                    self.embedder.observe(counts)
+                self.index.add_many(np.stack([self.embedder.embed(counts) for counts in batch]))
+            indexed += stop - start
+
+    def start_build(self):
+        """Index the stored emails on a background thread (if not already running here)"""
+        with self._lock:
+            # Threads do not survive fork, so a build is restarted in whichever process needs it
+            if self._pid == os.getpid() and self._builder is not None and self._builder.is_alive():
+                return
+            self._pid = os.getpid()
+            self._builder = threading.Thread(target=self.build, name='similarity-build', daemon=True)
+            self._builder.start()
+
+    def building(self) -> bool:
+        builder = self._builder
+        return self._pid == os.getpid() and builder is not None and builder.is_alive()
+
+    def add_email(self, email: Dict) -> bool:
+        """
+        Index a newly received email (an EmailClient subscriber)
+
+        Returns:
+            bool: Whether the email was indexed
+        """
+        row = self.store.row_of(email['id'])
+        if row is None:
+            return False
+
+        with self._lock:
+            if row < len(self.index):
+                return False
+            if row > len(self.index):
+                # Earlier rows are not indexed yet: a running build reaches
+                # this one too, otherwise catch up here
+                if not self.building():
+                    self.build()
+                return True
+
+            counts = self._tokens(row)
+            self.embedder.observe(counts)
+            self.index.add_many(self.embedder.embed(counts))
+        return True
+
+    def similar(self, email_id: str, k: int = 10) -> Optional[List[Tuple[str, float]]]:
+        """
+        Emails most similar to a stored email
+
+        Args:
+            email_id (str): The email ID
+            k (int): Number of results
+
+        Returns:
+            list: (email_id, similarity) pairs with positive similarity, most
+            similar first, or None if the email is unknown
+        """
+        row = self.store.row_of(email_id)
+        if row is None:
+            return None
+
+        started = time.perf_counter()
+        if row < len(self.index):
+            vector = self.index.vector(row)
+        else:
+            # Not indexed yet: embed it now and search what is indexed so far
+            self.start_build()
+            with self._lock:
+                vector = self.embedder.embed(self._tokens(row))
+
+        # Deleted emails keep their index entries; over-fetch so they can be dropped
+        wanted = k + min(self.store.deleted, k)
+        hits = self.index.query(vector, wanted, exclude=row)
+        SIMILAR_QUERY_SECONDS.observe(time.perf_counter() - started)
+        return [
+            (self.store.email_id(position), round(score, 4))
+            for position, score in hits if score > 0 and not self.store.is_deleted(position)
+        ][:k]
+
+    def _tokens(self, row: int) -> Counter:
+        return self.embedder.tokens(self.store.subject(row), self.store.body(row), self.store.sender(row))
+
+
+# Example usage
+if __name__ == '__main__':
+    from email_client import EmailClient
+
+    client = EmailClient()
+    similarity = SimilarityIndex(client.store)
+    print(f"Indexed {similarity.build()} emails, token cache {similarity.embedder.cache_used} bytes")
+
+    for email_id, score in similarity.similar('email_001', k=3):
+        print(f"  {score:.3f}  {client.store.get(email_id)['subject']}")
@@ -0,0 +1,53 @@
+"""
+Test configuration
+Backend modules are flat and imported by name, as main.py does
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import load_config  # noqa: E402
+from main import create_app  # noqa: E402
+
+# Background work each component may have started, stopped after every test
+_STOPPERS = {
+    'classifier': lambda classifier: classifier.rules.stop_watching(),
+    'db': lambda db: db.stop_retention(),
+    'prefetcher': lambda prefetcher: prefetcher.stop(),
+    'digest': lambda digest: digest.stop(),
+    'shadow': lambda shadow: shadow.stop()
+}
+
+
+@pytest.fixture
+def make_app():
+    """
+    Build apps from the default configuration with `overrides` applied
+    Prefetching is off unless a test turns it on, and every app's
+    background threads are stopped when the test ends.
+    """
+    apps = []
+
+    def make(**overrides):
+        overrides.setdefault('PREFETCH_ENABLED', False)
+        app = create_app(type('TestConfig', (load_config(),), overrides))
+        apps.append(app)
+        return app
+
+    yield make
+
+    for app in apps:
+        components = app.extensions['components']
+        for name, stop in _STOPPERS.items():
+            if components.is_loaded(name):
+                stop(components.get(name))
+
+
+@pytest.fixture
+def client(make_app):
+    """Test client of an app with the default configuration"""
+    return make_app().test_client()
@@ -0,0 +1,58 @@
+"""
+Action Log Tests
+Histogram bucketing on the sorted (searchsorted) and unsorted (bincount) paths
+"""
+
+import random
+
+import pytest
+
+from action_log import HISTOGRAM_INTERVALS, ActionLog
+
+DAY = HISTOGRAM_INTERVALS['day']
+
+
+def _logs(rows):
+    """The same rows appended in time order and out of order"""
+    ordered, shuffled = ActionLog(), ActionLog()
+    for timestamp, has_reply in sorted(rows):
+        ordered.append(timestamp, 'Important', 'sent', has_reply=has_reply)
+    for timestamp, has_reply in sorted(rows, reverse=True):
+        shuffled.append(timestamp, 'Important', 'sent', has_reply=has_reply)
+    assert ordered._sorted and not shuffled._sorted
+    return ordered, shuffled
+
+
+@pytest.mark.parametrize('only_replies', [False, True])
+def test_timestamp_on_bucket_edge_gets_its_own_bucket(only_replies):
+    rows = [(10 * DAY + 5, True), (10 * DAY + 100, False), (11 * DAY, True), (12 * DAY, True)]
+    ordered, shuffled = _logs(rows)
+    expected = shuffled.histogram('day', only_replies=only_replies)
+    assert ordered.histogram('day', only_replies=only_replies) == expected
+    assert expected[-1] == {'start': 12 * DAY, 'count': 1}
+
+
+def test_single_row():
+    ordered = ActionLog()
+    ordered.append(3 * DAY, 'Important', 'sent', has_reply=True)
+    assert ordered.histogram('day') == [{'start': 3 * DAY, 'count': 1}]
+    assert ordered.histogram('day', only_replies=True) == [{'start': 3 * DAY, 'count': 1}]
+
+
+def test_replies_are_counted_in_their_own_buckets():
+    rows = [(DAY + 1, False), (DAY + 2, True), (3 * DAY, False), (5 * DAY, True), (5 * DAY + 7, True)]
+    ordered, _ = _logs(rows)
+    assert ordered.histogram('day', only_replies=True) == [
+        {'start': DAY, 'count': 1},
+        {'start': 5 * DAY, 'count': 2}
+    ]
+
+
+@pytest.mark.parametrize('interval', sorted(HISTOGRAM_INTERVALS))
+def test_sorted_path_matches_bincount_path(interval):
+    generator = random.Random(7)
+    rows = [(generator.randrange(0, 60 * DAY, 3600), generator.random() < 0.3) for _ in range(500)]
+    ordered, shuffled = _logs(rows)
+    for only_replies in (False, True):
+        assert ordered.histogram(interval, only_replies=only_replies) == \
+            shuffled.histogram(interval, only_replies=only_replies)
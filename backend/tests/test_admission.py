@@ -0,0 +1,28 @@
+"""
+Admission Tests
+Per-user limit tracking and controller status
+"""
+
+from admission import AdmissionController
+
+
+def test_recently_seen_users_are_kept_when_full(monkeypatch):
+    monkeypatch.setattr(AdmissionController, 'MAX_TRACKED_USERS', 3)
+    controller = AdmissionController(user_budget=100)
+    first = controller._for_user('a')
+    controller._for_user('b')
+    controller._for_user('c')
+
+    # 'a' is seen again, so 'b' is now the least recently seen
+    assert controller._for_user('a') is first
+    controller._for_user('d')
+    assert set(controller._users) == {'a', 'c', 'd'}
+    assert controller._for_user('a') is first
+
+
+def test_status_reports_budget_and_users():
+    controller = AdmissionController(budget=50)
+    with controller.admit('a', cost=20):
+        pass
+    assert controller.status() == {'global_budget_remaining': 30, 'tracked_users': 1}
+    assert AdmissionController().status()['global_budget_remaining'] is None
@@ -0,0 +1,37 @@
+"""
+Application Factory Tests
+Each app reads its own configuration and reports its own components
+"""
+
+import json
+
+
+def test_factories_read_the_app_config(make_app):
+    first = make_app(ACTION_MAX_RAW=7)
+    second = make_app(ACTION_MAX_RAW=11)
+    with first.app_context():
+        assert first.extensions['components'].db.max_actions == 7
+    with second.app_context():
+        assert second.extensions['components'].db.max_actions == 11
+
+
+def test_size_gauges_are_scoped_per_app(make_app):
+    loaded = make_app()
+    idle = make_app()
+    with loaded.app_context():
+        loaded.extensions['components'].warmup(['email_client'])
+
+    loaded_metrics = loaded.test_client().get('/metrics').get_data(as_text=True)
+    idle_metrics = idle.test_client().get('/metrics').get_data(as_text=True)
+    assert 'altme_emails_cached 0' not in loaded_metrics
+    assert 'altme_emails_cached 0' in idle_metrics
+
+
+def test_profiling_is_enabled_per_app(make_app):
+    profiled = make_app(PROFILE_ENABLED=True)
+    plain = make_app(PROFILE_ENABLED=False)
+    assert plain.test_client().get('/debug/profile').status_code == 404
+
+    response = profiled.test_client().get('/debug/profile?seconds=5&format=json')
+    assert response.status_code == 202
+    assert json.loads(response.get_data())['capturing_seconds'] == 5
@@ -0,0 +1,26 @@
+"""
+Batch Draft Tests
+Input validation of POST /generate_reply/batch
+"""
+
+import json
+
+import pytest
+
+EMAILS = [{'id': 'e1', 'subject': 'Project deadline', 'body': 'Can you send the report by Friday?',
+           'sender': 'manager@company.com'}]
+
+
+@pytest.mark.parametrize('concurrency', ['many', [2], {'n': 2}])
+def test_invalid_concurrency_is_a_bad_request(client, concurrency):
+    response = client.post('/generate_reply/batch', json={'emails': EMAILS, 'concurrency': concurrency})
+    assert response.status_code == 400
+    assert json.loads(response.get_data())['error'] == 'concurrency must be an integer'
+
+
+def test_valid_concurrency_is_accepted(client):
+    response = client.post('/generate_reply/batch', json={'emails': EMAILS, 'concurrency': '2'})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['id'] == 'e1'
+    assert lines[-1]['done']
@@ -0,0 +1,88 @@
+"""
+Change Feed Tests
+Cursor handling in ChangeFeed and the inbox ingest and change endpoints
+"""
+
+import json
+
+from changes import EMAIL_ADDED, EMAIL_UPDATED, ChangeFeed, compact
+
+
+def test_cursor_reads_changes_after_it():
+    feed = ChangeFeed()
+    for n in range(5):
+        feed.publish(EMAIL_ADDED, f"e{n}")
+    changes, sequence, reset = feed.since(2)
+    assert [change[0] for change in changes] == [3, 4, 5]
+    assert (sequence, reset) == (5, False)
+    assert feed.since(5) == ([], 5, False)
+
+
+def test_limit_returns_the_last_included_sequence():
+    feed = ChangeFeed()
+    for n in range(5):
+        feed.publish(EMAIL_ADDED, f"e{n}")
+    changes, sequence, reset = feed.since(0, limit=2)
+    assert [change[0] for change in changes] == [1, 2]
+    assert sequence == 2 and not reset
+
+
+def test_cursor_older_than_the_log_resets():
+    feed = ChangeFeed(capacity=3)
+    for n in range(10):
+        feed.publish(EMAIL_ADDED, f"e{n}")
+    assert feed.since(7)[2] is False
+    assert feed.since(6) == ([], 10, True)
+
+
+def test_cursor_ahead_of_the_feed_resets_without_waiting():
+    feed = ChangeFeed()
+    feed.publish(EMAIL_ADDED, 'e1')
+    # e.g. a client that kept its cursor across a server restart
+    assert feed.since(40) == ([], 1, True)
+    assert feed.wait(40, timeout=5) == ([], 1, True)
+
+
+def test_compact_keeps_the_latest_change_per_email():
+    changes = [(1, EMAIL_ADDED, 'a'), (2, EMAIL_UPDATED, 'b'), (3, EMAIL_UPDATED, 'a')]
+    assert compact(changes) == [(2, EMAIL_UPDATED, 'b'), (3, EMAIL_ADDED, 'a')]
+
+
+def test_reading_the_inbox_publishes_nothing(client):
+    first = json.loads(client.get('/emails').get_data())
+    second = json.loads(client.get('/emails').get_data())
+    assert first['emails'][0]['classification'] is not None
+    assert first['seq'] == second['seq'] == 0
+
+
+def test_received_email_is_listed_first_and_announced(client):
+    response = client.post('/emails', json={'id': 'new_1', 'sender': 'a@b.com', 'subject': 'Hello',
+                                            'body': 'Are you free tomorrow?'})
+    assert response.status_code == 201
+    assert json.loads(client.get('/emails?limit=1').get_data())['emails'][0]['id'] == 'new_1'
+
+    changes = json.loads(client.get('/emails/changes?since=0&timeout=0').get_data())
+    assert [(change['op'], change['id']) for change in changes['changes']] == [('added', 'new_1')]
+
+    again = client.post('/emails', json={'id': 'new_1', 'sender': 'a@b.com', 'subject': 'x', 'body': 'y'})
+    assert again.status_code == 409
+    assert client.post('/emails', json={'sender': 'a@b.com'}).status_code == 400
+
+
+def test_unstorable_email_is_rejected_without_breaking_the_inbox(client):
+    for fields in ({'timestamp': '0001-01-01T00:00:00'}, {'timestamp': 'soon'}, {'unread': 'no'}):
+        email = dict({'sender': 'a@b.com', 'subject': 'Hello', 'body': 'Hi'}, **fields)
+        assert client.post('/emails', json=email).status_code == 400
+    assert client.get('/emails').status_code == 200
+
+    response = client.post('/emails', json={'sender': 'a@b.com', 'subject': 'Hi', 'body': 'x', 'unread': False})
+    assert json.loads(response.get_data())['email']['unread'] is False
+
+
+def test_received_email_joins_its_thread():
+    from email_client import EmailClient
+    inbox = EmailClient()
+    inbox.receive({'id': 't1', 'sender': 'a@b.com', 'subject': 'Budget', 'body': 'First'})
+    assert [email['id'] for email in inbox.thread('Re: Budget')] == ['t1']
+    inbox.receive({'id': 't2', 'sender': 'b@b.com', 'subject': 'RE: budget', 'body': 'Second'})
+    assert [email['id'] for email in inbox.thread('Budget')] == ['t1', 't2']
@@ -0,0 +1,98 @@
+"""
+Database Retention Tests
+Eviction by age, count and memory, rollups, lookups after eviction and
+the retention thread's lifetime
+"""
+
+import gc
+import time
+import weakref
+
+from action_log import ActionLog
+from db import Database, RECORD_OVERHEAD_BYTES, _RETAINING
+
+DAY = 86400
+
+
+def _save(db, count, **fields):
+    return [db.save_action(dict({'email_id': f"e{n}", 'action': 'sent', 'classification': 'Important'}, **fields))['id']
+            for n in range(count)]
+
+
+def test_count_limit_evicts_oldest_into_rollups():
+    db = Database(max_actions=3, step_size=100)
+    ids = _save(db, 5, reply='Sounds good')
+    assert db.enforce_retention() == {'actions': 2, 'log': 0}
+
+    assert [action['id'] for action in db.actions] == ids[2:]
+    rollups = db.get_rollups()
+    assert len(rollups) == 1
+    assert rollups[0]['actions'] == 2 and rollups[0]['replies'] == 2
+    assert rollups[0]['by_category'] == {'Important': 2}
+    assert rollups[0]['by_action'] == {'sent': 2}
+    assert db.statistics['actions_rolled_up'] == 2
+
+
+def test_age_limit_is_applied_in_bounded_steps():
+    db = Database(retention_days=1, step_size=2)
+    _save(db, 5)
+    later = time.time() + 2 * DAY
+    assert db.enforce_retention(now=later)['actions'] == 2
+    assert db.enforce_retention(now=later)['actions'] == 2
+    assert db.enforce_retention(now=later)['actions'] == 1
+    assert db.actions == []
+    assert db.enforce_retention(now=time.time())['actions'] == 0
+
+
+def test_byte_budget_evicts_large_replies():
+    db = Database(max_bytes=int(3.5 * (RECORD_OVERHEAD_BYTES + 10000)))
+    _save(db, 6, reply='x' * 10000)
+    assert db.retention_stats()['raw_bytes'] > db.max_bytes
+    db.enforce_retention()
+    assert len(db.actions) == 3
+    assert db.retention_stats()['raw_bytes'] <= db.max_bytes
+
+
+def test_lookups_after_eviction():
+    db = Database(max_actions=2)
+    ids = _save(db, 5)
+    db.enforce_retention()
+
+    assert db.get_action(ids[0]) is None
+    assert db.get_action(ids[3])['id'] == ids[3]
+    assert [action['id'] for action in db.iter_actions()] == ids[3:]
+    assert [action['id'] for action in db.iter_actions(after_id=ids[1])] == ids[3:]
+    assert [action['id'] for action in db.iter_actions(after_id=ids[3])] == ids[4:]
+
+
+def test_action_log_evict():
+    log = ActionLog()
+    log.extend_columns([100, 200, 300, 400, 500], ['A'] * 5, ['sent'] * 5,
+                       has_reply=[True] * 5, response_seconds=[1.0] * 5)
+    assert log.evict(max_rows=3, limit=1) == 1
+    assert len(log) == 4
+    assert log.evict(max_rows=3) == 1
+    assert log.evict(before=400) == 1
+    assert len(log) == 2
+    assert log.evict(before=400, max_rows=10) == 0
+    assert log.summary()['total_actions'] == 2
+
+
+def test_dropped_database_stops_its_retention_thread():
+    db = Database(max_actions=10, retention_interval=0.01)
+    thread = db._retainer
+    assert db in _RETAINING
+    ref = weakref.ref(db)
+    del db
+    gc.collect()
+    assert ref() is None
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+
+
+def test_stop_retention_forgets_the_database():
+    db = Database(max_actions=10, retention_interval=60)
+    db.stop_retention()
+    db._retainer.join(timeout=2)
+    assert db not in _RETAINING
+    assert not db._retainer.is_alive()
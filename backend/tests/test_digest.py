@@ -0,0 +1,89 @@
+"""
+Digest Tests
+Windows, working hours, de-duplication and prompt packing
+"""
+
+import time
+from datetime import datetime
+
+import pytest
+
+from digest import DigestQueue, within_working_hours
+from prompt import estimate_tokens
+
+PROMO = {'category': 'Promotional', 'confidence': 0.9}
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(**kwargs):
+        prompts = []
+
+        def summarize(prompt):
+            prompts.append(prompt)
+            return {'summary': 'Sales from shops.'}
+
+        queue = DigestQueue(summarize, lambda *args: PROMO, **kwargs)
+        queues.append(queue)
+        return queue, prompts
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def _email(n, **fields):
+    return dict({'id': f"p{n}", 'sender': f"deals{n % 3}@shop.com", 'subject': f"Sale {n}", 'body': 'Offer'},
+                **fields)
+
+
+def test_window_is_due_after_it_has_been_open_long_enough(make_queue):
+    queue, prompts = make_queue(window_seconds=3600)
+    assert not queue.due()
+    assert queue.flush() is None
+
+    queue.offer(_email(1))
+    opened = time.time()
+    assert not queue.due(now=opened + 60)
+    assert queue.due(now=opened + 3601)
+
+    digest = queue.flush()
+    assert digest['count'] == 1 and digest['summary'] == 'Sales from shops.'
+    assert queue.pending()['count'] == 0
+    assert queue.digests() == [digest]
+    assert len(prompts) == 1
+
+
+def test_overnight_working_hours_wrap_past_midnight():
+    hours = {'start': '22:00', 'end': '06:00'}
+    assert within_working_hours(hours, datetime(2024, 1, 15, 23, 30))
+    assert within_working_hours(hours, datetime(2024, 1, 16, 5, 59))
+    assert not within_working_hours(hours, datetime(2024, 1, 16, 12, 0))
+    # Monday only
+    assert not within_working_hours({'days': [0]}, datetime(2024, 1, 16, 12, 0))
+    assert within_working_hours(None, datetime(2024, 1, 16, 12, 0))
+
+
+def test_reoffered_emails_are_counted_once_beyond_max_items(make_queue):
+    queue, _ = make_queue(max_items=2)
+    emails = [_email(n) for n in range(5)]
+    assert queue.offer_many(emails) == 5
+    # The startup rescan or a redelivery offers the same mail again
+    assert queue.offer_many(emails) == 0
+    assert queue.pending()['count'] == 5
+    assert queue.flush()['count'] == 5
+
+
+def test_prompt_stays_within_budget(make_queue):
+    queue, prompts = make_queue(max_input_tokens=200)
+    for n in range(300):
+        queue.offer(_email(n, sender='x' * 500 + '@shop.com', subject='Huge sale ' * 100))
+    digest = queue.flush()
+    prompt = prompts[0]
+    content = prompt['messages'][1]['content']
+    assert prompt['tokens'] <= 200
+    assert estimate_tokens(content) <= prompt['tokens']
+    assert digest['count'] == 300
+    assert content.endswith('more not listed)')
@@ -0,0 +1,59 @@
+"""
+Export Tests
+Resumable cursors, CSV row counting and gzip attachments of the bulk exports
+"""
+
+import csv
+import gzip
+import io
+import json
+
+from export import EXPORTED_ROWS, encode
+
+
+def _save(client, actions):
+    client.post('/save/batch', json=[{'email_id': f"email_{n:03d}", 'action': 'sent'} for n in range(actions)])
+
+
+def _ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_action_cursor_resumes_after_the_last_id(client):
+    _save(client, 10)
+    first = _ndjson(client.get('/export/actions?limit=4'))
+    rest = _ndjson(client.get(f"/export/actions?cursor={first[-1]['id']}"))
+    assert len(first) == 4 and len(rest) == 6
+    assert [action['id'] for action in first + rest] == \
+        [action['id'] for action in _ndjson(client.get('/export/actions'))]
+
+
+def test_email_cursor_resumes_after_the_last_id(client):
+    everything = _ndjson(client.get('/export/emails'))
+    first = _ndjson(client.get('/export/emails?limit=3'))
+    rest = _ndjson(client.get(f"/export/emails?cursor={first[-1]['id']}"))
+    assert [email['id'] for email in first + rest] == [email['id'] for email in everything]
+
+
+def test_unknown_cursors_are_rejected(client):
+    _save(client, 1)
+    assert client.get('/export/actions?cursor=action_9999').status_code == 400
+    assert client.get('/export/emails?cursor=missing').status_code == 400
+
+
+def test_csv_header_is_not_counted_as_a_row():
+    counter = EXPORTED_ROWS.labels('test_csv')
+    before = counter.get()
+    data = b''.join(encode(({'id': n} for n in range(3)), 'csv', ('id',), 'test_csv'))
+    assert list(csv.reader(io.StringIO(data.decode()))) == [['id'], ['0'], ['1'], ['2']]
+    assert counter.get() - before == 3
+
+
+def test_gzip_export_is_a_gz_attachment(client):
+    _save(client, 3)
+    response = client.get('/export/actions?format=csv&gzip=true')
+    assert response.headers['Content-Type'] == 'application/gzip'
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Content-Disposition'].endswith('actions.csv.gz')
+    rows = list(csv.reader(io.StringIO(gzip.decompress(response.get_data()).decode())))
+    assert len(rows) == 4
@@ -0,0 +1,64 @@
+"""
+Mail Store Tests
+Rejected emails leave no partial row and concurrent adds stay aligned
+"""
+
+import threading
+
+import pytest
+
+from mailstore import EmailStore
+
+
+def _email(email_id, **fields):
+    return dict({'id': email_id, 'sender': 'a@example.com', 'subject': 'Hi', 'body': 'Hello',
+                 'timestamp': '2024-01-15T09:30:00'}, **fields)
+
+
+@pytest.mark.parametrize('fields', [
+    {'timestamp': '0001-01-01T00:00:00'},
+    {'timestamp': 10 ** 20},
+    {'timestamp': 'yesterday'},
+    {'priority': 500},
+    {'priority': 'high'},
+])
+def test_invalid_email_leaves_store_unchanged(fields):
+    store = EmailStore()
+    store.add(_email('e1'))
+    with pytest.raises(ValueError):
+        store.add(_email('e2', **fields))
+
+    assert len(store) == 1
+    assert store.row_of('e2') is None
+    assert [email['id'] for email in store.iter_dicts()] == ['e1']
+    assert store.page() == [0]
+    store.add(_email('e2'))
+    assert [store.to_dict(row)['id'] for row in store.page()] == ['e2', 'e1']
+
+
+def test_duplicate_id_is_rejected():
+    store = EmailStore()
+    store.add(_email('e1'))
+    with pytest.raises(ValueError):
+        store.add(_email('e1', subject='Again'))
+    assert len(store) == 1
+
+
+def test_concurrent_adds_keep_columns_aligned():
+    store = EmailStore()
+
+    def add(prefix):
+        for index in range(500):
+            store.add(_email(f'{prefix}-{index}', subject=f'{prefix}-{index}'))
+
+    threads = [threading.Thread(target=add, args=(prefix,)) for prefix in 'abcd']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store) == 2000
+    for row in range(len(store)):
+        email = store.to_dict(row)
+        assert email['subject'] == email['id']
+        assert store.row_of(email['id']) == row
@@ -0,0 +1,59 @@
+"""
+Metrics Tests
+Per-thread accumulation and label lookup in the metrics registry
+"""
+
+import threading
+
+from metrics import MetricsRegistry, _ThreadCells
+
+
+def _run_threads(target, count=8):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_counter_increments_are_not_lost():
+    counter = MetricsRegistry().counter('test_total', 'Test counter', ('kind',))
+
+    def work():
+        for _ in range(10000):
+            counter.labels('a').inc()
+
+    _run_threads(work)
+    assert counter.labels('a').get() == 80000
+
+
+def test_histogram_buckets_and_sum():
+    histogram = MetricsRegistry().histogram('test_seconds', 'Test histogram', buckets=(0.1, 1.0))
+
+    def work():
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value)
+
+    _run_threads(work, count=4)
+    counts, total = histogram._default.snapshot()
+    assert counts == [4, 4, 4]
+    assert abs(total - 4 * 5.55) < 1e-9
+
+
+def test_labels_returns_same_child_for_equivalent_values():
+    counter = MetricsRegistry().counter('test_total', 'Test counter', ('code',))
+    counter.labels(200).inc()
+    counter.labels('200').inc()
+    assert counter.labels(200) is counter.labels('200')
+    assert counter.labels('200').get() == 2
+
+
+def test_finished_threads_are_folded_without_losing_counts():
+    cells = _ThreadCells(1)
+
+    def work():
+        cells.cell()[0] += 1
+
+    _run_threads(work, count=_ThreadCells.COMPACT_AT * 2)
+    assert cells.totals() == [_ThreadCells.COMPACT_AT * 2]
+    assert cells._cells == []
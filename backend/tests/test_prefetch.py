@@ -0,0 +1,86 @@
+"""
+Prefetch Tests
+Prefetched drafts are charged like foreground drafts and respect tone
+"""
+
+import time
+
+from prefetch import DraftPrefetcher
+from prompt import PromptBuilder
+
+EMAIL = {'subject': 'Contract review', 'body': 'Please review the contract by Friday.', 'sender': 'a@example.com'}
+IMPORTANT = {'category': 'Important', 'confidence': 0.9}
+
+
+def _prefetcher(**kwargs):
+    calls = []
+
+    def generate(subject, body, sender, prompt=None):
+        calls.append(prompt)
+        return {'reply': 'Will do.', 'tone': prompt['tone'] if prompt else 'Professional'}
+
+    prefetcher = DraftPrefetcher(generate, lambda *args: IMPORTANT, idle_seconds=0, max_tokens=150, **kwargs)
+    return prefetcher, calls
+
+
+def _wait_for(prefetcher, count='generated'):
+    deadline = time.monotonic() + 2
+    while prefetcher.stats()[count] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_charges_prompt_tokens_like_admission():
+    builder = PromptBuilder()
+    expected = builder.build(EMAIL['subject'], EMAIL['body'], EMAIL['sender'])['tokens'] + 150
+    prefetcher, calls = _prefetcher(build_prompt=builder.build, budget=expected)
+    try:
+        assert prefetcher.offer(dict(EMAIL))
+        _wait_for(prefetcher)
+        assert calls and calls[0]['tokens'] + 150 == expected
+        assert prefetcher.stats()['budget_remaining'] == 0
+    finally:
+        prefetcher.stop()
+
+
+def test_take_only_serves_matching_tone():
+    prefetcher, _ = _prefetcher(build_prompt=PromptBuilder().build)
+    try:
+        prefetcher.offer(dict(EMAIL))
+        _wait_for(prefetcher)
+        args = (EMAIL['subject'], EMAIL['body'], EMAIL['sender'])
+
+        # Another tone misses without consuming the draft
+        assert prefetcher.take(*args, tone='Casual') is None
+        assert prefetcher.take(*args, tone='Professional')['reply'] == 'Will do.'
+        assert prefetcher.take(*args) is None
+        assert prefetcher.stats()['hits'] == 1
+    finally:
+        prefetcher.stop()
+
+
+def test_over_budget_is_not_generated():
+    prefetcher, calls = _prefetcher(build_prompt=PromptBuilder().build, budget=10)
+    try:
+        prefetcher.offer(dict(EMAIL))
+        _wait_for(prefetcher, 'over_budget')
+        assert prefetcher.stats()['over_budget'] == 1
+        assert not calls
+    finally:
+        prefetcher.stop()
+
+
+def test_lookups_for_mail_never_queued_are_not_misses():
+    prefetcher, _ = _prefetcher(build_prompt=PromptBuilder().build)
+    try:
+        prefetcher.offer(dict(EMAIL))
+        _wait_for(prefetcher)
+        prefetcher.classify = lambda *args: {'category': 'Promotional', 'confidence': 0.9}
+        assert not prefetcher.offer({'subject': 'Sale', 'body': 'Half price', 'sender': 'deals@shop.com'})
+
+        assert prefetcher.take('Sale', 'Half price', 'deals@shop.com') is None
+        assert prefetcher.take(EMAIL['subject'], EMAIL['body'], EMAIL['sender'], tone='Casual') is None
+        stats = prefetcher.stats()
+        assert (stats['ineligible'], stats['misses'], stats['hits']) == (1, 1, 0)
+        assert stats['hit_rate'] == 0.0
+    finally:
+        prefetcher.stop()
@@ -0,0 +1,48 @@
+"""
+Profiler Tests
+Sampler wakeups and non-blocking capture windows
+"""
+
+import threading
+import time
+
+from profiler import Profiler
+
+
+def _profiler():
+    return Profiler()
+
+
+def test_start_capture_does_not_block_and_selects_requests():
+    profiler = _profiler()
+    started = time.monotonic()
+    assert profiler.start_capture('/classify', 30) == 30
+    assert time.monotonic() - started < 1
+    assert profiler.begin('/classify')
+    assert not profiler.begin('/other')
+    profiler.end()
+
+
+def test_wakeup_reaches_parked_sampler():
+    profiler = _profiler()
+    profiler.begin('/classify', {'X-Debug-Profile': '1'}, interval_ms=1)
+    profiler.end()
+    sampler = profiler._sampler
+    # Let the sampler go idle and park
+    time.sleep(1.2)
+    assert sampler.is_alive()
+
+    done = threading.Event()
+
+    def request():
+        profiler.begin('/classify', {'X-Debug-Profile': '1'}, interval_ms=1)
+        done.wait(1)
+        profiler.end()
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    time.sleep(0.1)
+    done.set()
+    thread.join()
+    assert profiler._sampler is sampler
+    assert 'test_profiler:request' in profiler.collapsed('/classify')
@@ -0,0 +1,83 @@
+"""
+Prompt Tests
+Input budget holds whatever the email looks like
+"""
+
+from types import SimpleNamespace
+
+from prompt import LINE_SEPARATOR_TOKENS, MESSAGE_OVERHEAD_TOKENS, PromptBuilder, estimate_tokens
+
+
+def test_huge_subject_stays_within_budget():
+    builder = PromptBuilder(max_input_tokens=1500)
+    prompt = builder.build('word ' * 5000, 'Can we meet on Friday?', 'a@example.com')
+    assert prompt['tokens'] <= prompt['budget']
+    assert 'Can we meet on Friday?' in prompt['messages'][1]['content']
+
+
+def test_huge_sender_stays_within_budget():
+    builder = PromptBuilder(max_input_tokens=1500)
+    prompt = builder.build('Meeting', 'Can we meet on Friday?', 'x' * 100000 + '@example.com')
+    assert prompt['tokens'] <= prompt['budget']
+    assert 'Can we meet on Friday?' in prompt['messages'][1]['content']
+
+
+def test_huge_everything_stays_within_budget():
+    examples = [{'reply': 'word ' * 1000}] * 10
+    threads = [{'sender': 'y' * 5000, 'body': 'word ' * 1000}] * 10
+    builder = PromptBuilder(
+        max_input_tokens=800,
+        threads=lambda subject, exclude_id=None, limit=5: threads[:limit],
+        examples=lambda n: examples[:n]
+    )
+    prompt = builder.build('word ' * 5000, 'word ' * 50000, 'x' * 100000)
+    assert prompt['tokens'] <= prompt['budget']
+    content = ''.join(message['content'] for message in prompt['messages'])
+    assert estimate_tokens(content) <= prompt['budget']
+
+
+def test_short_header_is_kept_whole():
+    prompt = PromptBuilder().build('Project Deadline', 'Submit by Thursday.', 'manager@company.com')
+    assert 'Latest email from manager@company.com\nSubject: Project Deadline\n' in prompt['messages'][1]['content']
+
+
+def test_tone_follows_preferences():
+    prefs = {'casual': SimpleNamespace(preferred_tone='Casual')}
+    builder = PromptBuilder(preferences=prefs.get)
+    assert builder.build('Hi', 'Lunch?', user_id='casual')['tone'] == 'Casual'
+    assert builder.build('Hi', 'Lunch?', user_id='someone')['tone'] == 'Professional'
+
+
+def test_mixed_scripts_stay_within_budget():
+    # ASCII headers are cheap per character, the Japanese body is not; the
+    # joined prompt must still be charged in full
+    body = '締め切りは金曜日です。よろしくお願いします。' * 400
+    for budget in (300, 1500):
+        builder = PromptBuilder(max_input_tokens=budget)
+        prompt = builder.build('subject ' * 2000, body, 'sender' * 5000 + '@example.com')
+        system, user = (message['content'] for message in prompt['messages'])
+        assert prompt['tokens'] <= budget
+        assert estimate_tokens(system) + estimate_tokens(user) + 2 * MESSAGE_OVERHEAD_TOKENS <= prompt['tokens']
+
+
+def test_reported_tokens_bound_the_joined_prompt():
+    replies = [{'reply': 'Thanks, the report ships on Friday. ' * 20}, {'reply': '了解しました。金曜日に送ります。' * 10}]
+    threads = [{'sender': 'b@example.com', 'body': 'Any news on the report? ' * 30},
+               {'sender': 'c@example.com', 'body': '報告書はいつですか?' * 30}]
+    builder = PromptBuilder(
+        max_input_tokens=1000,
+        threads=lambda subject, exclude_id=None, limit=5: threads[:limit],
+        examples=lambda n: replies[:n]
+    )
+    prompt = builder.build('Report ' * 50, 'When does the report ship? 報告書 ' * 10, 'a@example.com')
+    system, user = (message['content'] for message in prompt['messages'])
+    assert prompt['sections']['thread_messages'] and prompt['sections']['examples']
+    assert estimate_tokens(system) + estimate_tokens(user) + 2 * MESSAGE_OVERHEAD_TOKENS <= prompt['tokens'] <= 1000
+
+
+def test_estimate_is_subadditive_across_newlines():
+    pieces = ['plain ascii words here', '日本語のテキスト', 'x' * 37, 'mixed ascii と日本語']
+    for first in pieces:
+        for second in pieces:
+            joined = estimate_tokens(first + '\n' + second)
+            assert joined <= estimate_tokens(first) + estimate_tokens(second) + LINE_SEPARATOR_TOKENS
@@ -0,0 +1,85 @@
+"""
+Rules Tests
+Version swap on reload and rejection of invalid rules files
+"""
+
+import json
+import os
+
+import pytest
+
+from classifier import EmailClassifier
+from rules import CompiledRuleSet, RuleStore
+
+RULES = {
+    'version': 'v1',
+    'categories': {
+        'Important': {'keywords': ['deadline'], 'senders': ['manager']},
+        'Promotional': {'keywords': ['sale'], 'senders': []}
+    }
+}
+
+
+def _write(path, rules, mtime=None):
+    path.write_text(json.dumps(rules), encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+def test_reload_swaps_in_a_changed_file(tmp_path):
+    path = tmp_path / 'rules.json'
+    _write(path, RULES, mtime=1_000_000_000)
+    store = RuleStore(str(path))
+    assert store.current.version == 'v1'
+    assert not store.reload()
+
+    _write(path, dict(RULES, version='v2'), mtime=2_000_000_000)
+    assert store.reload()
+    assert store.current.version == 'v2'
+    assert not store.reload()
+
+
+def test_unchanged_mtime_and_size_is_not_reloaded(tmp_path):
+    path = tmp_path / 'rules.json'
+    _write(path, RULES, mtime=1_000_000_000)
+    store = RuleStore(str(path))
+    _write(path, dict(RULES, version='v9'), mtime=1_000_000_000)
+    assert not store.reload()
+    assert store.reload(force=True)
+    assert store.current.version == 'v9'
+
+
+@pytest.mark.parametrize('change', [
+    {'keyword_weight': 'x'},
+    {'sender_weight': None},
+    {'default_confidence': 'high'},
+    {'categories': {'Important': {'keywords': ['']}}},
+    {'categories': {'Important': {'keywords': ['   ']}}},
+    {'categories': {'Important': {'senders': [3]}}},
+    {'categories': {'Important': {'keywords': 'deadline'}}},
+    {'categories': {}},
+])
+def test_invalid_file_keeps_the_live_ruleset(tmp_path, change):
+    path = tmp_path / 'rules.json'
+    _write(path, RULES, mtime=1_000_000_000)
+    store = RuleStore(str(path))
+
+    with pytest.raises(ValueError):
+        CompiledRuleSet(dict(RULES, **change))
+    _write(path, dict(RULES, version='bad', **change), mtime=2_000_000_000)
+    assert not store.reload()
+    assert store.current.version == 'v1'
+
+
+def test_classifier_uses_the_reloaded_version(tmp_path):
+    path = tmp_path / 'rules.json'
+    _write(path, RULES, mtime=1_000_000_000)
+    classifier = EmailClassifier(rules_path=str(path), sender_fast_path=False)
+    assert classifier.classify('Big sale', 'Everything', learn=False)['category'] == 'Promotional'
+
+    moved = {'version': 'v2', 'categories': {'Important': {'keywords': ['sale']}}}
+    _write(path, moved, mtime=2_000_000_000)
+    classifier.rules.reload()
+    result = classifier.classify('Big sale', 'Everything', learn=False)
+    assert result['category'] == 'Important'
+    assert result['rule_version'] == 'v2'
@@ -0,0 +1,48 @@
+"""
+Batch Save Tests
+Idempotency keys in Database.save_actions and POST /save/batch
+"""
+
+import json
+
+from db import Database
+
+
+def test_repeated_key_in_one_batch_resolves_to_the_first_action():
+    db = Database()
+    results = db.save_actions([
+        {'email_id': 'e1', 'action': 'sent', 'idempotency_key': 'k1'},
+        {'email_id': 'e1', 'action': 'sent', 'idempotency_key': 'k1'},
+        {'email_id': 'e2', 'action': 'archived'}
+    ])
+    assert [result['status'] for result in results] == ['created', 'duplicate', 'created']
+    assert results[1]['id'] == results[0]['id']
+    assert len(db.actions) == 2
+
+
+def test_retried_batch_creates_nothing():
+    db = Database()
+    batch = [{'email_id': f"e{n}", 'action': 'sent', 'idempotency_key': f"k{n}"} for n in range(5)]
+    first = db.save_actions(batch)
+    again = db.save_actions(batch)
+    assert [result['status'] for result in again] == ['duplicate'] * 5
+    assert [result['id'] for result in again] == [result['id'] for result in first]
+    assert len(db.actions) == 5
+    assert db.statistics['actions_saved'] == 5
+
+
+def test_invalid_items_do_not_block_valid_ones():
+    db = Database()
+    results = db.save_actions([{'action': 'sent'}, {'email_id': 'e1', 'idempotency_key': 'k1'}, 'oops'])
+    assert [result['status'] for result in results] == ['invalid', 'created', 'invalid']
+    assert len(db.actions) == 1
+
+
+def test_save_batch_endpoint_accepts_ndjson_and_is_idempotent(client):
+    body = '\n'.join(json.dumps({'email_id': f"e{n}", 'action': 'sent', 'idempotency_key': f"k{n}"})
+                     for n in range(3))
+
+    first = client.post('/save/batch', data=body, content_type='application/x-ndjson')
+    again = client.post('/save/batch', data=body, content_type='application/x-ndjson')
+    assert json.loads(first.get_data())['counts'] == {'created': 3, 'duplicate': 0, 'invalid': 0}
+    assert json.loads(again.get_data())['counts'] == {'created': 0, 'duplicate': 3, 'invalid': 0}
@@ -0,0 +1,102 @@
+"""
+Sender History Tests
+Sender trie lookups and how the classifier learns from its own results
+"""
+
+import threading
+
+from classifier import EmailClassifier
+from senders import SenderTrie
+
+
+def _trie():
+    return SenderTrie(min_support=10, min_share=0.9)
+
+
+def test_one_sender_does_not_speak_for_its_domain():
+    trie = _trie()
+    for _ in range(50):
+        trie.learn('deals@shop.com', 'Promotional')
+    assert trie.lookup('deals@shop.com') == ('Promotional', 1.0, 3)
+    assert trie.lookup('support@shop.com') is None
+
+    for _ in range(10):
+        trie.learn('offers@shop.com', 'Promotional')
+    assert trie.lookup('support@shop.com') == ('Promotional', 1.0, 2)
+
+
+def test_mixed_sender_does_not_inherit_its_domains_verdict():
+    trie = _trie()
+    for local in ('a', 'b', 'c'):
+        for _ in range(50):
+            trie.learn(f"{local}@shop.com", 'Promotional')
+    for category in ('Important', 'Promotional') * 10:
+        trie.learn('mixed@shop.com', category)
+    assert trie.lookup('mixed@shop.com') is None
+    assert trie.lookup('new@shop.com')[0] == 'Promotional'
+
+
+def test_consistent_sender_at_a_mixed_domain_keeps_its_own_verdict():
+    trie = _trie()
+    for _ in range(20):
+        trie.learn('boss@company.com', 'Important')
+        trie.learn('news@company.com', 'Promotional')
+    assert trie.lookup('boss@company.com') == ('Important', 1.0, 3)
+    assert trie.lookup('someone@company.com') is None
+
+
+def test_reclassifying_the_same_email_is_learned_once():
+    classifier = EmailClassifier(sender_min_support=5, sender_sample_rate=0)
+    for _ in range(20):
+        classifier.classify('Flash sale', 'Limited time offer, 50% discount.', 'deals@shop.com')
+    assert classifier.senders.lookup('deals@shop.com') is None
+    assert classifier._fast_path_counts['hits'] == 0
+
+
+def test_unlearned_classification_leaves_the_history_alone():
+    classifier = EmailClassifier(sender_min_support=1, sender_sample_rate=0)
+    for n in range(10):
+        classifier.classify(f"Flash sale {n}", 'Limited time offer, 50% discount.', 'deals@shop.com', learn=False)
+    assert classifier.senders.senders == 0
+
+    for n in range(10):
+        classifier.classify(f"Flash sale {n}", 'Limited time offer, 50% discount.', 'deals@shop.com')
+    assert classifier.senders.lookup('deals@shop.com')[0] == 'Promotional'
+
+
+def test_lookups_run_safely_alongside_learning():
+    trie = SenderTrie(min_support=1, min_share=0.0)
+    errors = []
+
+    def learn():
+        for n in range(3000):
+            trie.learn(f"user{n % 7}@shop.com", f"category{n % 1000}")
+
+    def look():
+        try:
+            for _ in range(1000):
+                trie.lookup('user1@shop.com')
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=learn)] + [threading.Thread(target=look) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def test_concurrent_classifications_learn_each_email_once():
+    classifier = EmailClassifier(sender_min_support=1000, sender_sample_rate=0)
+
+    def classify():
+        for n in range(200):
+            classifier.classify(f"Flash sale {n}", 'Limited time offer, 50% discount.', 'deals@shop.com')
+
+    threads = [threading.Thread(target=classify) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert classifier.senders._root.children['com'].total == 200
@@ -0,0 +1,71 @@
+"""
+Shadow Tests
+Fast-path live answers and shutting the worker down
+"""
+
+import time
+
+from shadow import ShadowEvaluator
+
+FAST = {'category': 'Promotional', 'confidence': 0.95, 'fast_path': True}
+SCANNED = {'category': 'Important', 'confidence': 0.8, 'fast_path': False}
+
+
+def _candidate(subject, body, sender=None):
+    return {'category': 'Important', 'confidence': 0.7}
+
+
+def _wait_for(shadow, settled):
+    deadline = time.monotonic() + 2
+    while not settled(shadow.stats()['counts']) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_fast_path_answers_are_rescanned_by_content():
+    scans = []
+
+    def baseline(subject, body, sender=None):
+        scans.append(subject)
+        return SCANNED
+
+    shadow = ShadowEvaluator(_candidate, sample_rate=1.0, baseline=baseline)
+    try:
+        assert shadow.submit('Deadline', 'Please review.', 'deals@shop.com', FAST, 0.0001)
+        _wait_for(shadow, lambda counts: counts['evaluated'])
+        stats = shadow.stats()
+        assert scans == ['Deadline']
+        assert stats['counts']['rescanned'] == 1
+        assert stats['agreement_rate'] == 1.0
+        assert stats['confusion'] == {'Important': {'Important': 1}}
+    finally:
+        shadow.stop()
+
+
+def test_fast_path_answers_are_excluded_without_baseline():
+    shadow = ShadowEvaluator(_candidate, sample_rate=1.0)
+    try:
+        shadow.submit('Deadline', 'Please review.', 'deals@shop.com', FAST, 0.0001)
+        shadow.submit('Deadline', 'Please review.', None, SCANNED, 0.001)
+        _wait_for(shadow, lambda counts: counts['excluded'] + counts['evaluated'] == 2)
+        counts = shadow.stats()['counts']
+        assert counts['excluded'] == 1
+        assert counts['evaluated'] == 1
+    finally:
+        shadow.stop()
+
+
+def test_stop_does_not_block_on_a_full_queue():
+    shadow = ShadowEvaluator(_candidate, sample_rate=1.0, max_queued=1)
+    shadow._queue.put_nowait(('s', 'b', None, SCANNED, 0.0))
+    started = time.monotonic()
+    shadow.stop()
+    assert time.monotonic() - started < 0.5
+
+
+def test_stop_ends_the_worker():
+    shadow = ShadowEvaluator(_candidate, sample_rate=1.0)
+    shadow.submit('Hi', 'Lunch?', None, SCANNED, 0.001)
+    worker = shadow._worker
+    shadow.stop()
+    worker.join(timeout=2)
+    assert not worker.is_alive()
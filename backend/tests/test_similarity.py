@@ -0,0 +1,66 @@
+"""
+Similarity Tests
+Background index builds, queries on unindexed emails and the token cache bound
+"""
+
+from collections import Counter
+
+import numpy as np
+
+from mailstore import EmailStore
+from similarity import HashingEmbedder, SimilarityIndex
+
+
+def _store(count=60):
+    store = EmailStore()
+    store.extend([
+        {'id': f"inv_{n}", 'sender': 'billing@vendor.com', 'subject': f"Invoice {n} for cloud hosting",
+         'body': 'Your invoice for cloud hosting services is attached. Payment due in 30 days.',
+         'timestamp': f"2026-01-{n % 28 + 1:02d}T09:00:00"}
+        if n % 2 else
+        {'id': f"team_{n}", 'sender': 'lead@company.com', 'subject': f"Sprint planning {n}",
+         'body': 'Agenda for sprint planning: backlog grooming, estimates and retro actions.',
+         'timestamp': f"2026-01-{n % 28 + 1:02d}T10:00:00"}
+        for n in range(count)
+    ])
+    return store
+
+
+def test_background_build_indexes_every_email():
+    index = SimilarityIndex(_store())
+    index.start_build()
+    index._builder.join(timeout=10)
+    assert len(index.index) == 60
+    assert not index.building()
+
+
+def test_query_before_the_build_embeds_the_email():
+    index = SimilarityIndex(_store())
+    # Answered at once from whatever is indexed so far
+    hits = index.similar('inv_1', k=5)
+    assert all(email_id.startswith('inv_') for email_id, _ in hits)
+    index._builder.join(timeout=10)
+    hits = index.similar('inv_1', k=5)
+    assert len(hits) == 5 and all(email_id.startswith('inv_') for email_id, _ in hits)
+
+
+def test_build_is_incremental_and_batched():
+    store = _store()
+    index = SimilarityIndex(store)
+    assert index.build(batch_size=7) == 60
+    assert index.build() == 0
+    assert index.embedder.documents == 60
+
+
+def test_token_cache_stays_within_its_bound_and_embeddings_do_not_change():
+    counts = [Counter({f"token{n}_{i}": 1 + i % 3 for i in range(50)}) for n in range(20)]
+    unbounded = HashingEmbedder()
+    bounded = HashingEmbedder(cache_bytes=10000)
+    for document in counts:
+        unbounded.observe(document)
+        bounded.observe(document)
+
+    assert bounded.cache_used <= 10000
+    assert unbounded.cache_used > 10000
+    for document in counts:
+        assert np.array_equal(bounded.embed(document), unbounded.embed(document))
@@ -1,55 +1,249 @@
 // frontend/app.js
-const API = "http://localhost:8000";
+const API = "http://localhost:5000";
 
-async function syncEmails() {
-  const res = await fetch(`${API}/sync_emails`, { method: 'POST' });
-  const data = await res.json();
-  alert(`Synced ${data.synced} emails`);
-  loadEmails();
-}
-
-async function loadEmails() {
-  const res = await fetch(`${API}/emails`);
-  const emails = await res.json();
-  const container = document.getElementById("emails");
-  container.innerHTML = "";
-  emails.forEach(e=>{
-    const el = document.createElement("div");
-    el.className = "email";
-    el.innerHTML = `
-      <strong>${e.subject}</strong> <small>from: ${e.sender}</small><br/>
-      <em>class: ${e.classification}</em>
-      <p>${e.snippet || ''}</p>
-      <div id="draft-${e.message_id}">
-        ${e.draft ? `<pre>${e.draft}</pre><button onclick="sendDraft('${e.message_id}')">Send</button>` : `<button onclick="generateDraft('${e.message_id}')">Generate Draft</button>`}
-      </div>
-    `;
-    container.appendChild(el);
+// Virtual list: only rows in (or near) the viewport exist in the DOM
+const ROW_HEIGHT = 64;
+const OVERSCAN = 8;
+const PAGE_SIZE = 100;
+
+const state = {
+  order: [],            // email ids, newest first (loaded prefix of the inbox)
+  emails: new Map(),    // id -> email
+  rows: new Map(),      // id -> rendered row element
+  total: 0,
+  seq: 0,               // last change feed sequence applied
+  selected: null,
+  loading: false,
+  feed: null,
+  renderQueued: false
+};
+
+const list = document.getElementById("emails");
+const spacer = document.getElementById("spacer");
+
+// ------------------------------------------------------------------
+// Loading
+// ------------------------------------------------------------------
+
+async function loadPage(offset) {
+  if (state.loading) return;
+  state.loading = true;
+  try {
+    const res = await fetch(`${API}/emails?offset=${offset}&limit=${PAGE_SIZE}`);
+    const data = await res.json();
+    if (offset === 0) {
+      state.seq = data.seq;
+    }
+    state.total = data.total;
+    data.emails.forEach(e => {
+      if (!state.emails.has(e.id)) {
+        state.order.push(e.id);
+      }
+      state.emails.set(e.id, e);
+    });
+  } finally {
+    state.loading = false;
+  }
+  scheduleRender();
+}
+
+async function reload() {
+  state.order = [];
+  state.emails.clear();
+  state.rows.forEach(node => node.remove());
+  state.rows.clear();
+  await loadPage(0);
+  connectFeed();
+}
+
+// ------------------------------------------------------------------
+// Change feed: apply only what changed
+// ------------------------------------------------------------------
+
+function connectFeed() {
+  if (state.feed) state.feed.close();
+
+  if (!window.EventSource) {
+    pollChanges();
+    return;
+  }
+
+  // The browser resumes from the last event id on reconnect
+  state.feed = new EventSource(`${API}/emails/changes?since=${state.seq}`);
+  state.feed.addEventListener("change", ev => applyChange(JSON.parse(ev.data)));
+  state.feed.addEventListener("reset", () => reload());
+}
+
+async function pollChanges() {
+  while (!window.EventSource) {
+    try {
+      const res = await fetch(`${API}/emails/changes?since=${state.seq}&timeout=25`);
+      const data = await res.json();
+      if (data.reset) {
+        // Drop the stale rows; reload() starts a fresh poll loop
+        await reload();
+        return;
+      }
+      data.changes.forEach(applyChange);
+      state.seq = data.seq;
+    } catch (err) {
+      await new Promise(resolve => setTimeout(resolve, 5000));
+    }
+  }
+}
+
+function applyChange(change) {
+  if (change.seq <= state.seq) return;
+  state.seq = change.seq;
+
+  if (change.op === "removed") {
+    const index = state.order.indexOf(change.id);
+    if (index !== -1) state.order.splice(index, 1);
+    if (state.emails.delete(change.id)) state.total -= 1;
+    const node = state.rows.get(change.id);
+    if (node) {
+      node.remove();
+      state.rows.delete(change.id);
+    }
+    if (state.selected === change.id) showDetail(null);
+    scheduleRender();
+    return;
+  }
+
+  const known = state.emails.has(change.id);
+  state.emails.set(change.id, change.email);
+  if (!known && change.op === "added") {
+    state.order.unshift(change.id);
+    state.total += 1;
+    scheduleRender();
+  } else if (state.rows.has(change.id)) {
+    fillRow(state.rows.get(change.id), change.email);
+  }
+  if (state.selected === change.id) showDetail(change.id);
+}
+
+// ------------------------------------------------------------------
+// Rendering
+// ------------------------------------------------------------------
+
+function scheduleRender() {
+  if (state.renderQueued) return;
+  state.renderQueued = true;
+  requestAnimationFrame(() => {
+    state.renderQueued = false;
+    render();
+  });
+}
+
+function render() {
+  spacer.style.height = `${state.total * ROW_HEIGHT}px`;
+
+  const first = Math.max(0, Math.floor(list.scrollTop / ROW_HEIGHT) - OVERSCAN);
+  const last = Math.min(state.total, Math.ceil((list.scrollTop + list.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+
+  if (last > state.order.length && state.order.length < state.total) {
+    loadPage(state.order.length);
+  }
+
+  const visible = new Set();
+  for (let index = first; index < Math.min(last, state.order.length); index++) {
+    const id = state.order[index];
+    visible.add(id);
+    let node = state.rows.get(id);
+    if (!node) {
+      node = createRow(id);
+      fillRow(node, state.emails.get(id));
+      state.rows.set(id, node);
+      list.appendChild(node);
+    }
+    node.style.top = `${index * ROW_HEIGHT}px`;
+  }
+
+  state.rows.forEach((node, id) => {
+    if (!visible.has(id)) {
+      node.remove();
+      state.rows.delete(id);
+    }
   });
 }
 
-async function generateDraft(message_id) {
-  const tone = "professional";
-  const res = await fetch(`${API}/draft`, {
+function createRow(id) {
+  const node = document.createElement("div");
+  node.className = "email";
+  node.style.height = `${ROW_HEIGHT - 8}px`;
+  node.addEventListener("click", () => showDetail(id));
+
+  const subject = document.createElement("strong");
+  const sender = document.createElement("small");
+  const category = document.createElement("em");
+  node.append(subject, " ", sender, document.createElement("br"), category);
+  return node;
+}
+
+function fillRow(node, e) {
+  const [subject, , sender, , category] = node.childNodes;
+  subject.textContent = e.subject;
+  sender.textContent = `from: ${e.sender}`;
+  category.textContent = `class: ${e.classification || "unclassified"}`;
+  node.classList.toggle("unread", e.unread);
+  node.classList.toggle("selected", state.selected === e.id);
+}
+
+function showDetail(id) {
+  const previous = state.rows.get(state.selected);
+  state.selected = id;
+  if (previous) previous.classList.remove("selected");
+  if (state.rows.has(id)) state.rows.get(id).classList.add("selected");
+
+  const detail = document.getElementById("detail");
+  const e = id && state.emails.get(id);
+  detail.hidden = !e;
+  if (!e) return;
+
+  document.getElementById("detail-subject").textContent = e.subject;
+  document.getElementById("detail-sender").textContent = `from: ${e.sender}`;
+  document.getElementById("detail-body").textContent = e.body;
+}
+
+// ------------------------------------------------------------------
+// Drafts
+// ------------------------------------------------------------------
+
+async function generateDraft() {
+  const e = state.emails.get(state.selected);
+  if (!e) return;
+
+  const res = await fetch(`${API}/generate_reply`, {
     method: 'POST',
     headers: {'Content-Type':'application/json'},
-    body: JSON.stringify({message_id, tone, extra_instructions: ""})
+    body: JSON.stringify({subject: e.subject, body: e.body, sender: e.sender})
   });
   const data = await res.json();
-  document.getElementById(`draft-${message_id}`).innerHTML = `<pre>${data.draft}</pre><button onclick="sendDraft('${message_id}')">Send</button>`;
+  document.getElementById("draft").value = data.success ? data.reply.reply_body : data.error;
 }
 
-async function sendDraft(message_id) {
-  const draftText = document.querySelector(`#draft-${message_id} pre`).innerText;
-  const res = await fetch(`${API}/send`, {
+async function sendDraft() {
+  const e = state.emails.get(state.selected);
+  if (!e) return;
+
+  // The row is updated through the change feed, not by reloading the list
+  await fetch(`${API}/save`, {
     method: 'POST',
     headers: {'Content-Type':'application/json'},
-    body: JSON.stringify({message_id, draft_text: draftText})
+    body: JSON.stringify({
+      email_id: e.id,
+      classification: e.classification,
+      reply: document.getElementById("draft").value,
+      action: 'sent',
+      idempotency_key: `sent:${e.id}`
+    })
   });
-  const j = await res.json();
-  alert('Sent (simulated) ' + message_id);
-  loadEmails();
+  alert('Sent (simulated) ' + e.id);
 }
 
-document.getElementById("syncBtn").addEventListener("click", syncEmails);
-window.onload = loadEmails;
+list.addEventListener("scroll", scheduleRender);
+window.addEventListener("resize", scheduleRender);
+document.getElementById("syncBtn").addEventListener("click", connectFeed);
+document.getElementById("generateBtn").addEventListener("click", generateDraft);
+document.getElementById("sendBtn").addEventListener("click", sendDraft);
+window.onload = reload;